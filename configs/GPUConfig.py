@@ -55,6 +55,10 @@ def addGPUOptions(parser):
     parser.add_option("--dev-numa-high-bit", type="int", default=0, help="High order address bit to use for device NUMA mapping.")
     parser.add_option("--num-dev-dirs", default=1, help="In split hierarchies, number of device directories", type="int")
     parser.add_option("--gpu-mem-size", default='1GB', help="In split hierarchies, amount of GPU memory")
+    parser.add_option("--managed-migration-size", default='4kB', help="In split hierarchies, granularity of managed memory migrations")
+    parser.add_option("--managed-memory-limit", default='0B', help="In split hierarchies, GPU memory available to managed data (0 => all free GPU memory)")
+    parser.add_option("--gpu-page-placement", type="choice", default="linear", choices=["linear", "interleave", "first_touch"], help="In split hierarchies, policy to place device pages across device directories")
+    parser.add_option("--gpu-device-translation", type="choice", default="pagetable", choices=["pagetable", "segment", "identity"], help="In split hierarchies, translate device memory accesses through the TLBs and page table, or with a base/limit segment check (segment and identity require linear page placement)")
     parser.add_option("--gpu_mem_ctl_latency", type="int", default=-1, help="GPU memory controller latency in cycles")
     parser.add_option("--gpu_mem_freq", type="string", default=None, help="GPU memory controller frequency")
     parser.add_option("--gpu_membus_busy_cycles", type="int", default=-1, help="GPU memory bus busy cycles per data transfer")
@@ -66,8 +70,25 @@ def addGPUOptions(parser):
     parser.add_option("--gpu-l2-resource-stalls", action="store_true", default=False)
     parser.add_option("--gpu_tlb_entries", type="int", default=0, help="Number of entries in GPU TLB. 0 implies infinite")
     parser.add_option("--gpu_tlb_assoc", type="int", default=0, help="Associativity of the L1 TLB. 0 implies infinite")
+    parser.add_option("--gpu_tlb_replacement", default="lru", help="Replacement policy of the L1 TLB (lru, tree_plru, random or srrip)")
     parser.add_option("--pwc_size", default="8kB", help="Capacity of the page walk cache")
+    parser.add_option("--gpu-walk-slots", type="int", default=32, help="Maximum number of concurrent GPU page walks")
+    parser.add_option("--gpu-walk-scheduler", default="fifo", help="Order to start GPU page walks waiting for a walk slot (fifo or batch)")
+    parser.add_option("--gpu-fault-batch-size", type="int", default=8, help="Maximum GPU page faults raised to the CPU in one batch (1 => no batching)")
+    parser.add_option("--gpu-fault-batch-timeout", type="int", default=0, help="GPU cycles to collect page faults into a batch after the first fault (0 => raise faults as soon as no batch is outstanding)")
+    parser.add_option("--gpu-shootdown-latency", type="int", default=100, help="GPU cycles to deliver a TLB shootdown from the CPU and invalidate the GPU TLBs")
+    parser.add_option("--gpu-cpu-shootdowns", action="store_true", default=False, help="The CPU TLBs deliver their invalidations to the GPU TLBs (required in full-system mode)")
+    parser.add_option("--gpu-cluster-tlb", action="store_true", default=False, help="Share one data TLB between the GPU cores in each cluster")
+    parser.add_option("--gpu-cluster-itb", action="store_true", default=False, help="Share one instruction TLB between the GPU cores in each cluster")
+    parser.add_option("--gpu-tlb-banks", type="int", default=1, help="Number of banks in each GPU data TLB, interleaved by page")
+    parser.add_option("--gpu-tlb-lookup-ports", type="int", default=0, help="Lookups each GPU data TLB bank can start per cycle. 0 implies unlimited")
+    parser.add_option("--gpu-utlb-entries", type="int", default=0, help="Number of entries in the micro-TLB in front of each GPU core's data TLB. 0 implies no micro-TLB")
+    parser.add_option("--gpu-lsq-tlb-ports", type="int", default=0, help="Data TLB lookups each GPU core's LSQ can start per cycle. 0 implies unlimited")
+    parser.add_option("--gpu-tlb-mshrs", type="int", default=0, help="Number of outstanding misses in each GPU L1 TLB. 0 implies unlimited")
+    parser.add_option("--gpu-replayable-faults", action="store_true", default=False, help="GPU memory accesses that page fault release their LSQ resources and replay once the fault is handled")
+    parser.add_option("--gpu-pwc-entries", default="0,0,0", help="Entries in the ShaderMMU page walk cache for the PML4, PDP and PD levels (e.g. 4,16,64). Only used by the native page walks of x86 full-system mode; 0 leaves a level uncached")
     parser.add_option("--ce_buffering", type="int", default=128, help="Maximum cache lines buffered in the GPU CE. 0 implies infinite")
+    parser.add_option("--skip-idle-core-cycles", action="store_true", default=False, help="Skip simulating GPU core, interconnect, L2 and DRAM cycles in which they have no work (requires building with GPGPU_SIM_CYCLE_SKIP)")
 
 def configureMemorySpaces(options):
     total_mem_range = AddrRange(options.total_mem_size)
@@ -159,6 +180,7 @@ def parseGpgpusimConfig(options):
         gpgpu_n_cores_per_cluster = int(config[start:end])
         num_sc = gpgpu_n_clusters * gpgpu_n_cores_per_cluster
         options.num_sc = num_sc
+        options.cores_per_cluster = gpgpu_n_cores_per_cluster
         start = config.find("-gpgpu_clock_domains ") + len("-gpgpu_clock_domains ")
         end = config.find(':', start)
         options.gpu_core_clock = config[start:end] + "MHz"
@@ -196,6 +218,14 @@ def createGPU(options, gpu_mem_range):
     # the GPU clock frequency dynamically.
     gpu = CudaGPU(warp_size = options.gpu_warp_size,
                   manage_gpu_memory = options.split,
+                  managed_migration_size = options.managed_migration_size,
+                  managed_memory_limit = options.managed_memory_limit,
+                  num_dev_dirs = max(options.num_dev_dirs, 1),
+                  dev_numa_high_bit = options.dev_numa_high_bit or \
+                                      options.numa_high_bit,
+                  page_placement = options.gpu_page_placement,
+                  device_translation = options.gpu_device_translation,
+                  skip_idle_core_cycles = options.skip_idle_core_cycles,
                   clk_domain = SrcClockDomain(clock = options.gpu_core_clock,
                                               voltage_domain = VoltageDomain()),
                   gpu_memory_range = gpu_mem_range)
@@ -216,6 +246,19 @@ def createGPU(options, gpu_mem_range):
     gpu.shader_cores = [CudaCore(id = i, warp_contexts = warps_per_core)
                             for i in xrange(options.num_sc)]
 
+    # The cores in each cluster can share one data TLB and one instruction
+    # TLB. The shared TLBs are children of the GPU, and the cores reference
+    # the TLB for their cluster (core i is in cluster i / cores_per_cluster)
+    num_clusters = options.num_sc / options.cores_per_cluster
+    if options.gpu_cluster_tlb:
+        gpu.cluster_data_tlbs = [ShaderTLB(shared = True)
+                                 for i in xrange(num_clusters)]
+    if options.gpu_cluster_itb:
+        gpu.cluster_itbs = [ShaderTLB(shared = True)
+                            for i in xrange(num_clusters)]
+        for i, sc in enumerate(gpu.shader_cores):
+            sc.itb = gpu.cluster_itbs[i / options.cores_per_cluster]
+
     gpu.ce = GPUCopyEngine(driver_delay = 5000000,
                            buffering = options.ce_buffering)
 
@@ -231,9 +274,19 @@ def createGPU(options, gpu_mem_range):
         if options.gpu_core_config == 'Maxwell':
             atoms_per_cache_subline = 32
 
-    for sc in gpu.shader_cores:
+    for i, sc in enumerate(gpu.shader_cores):
         sc.lsq = ShaderLSQ()
+        if options.gpu_cluster_tlb:
+            sc.lsq.data_tlb = \
+                gpu.cluster_data_tlbs[i / options.cores_per_cluster]
         sc.lsq.data_tlb.entries = options.gpu_tlb_entries
+        sc.lsq.data_tlb.replacement_policy = options.gpu_tlb_replacement
+        sc.lsq.data_tlb.replayable_faults = options.gpu_replayable_faults
+        sc.lsq.data_tlb.mshrs = options.gpu_tlb_mshrs
+        sc.lsq.data_tlb.banks = options.gpu_tlb_banks
+        sc.lsq.data_tlb.lookup_ports = options.gpu_tlb_lookup_ports
+        sc.lsq.utlb_entries = options.gpu_utlb_entries
+        sc.lsq.tlb_lookup_ports = options.gpu_lsq_tlb_ports
         sc.lsq.forward_flush = (buildEnv['PROTOCOL'] == 'VI_hammer_fusion' \
                                 and options.flush_kernel_end)
         sc.lsq.warp_size = options.gpu_warp_size
@@ -288,7 +341,14 @@ def connectGPUPorts(gpu, ruby, options):
     # Initialize the MMU, connecting it to either the pagewalk cache port for
     # unified address space, or the copy engine's host-side sequencer port for
     # split address space architectures.
-    gpu.shader_mmu.setUpPagewalkers(32,
+    gpu.shader_mmu.walk_scheduler = options.gpu_walk_scheduler
+    gpu.shader_mmu.fault_batch_size = options.gpu_fault_batch_size
+    gpu.shader_mmu.fault_batch_timeout = options.gpu_fault_batch_timeout
+    gpu.shader_mmu.shootdown_latency = options.gpu_shootdown_latency
+    gpu.shader_mmu.cpu_shootdowns = options.gpu_cpu_shootdowns
+    gpu.shader_mmu.pwc_entries = \
+        [int(n) for n in options.gpu_pwc_entries.split(',')]
+    gpu.shader_mmu.setUpPagewalkers(options.gpu_walk_slots,
                     ruby._cpu_ports[options.num_cpus+options.num_sc].slave,
                     options.gpu_tlb_bypass_l1)
 
@@ -215,6 +215,10 @@ def create_system(options, full_system, system, dma_devices, ruby_system):
     gpu_phys_mem_size = system.gpu.gpu_memory_range.size()
 
     if options.num_dev_dirs > 0:
+        # The device directories may be interleaved differently than the
+        # CPU directories
+        dev_numa_high_bit = options.dev_numa_high_bit or \
+                            options.numa_high_bit
         mem_module_size = gpu_phys_mem_size / options.num_dev_dirs
 
         #
@@ -226,11 +230,11 @@ def create_system(options, full_system, system, dma_devices, ruby_system):
         pf_size.value = pf_size.value * 2
         dir_bits = int(math.log(options.num_dev_dirs, 2))
         pf_bits = int(math.log(pf_size.value, 2))
-        if options.numa_high_bit:
+        if dev_numa_high_bit:
             if options.pf_on or options.dir_on:
                 # if numa high bit explicitly set, make sure it does not overlap
                 # with the probe filter index
-                assert(options.numa_high_bit - dir_bits > pf_bits)
+                assert(dev_numa_high_bit - dir_bits > pf_bits)
 
             # set the probe filter start bit to just above the block offset
             pf_start_bit = block_size_bits
@@ -262,7 +266,7 @@ def create_system(options, full_system, system, dma_devices, ruby_system):
                                             version = dir_version,
                                             size = dir_size,
                                             numa_high_bit = \
-                                            options.numa_high_bit,
+                                            dev_numa_high_bit,
                                             device_directory = True),
                                  probeFilter = pf,
                                  probe_filter_enabled = options.pf_on,
@@ -157,6 +157,7 @@
 #include "cuda-sim/ptx_parser.h"
 #include "debug/GPUSyscalls.hh"
 #include "gpu/gpgpu-sim/cuda_gpu.hh"
+#include "sim/full_system.hh"
 #include "gpgpusim_entrypoint.h"
 #include "gpgpu-sim/gpu-sim.h"
 #include "stream_manager.h"
@@ -296,7 +297,8 @@ cudaMalloc(ThreadContext *tc, gpusyscall_t *call_params)
         helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
         return;
     } else {
-        Addr addr = cudaGPU->allocateGPUMemory(sim_size);
+        // Application data may be placed when it is first accessed
+        Addr addr = cudaGPU->allocateGPUMemory(sim_size, true);
         helper.writeBlob(sim_devPtr, (uint8_t*)(&addr), sizeof(Addr), true);
         if (addr) {
             g_last_cudaError = cudaSuccess;
@@ -307,6 +309,50 @@ cudaMalloc(ThreadContext *tc, gpusyscall_t *call_params)
     }
 }
 
+void
+cudaMallocManaged(ThreadContext *tc, gpusyscall_t *call_params)
+{
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_devPtr = *((Addr*)helper.getParam(0, true));
+    size_t sim_size = *((size_t*)helper.getParam(1));
+    unsigned int sim_flags = *((unsigned int*)helper.getParam(2));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaMallocManaged(devPtr = %x, size = %d, flags = %x)\n", sim_devPtr, sim_size, sim_flags);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    // Managed memory is always accessible from all streams
+    if (sim_flags != 0x1) {
+        warn_once("Ignoring cudaMallocManaged flags\n");
+    }
+
+    if (cudaGPU->isAccessingHostPagetable()) {
+        // The GPU can access any host memory, so tell CUDA runtime to
+        // allocate memory
+        g_last_cudaError = cudaSuccess;
+        cudaError_t to_return = cudaErrorApiFailureBase;
+        helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
+        return;
+    }
+    if (FullSystem) {
+        warn("Managed memory is unsupported in full-system mode without "
+             "access to the host pagetable\n");
+        g_last_cudaError = cudaErrorMemoryAllocation;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+        return;
+    }
+
+    Addr addr = cudaGPU->allocateManagedMemory(tc, sim_size);
+    helper.writeBlob(sim_devPtr, (uint8_t*)(&addr), sizeof(Addr), true);
+    if (addr) {
+        g_last_cudaError = cudaSuccess;
+    } else {
+        g_last_cudaError = cudaErrorMemoryAllocation;
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+}
+
 void
 cudaMallocHost(ThreadContext *tc, gpusyscall_t *call_params) {
     GPUSyscallHelper helper(tc, call_params);
@@ -338,6 +384,28 @@ cudaRegisterDeviceMemory(ThreadContext *tc, gpusyscall_t *call_params)
     cudaGPU->registerDeviceMemory(tc, sim_devicePtr, sim_size);
 }
 
+void
+cudaAdviseDevicePlacement(ThreadContext *tc, gpusyscall_t *call_params)
+{
+    // This GPU syscall hints that a range of device memory should be placed
+    // in the given device directory (e.g. near the cores that access it)
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_devPtr = *((Addr*)helper.getParam(0, true));
+    size_t sim_count = *((size_t*)helper.getParam(1));
+    unsigned int sim_directory = *((unsigned int*)helper.getParam(2));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaAdviseDevicePlacement(devPtr = %x, count = %d, directory = %d)\n", sim_devPtr, sim_count, sim_directory);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    if (cudaGPU->adviseDevicePlacement(sim_devPtr, sim_count, sim_directory)) {
+        g_last_cudaError = cudaSuccess;
+    } else {
+        g_last_cudaError = cudaErrorInvalidValue;
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+}
+
 void
 cudaMallocPitch(ThreadContext *tc, gpusyscall_t *call_params)
 {
@@ -360,15 +428,23 @@ cudaFree(ThreadContext *tc, gpusyscall_t *call_params) {
 
     CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
 
-    if (!cudaGPU->isManagingGPUMemory()) {
+    if (cudaGPU->freeManagedMemory(sim_devPtr)) {
+        // Managed memory was allocated by the simulator, not the runtime
+        g_last_cudaError = cudaSuccess;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else if (!cudaGPU->isManagingGPUMemory()) {
         g_last_cudaError = cudaSuccess;
         // Tell CUDA runtime to free memory
         cudaError_t to_return = cudaErrorApiFailureBase;
         helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
     } else {
-        // TODO: Tell SPA to free this memory
-        cudaError_t to_return = cudaSuccess;
-        helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
+        // Freeing NULL is a no-op
+        if (!sim_devPtr || cudaGPU->freeGPUMemory(sim_devPtr)) {
+            g_last_cudaError = cudaSuccess;
+        } else {
+            g_last_cudaError = cudaErrorInvalidDevicePointer;
+        }
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
     }
 }
 
@@ -381,6 +457,14 @@ cudaFreeHost(ThreadContext *tc, gpusyscall_t *call_params) {
     DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaFreeHost(ptr = %x)\n", sim_ptr);
 
     g_last_cudaError = cudaSuccess;
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    if (cudaGPU->freeMappedHostMemory(sim_ptr)) {
+        // Mapped memory was allocated by the simulator, not the runtime
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+        return;
+    }
+
     // Tell CUDA runtime to free memory
     cudaError_t to_return = cudaErrorApiFailureBase;
     helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
@@ -399,6 +483,47 @@ cudaFreeArray(ThreadContext *tc, gpusyscall_t *call_params) {
 *                                                                              *
 *******************************************************************************/
 
+// Push a memcpy stream operation. A segmented copy is described by its first
+// segment's addresses and its total length, and its descriptor is attached to
+// the operation so that the copy engine performs all of its segments
+static void
+push_memcpy_operation(ThreadContext *tc, Addr sim_dst, Addr sim_src,
+                      size_t sim_count, enum cudaMemcpyKind sim_kind,
+                      struct CUstream_st *stream,
+                      const CopyDescriptor *desc = NULL)
+{
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    if (sim_kind == cudaMemcpyHostToDevice) {
+        stream_operation mem_op((const void*)sim_src, (size_t)sim_dst, sim_count, stream);
+        mem_op.setThreadContext(tc);
+        cudaGPU->pushCopyOperation(mem_op, desc);
+    } else if (sim_kind == cudaMemcpyDeviceToHost) {
+        stream_operation mem_op((size_t)sim_src, (void*)sim_dst, sim_count, stream);
+        mem_op.setThreadContext(tc);
+        cudaGPU->pushCopyOperation(mem_op, desc);
+    } else if (sim_kind == cudaMemcpyDeviceToDevice) {
+        stream_operation mem_op((size_t)sim_src, (size_t)sim_dst, sim_count, stream);
+        mem_op.setThreadContext(tc);
+        cudaGPU->pushCopyOperation(mem_op, desc);
+    } else {
+        panic("GPGPU-Sim PTX: cudaMemcpy - ERROR : unsupported cudaMemcpyKind\n");
+    }
+}
+
+static void
+push_memcpy_2d_operation(ThreadContext *tc, Addr sim_dst, size_t sim_dpitch,
+                         Addr sim_src, size_t sim_spitch, size_t sim_width,
+                         size_t sim_height, enum cudaMemcpyKind sim_kind,
+                         struct CUstream_st *stream)
+{
+    CopyDescriptor desc;
+    desc.addPitched(sim_src, sim_spitch, 0, sim_dst, sim_dpitch, 0,
+                    sim_width, sim_height);
+    push_memcpy_operation(tc, sim_dst, sim_src, desc.totalLength, sim_kind,
+                          stream, desc.segments.size() > 1 ? &desc : NULL);
+}
+
 void
 cudaMemcpy(ThreadContext *tc, gpusyscall_t *call_params) {
     GPUSyscallHelper helper(tc, call_params);
@@ -421,23 +546,9 @@ cudaMemcpy(ThreadContext *tc, gpusyscall_t *call_params) {
         return;
     }
 
-    if (sim_kind == cudaMemcpyHostToDevice) {
-        stream_operation mem_op((const void*)sim_src, (size_t)sim_dst, sim_count, 0);
-        mem_op.setThreadContext(tc);
-        g_stream_manager->push(mem_op);
-    } else if (sim_kind == cudaMemcpyDeviceToHost) {
-        stream_operation mem_op((size_t)sim_src, (void*)sim_dst, sim_count, 0);
-        mem_op.setThreadContext(tc);
-        g_stream_manager->push(mem_op);
-    } else if (sim_kind == cudaMemcpyDeviceToDevice) {
-        stream_operation mem_op((size_t)sim_src, (size_t)sim_dst, sim_count, 0);
-        mem_op.setThreadContext(tc);
-        g_stream_manager->push(mem_op);
-    } else {
-        panic("GPGPU-Sim PTX: cudaMemcpy - ERROR : unsupported cudaMemcpyKind\n");
-    }
+    push_memcpy_operation(tc, sim_dst, sim_src, sim_count, sim_kind, NULL);
 
-    suspend = cudaGPU->needsToBlock();
+    suspend = cudaGPU->needsToBlock(tc);
     assert(suspend);
     g_last_cudaError = cudaSuccess;
     helper.setReturn((uint8_t*)&suspend, sizeof(bool));
@@ -464,7 +575,41 @@ cudaMemcpyArrayToArray(ThreadContext *tc, gpusyscall_t *call_params) {
 //__host__ cudaError_t CUDARTAPI cudaMemcpy2D(void *dst, size_t dpitch, const void *src, size_t spitch, size_t width, size_t height, enum cudaMemcpyKind kind) {
 void
 cudaMemcpy2D(ThreadContext *tc, gpusyscall_t *call_params) {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_dst = *((Addr*)helper.getParam(0, true));
+    size_t sim_dpitch = *((size_t*)helper.getParam(1));
+    Addr sim_src = *((Addr*)helper.getParam(2, true));
+    size_t sim_spitch = *((size_t*)helper.getParam(3));
+    size_t sim_width = *((size_t*)helper.getParam(4));
+    size_t sim_height = *((size_t*)helper.getParam(5));
+    enum cudaMemcpyKind sim_kind = *((enum cudaMemcpyKind*)helper.getParam(6));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaMemcpy2D(dst = %x, dpitch = %d, src = %x, spitch = %d, width = %d, height = %d, kind = %s)\n",
+            sim_dst, sim_dpitch, sim_src, sim_spitch, sim_width, sim_height,
+            cudaMemcpyKindStrings[sim_kind]);
+
+    // Like cudaMemset2D, errors are returned and a started copy blocks the
+    // calling thread until it completes
+    if (sim_width > sim_dpitch || sim_width > sim_spitch) {
+        g_last_cudaError = cudaErrorInvalidPitchValue;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else if (sim_width == 0 || sim_height == 0) {
+        g_last_cudaError = cudaSuccess;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else {
+        push_memcpy_2d_operation(tc, sim_dst, sim_dpitch, sim_src,
+                                 sim_spitch, sim_width, sim_height, sim_kind,
+                                 NULL);
+        g_last_cudaError = cudaSuccess;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+
+        bool suspend = cudaGPU->needsToBlock(tc);
+        assert(suspend);
+    }
 }
 
 //__host__ cudaError_t CUDARTAPI cudaMemcpy2DToArray(struct cudaArray *dst, size_t wOffset, size_t hOffset, const void *src, size_t spitch, size_t width, size_t height, enum cudaMemcpyKind kind) {
@@ -504,9 +649,9 @@ cudaMemcpyToSymbol(ThreadContext *tc, gpusyscall_t *call_params) {
     assert(sim_kind == cudaMemcpyHostToDevice);
     stream_operation mem_op((const void*)sim_src, (const char*)sim_symbol, sim_count, sim_offset, NULL);
     mem_op.setThreadContext(tc);
-    g_stream_manager->push(mem_op);
+    cudaGPU->pushCopyOperation(mem_op);
 
-    bool suspend = cudaGPU->needsToBlock();
+    bool suspend = cudaGPU->needsToBlock(tc);
     assert(suspend);
     g_last_cudaError = cudaSuccess;
     helper.setReturn((uint8_t*)&suspend, sizeof(bool));
@@ -531,9 +676,9 @@ cudaMemcpyFromSymbol(ThreadContext *tc, gpusyscall_t *call_params) {
     assert(sim_kind == cudaMemcpyDeviceToHost);
     stream_operation mem_op((const char*)sim_symbol, (void*)sim_dst, sim_count, sim_offset, NULL);
     mem_op.setThreadContext(tc);
-    g_stream_manager->push(mem_op);
+    cudaGPU->pushCopyOperation(mem_op);
 
-    bool suspend = cudaGPU->needsToBlock();
+    bool suspend = cudaGPU->needsToBlock(tc);
     assert(suspend);
     g_last_cudaError = cudaSuccess;
     helper.setReturn((uint8_t*)&suspend, sizeof(bool));
@@ -549,7 +694,32 @@ cudaMemcpyFromSymbol(ThreadContext *tc, gpusyscall_t *call_params) {
 void
 cudaMemcpyAsync(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_dst = *((Addr*)helper.getParam(0, true));
+    Addr sim_src = *((Addr*)helper.getParam(1, true));
+    size_t sim_count = *((size_t*)helper.getParam(2));
+    enum cudaMemcpyKind sim_kind = *((enum cudaMemcpyKind*)helper.getParam(3));
+    Addr sim_stream = *((Addr*)helper.getParam(4, true));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaMemcpyAsync(dst = %x, src = %x, count = %d, kind = %s, stream = %d)\n",
+            sim_dst, sim_src, sim_count, cudaMemcpyKindStrings[sim_kind], sim_stream);
+
+    g_last_cudaError = cudaSuccess;
+    if (sim_count == 0) {
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+        return;
+    }
+
+    // The copy is ordered within its stream, but the calling thread does not
+    // wait for it, so it may overlap with work in other streams
+    push_memcpy_operation(tc, sim_dst, sim_src, sim_count, sim_kind,
+                          cudaGPU->getStream(sim_stream));
+
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 //	__host__ cudaError_t CUDARTAPI cudaMemcpyToArrayAsync(struct cudaArray *dst, size_t wOffset, size_t hOffset, const void *src, size_t count, enum cudaMemcpyKind kind, cudaStream_t stream)
@@ -570,7 +740,35 @@ cudaMemcpyFromArrayAsync(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaMemcpy2DAsync(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_dst = *((Addr*)helper.getParam(0, true));
+    size_t sim_dpitch = *((size_t*)helper.getParam(1));
+    Addr sim_src = *((Addr*)helper.getParam(2, true));
+    size_t sim_spitch = *((size_t*)helper.getParam(3));
+    size_t sim_width = *((size_t*)helper.getParam(4));
+    size_t sim_height = *((size_t*)helper.getParam(5));
+    enum cudaMemcpyKind sim_kind = *((enum cudaMemcpyKind*)helper.getParam(6));
+    Addr sim_stream = *((Addr*)helper.getParam(7, true));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaMemcpy2DAsync(dst = %x, dpitch = %d, src = %x, spitch = %d, width = %d, height = %d, kind = %s, stream = %d)\n",
+            sim_dst, sim_dpitch, sim_src, sim_spitch, sim_width, sim_height,
+            cudaMemcpyKindStrings[sim_kind], sim_stream);
+
+    if (sim_width > sim_dpitch || sim_width > sim_spitch) {
+        g_last_cudaError = cudaErrorInvalidPitchValue;
+    } else {
+        g_last_cudaError = cudaSuccess;
+        if (sim_width > 0 && sim_height > 0) {
+            push_memcpy_2d_operation(tc, sim_dst, sim_dpitch, sim_src,
+                                     sim_spitch, sim_width, sim_height,
+                                     sim_kind, cudaGPU->getStream(sim_stream));
+        }
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 void
@@ -628,11 +826,11 @@ cudaMemset(ThreadContext *tc, gpusyscall_t *call_params)
     } else {
         stream_operation mem_op((size_t)sim_mem, sim_c, sim_count, 0);
         mem_op.setThreadContext(tc);
-        g_stream_manager->push(mem_op);
+        cudaGPU->pushCopyOperation(mem_op);
         g_last_cudaError = cudaSuccess;
         helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 
-        bool suspend = cudaGPU->needsToBlock();
+        bool suspend = cudaGPU->needsToBlock(tc);
         assert(suspend);
     }
 }
@@ -640,7 +838,48 @@ cudaMemset(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaMemset2D(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_mem = *((Addr*)helper.getParam(0, true));
+    size_t sim_pitch = *((size_t*)helper.getParam(1));
+    int sim_c = *((int*)helper.getParam(2));
+    size_t sim_width = *((size_t*)helper.getParam(3));
+    size_t sim_height = *((size_t*)helper.getParam(4));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaMemset2D(mem = %x, pitch = %d, c = %d, width = %d, height = %d)\n",
+            sim_mem, sim_pitch, sim_c, sim_width, sim_height);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    if (!cudaGPU->isManagingGPUMemory() && !cudaGPU->isAccessingHostPagetable()) {
+        // Signal to libcuda that it should handle the memset (see cudaMemset)
+        g_last_cudaError = cudaErrorApiFailureBase;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else if (sim_width > sim_pitch) {
+        g_last_cudaError = cudaErrorInvalidPitchValue;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else if (sim_width == 0 || sim_height == 0) {
+        g_last_cudaError = cudaSuccess;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+    } else {
+        CopyDescriptor desc;
+        desc.isMemset = true;
+        desc.value = sim_c;
+        // The source addresses are unused, but must be contiguous so that
+        // rows merge when the pitch equals the width
+        desc.addPitched(0, sim_width, 0, sim_mem, sim_pitch, 0, sim_width,
+                        sim_height);
+
+        stream_operation mem_op((size_t)sim_mem, sim_c, desc.totalLength, 0);
+        mem_op.setThreadContext(tc);
+        cudaGPU->pushCopyOperation(mem_op,
+                                   desc.segments.size() > 1 ? &desc : NULL);
+        g_last_cudaError = cudaSuccess;
+        helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
+
+        bool suspend = cudaGPU->needsToBlock(tc);
+        assert(suspend);
+    }
 }
 
 /*******************************************************************************
@@ -833,14 +1072,14 @@ cudaConfigureCall(ThreadContext *tc, gpusyscall_t *call_params)
     dim3 sim_gridDim = *((dim3*)helper.getParam(0));
     dim3 sim_blockDim = *((dim3*)helper.getParam(1));
     size_t sim_sharedMem = *((size_t*)helper.getParam(2));
-    cudaStream_t sim_stream = *((cudaStream_t*)helper.getParam(3));
-    if (sim_stream) {
-        panic("gem5-fusion doesn't currently support CUDA streams");
-    }
-    assert(!sim_stream); // We do not currently support CUDA streams
-    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaConfigureCall(tc = %p, gridDim = (%u,%u,%u), blockDim = (%u,%u,%u), sharedMem = %u, stream)\n",
+    Addr sim_stream_handle = *((Addr*)helper.getParam(3, true));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaConfigureCall(tc = %p, gridDim = (%u,%u,%u), blockDim = (%u,%u,%u), sharedMem = %u, stream = %d)\n",
             tc, sim_gridDim.x, sim_gridDim.y, sim_gridDim.z, sim_blockDim.x,
-            sim_blockDim.y, sim_blockDim.z, sim_sharedMem);
+            sim_blockDim.y, sim_blockDim.z, sim_sharedMem, sim_stream_handle);
+
+    // Stream handles are translated to the GPGPU-Sim streams they refer to
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    cudaStream_t sim_stream = cudaGPU->getStream(sim_stream_handle);
 
     g_cuda_launch_stack.push_back(kernel_config(sim_gridDim, sim_blockDim, sim_sharedMem, sim_stream));
     g_last_cudaError = cudaSuccess;
@@ -885,6 +1124,7 @@ cudaLaunch(ThreadContext *tc, gpusyscall_t *call_params)
     DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaLaunch(tc = %p, hostFun* = %x)\n", tc, sim_hostFun);
     kernel_info_t *grid = gpgpu_cuda_ptx_sim_init_grid(config.get_args(), config.grid_dim(), config.block_dim(), cudaGPU->get_kernel((const char*)sim_hostFun));
     grid->set_inst_base_vaddr(cudaGPU->getInstBaseVaddr());
+    cudaGPU->recordKernelLaunch(grid->get_uid());
     std::string kname = grid->name();
     stream_operation op(grid, g_ptx_sim_mode, stream);
     op.setThreadContext(tc);
@@ -951,28 +1191,75 @@ cudaFuncGetAttributes(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaStreamCreate(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_stream = *((Addr*)helper.getParam(0, true));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    Addr handle = cudaGPU->createStream();
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaStreamCreate(stream* = %x) = %d\n", sim_stream, handle);
+
+    helper.writeBlob(sim_stream, (uint8_t*)&handle, sizeof(Addr), true);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 // __host__ cudaError_t CUDARTAPI cudaStreamDestroy(cudaStream_t stream)
 void
 cudaStreamDestroy(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_stream = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaStreamDestroy(stream = %d)\n", sim_stream);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    cudaGPU->destroyStream(sim_stream);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 // __host__ cudaError_t CUDARTAPI cudaStreamSynchronize(cudaStream_t stream)
 void
 cudaStreamSynchronize(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_stream = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaStreamSynchronize(stream = %d), tc = %x\n", sim_stream, tc);
+
+    // Synchronizing the default stream waits for all streams
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    bool suspend = cudaGPU->needsToBlock(tc, cudaGPU->getStream(sim_stream));
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&suspend, sizeof(bool));
 }
 
 // __host__ cudaError_t CUDARTAPI cudaStreamQuery(cudaStream_t stream)
 void
 cudaStreamQuery(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_stream = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaStreamQuery(stream = %d)\n", sim_stream);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    struct CUstream_st *stream = cudaGPU->getStream(sim_stream);
+    bool done = stream ? stream->empty() : g_stream_manager->empty();
+
+    g_last_cudaError = done ? cudaSuccess : cudaErrorNotReady;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 /*******************************************************************************
@@ -985,37 +1272,128 @@ cudaStreamQuery(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaEventCreate(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    Addr handle = cudaGPU->createEvent();
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventCreate(event* = %x) = %d\n", sim_event, handle);
+
+    helper.writeBlob(sim_event, (uint8_t*)&handle, sizeof(Addr), true);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
+// __host__ cudaError_t CUDARTAPI cudaEventRecord(cudaEvent_t event, cudaStream_t stream)
 void
 cudaEventRecord(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+    Addr sim_stream = *((Addr*)helper.getParam(1, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventRecord(event = %d, stream = %d)\n", sim_event, sim_stream);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    struct CUevent_st *event = cudaGPU->getEvent(sim_event);
+    cudaGPU->recordEvent(event);
+
+    stream_operation event_op(event, cudaGPU->getStream(sim_stream));
+    event_op.setThreadContext(tc);
+    g_stream_manager->push(event_op);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
+// __host__ cudaError_t CUDARTAPI cudaEventQuery(cudaEvent_t event)
 void
 cudaEventQuery(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventQuery(event = %d)\n", sim_event);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    struct CUevent_st *event = cudaGPU->getEvent(sim_event);
+
+    g_last_cudaError = cudaGPU->isEventComplete(event) ? cudaSuccess : cudaErrorNotReady;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
+// __host__ cudaError_t CUDARTAPI cudaEventSynchronize(cudaEvent_t event)
 void
 cudaEventSynchronize(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventSynchronize(event = %d), tc = %x\n", sim_event, tc);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    bool suspend = cudaGPU->needsToBlockOnEvent(tc, cudaGPU->getEvent(sim_event));
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&suspend, sizeof(bool));
 }
 
+// __host__ cudaError_t CUDARTAPI cudaEventDestroy(cudaEvent_t event)
 void
 cudaEventDestroy(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventDestroy(event = %d)\n", sim_event);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    cudaGPU->destroyEvent(sim_event);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
+// __host__ cudaError_t CUDARTAPI cudaEventElapsedTime(float *ms, cudaEvent_t start, cudaEvent_t end)
 void
 cudaEventElapsedTime(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_ms = *((Addr*)helper.getParam(0, true));
+    Addr sim_start = *((Addr*)helper.getParam(1, true));
+    Addr sim_end = *((Addr*)helper.getParam(2, true));
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventElapsedTime(ms* = %x, start = %d, end = %d)\n", sim_ms, sim_start, sim_end);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    struct CUevent_st *start = cudaGPU->getEvent(sim_start);
+    struct CUevent_st *end = cudaGPU->getEvent(sim_end);
+
+    if (!cudaGPU->isEventComplete(start) || !cudaGPU->isEventComplete(end)) {
+        g_last_cudaError = cudaErrorNotReady;
+    } else {
+        // Elapsed simulated time between the points the events were reached
+        Tick start_tick = cudaGPU->getEventTick(start);
+        Tick end_tick = cudaGPU->getEventTick(end);
+        float ms = (float)((double)end_tick - (double)start_tick) /
+                   SimClock::Int::ms;
+        helper.writeBlob(sim_ms, (uint8_t*)&ms, sizeof(float));
+        g_last_cudaError = cudaSuccess;
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 /*******************************************************************************
@@ -1039,7 +1417,7 @@ cudaThreadSynchronize(ThreadContext *tc, gpusyscall_t *call_params)
     CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
     DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaThreadSynchronize(), tc = %x\n", tc);
     CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
-    bool suspend = cudaGPU->needsToBlock();
+    bool suspend = cudaGPU->needsToBlock(tc);
     g_last_cudaError = cudaSuccess;
     helper.setReturn((uint8_t*)&suspend, sizeof(bool));
 }
@@ -1309,6 +1687,9 @@ __cudaRegisterFatBinary(ThreadContext *tc, gpusyscall_t *call_params)
     } else {
         assert(!registering_allocation_ptr);
         registering_allocation_ptr = cudaGPU->allocateGPUMemory(registering_allocation_size);
+        if (!registering_allocation_ptr && registering_allocation_size) {
+            panic("Ran out of GPU memory for global variables!");
+        }
         int zero_allocation = 0;
         helper.setReturn((uint8_t*)&zero_allocation, sizeof(int));
     }
@@ -1390,6 +1771,9 @@ __cudaCheckAllocateLocal(ThreadContext *tc, gpusyscall_t *call_params)
         } else {
             DPRINTF(GPUSyscalls, "gem5 GPU Syscall:      GPU allocating local...\n");
             registering_local_alloc_ptr = cudaGPU->allocateGPUMemory(local_alloc_size);
+            if (!registering_local_alloc_ptr && local_alloc_size) {
+                panic("Ran out of GPU memory for local memory!");
+            }
             cudaGPU->setLocalBaseVaddr(registering_local_alloc_ptr);
             cudaGPU->registerDeviceMemory(tc, registering_local_alloc_ptr, local_alloc_size);
             unsigned long long zero_allocation = 0;
@@ -1564,13 +1948,68 @@ cudaGLUnregisterBufferObject(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaHostAlloc(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_pHost = *((Addr*)helper.getParam(0, true));
+    size_t sim_size = *((size_t*)helper.getParam(1));
+    unsigned int sim_flags = *((unsigned int*)helper.getParam(2));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaHostAlloc(pHost = %x, size = %d, flags = %x)\n", sim_pHost, sim_size, sim_flags);
+
+    g_last_cudaError = cudaSuccess;
+
+    if (!(sim_flags & cudaHostAllocMapped) || FullSystem) {
+        if (sim_flags & cudaHostAllocMapped) {
+            warn_once("Mapped host memory is unsupported in full-system mode; "
+                      "allocating unmapped pinned memory\n");
+        }
+        // Tell CUDA runtime to allocate memory, as with cudaMallocHost
+        cudaError_t to_return = cudaErrorApiFailureBase;
+        helper.setReturn((uint8_t*)&to_return, sizeof(cudaError_t));
+        return;
+    }
+
+    // Allocate the memory here, so that it can be mapped into the GPU's
+    // address space for zero-copy accesses
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    Addr addr = cudaGPU->allocateMappedHostMemory(tc, sim_size);
+    helper.writeBlob(sim_pHost, (uint8_t*)(&addr), sizeof(Addr), true);
+    if (!addr) {
+        g_last_cudaError = cudaErrorMemoryAllocation;
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 void
 cudaHostGetDevicePointer(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_pDevice = *((Addr*)helper.getParam(0, true));
+    Addr sim_pHost = *((Addr*)helper.getParam(1, true));
+    unsigned int sim_flags = *((unsigned int*)helper.getParam(2));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaHostGetDevicePointer(pDevice = %x, pHost = %x, flags = %x)\n", sim_pDevice, sim_pHost, sim_flags);
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+
+    Addr device_addr = 0;
+    if (sim_flags) {
+        g_last_cudaError = cudaErrorInvalidValue;
+    } else if (cudaGPU->getMappedDevicePointer(sim_pHost, device_addr)) {
+        g_last_cudaError = cudaSuccess;
+    } else if (cudaGPU->isAccessingHostPagetable()) {
+        // The GPU can access any host address directly
+        device_addr = sim_pHost;
+        g_last_cudaError = cudaSuccess;
+    } else {
+        g_last_cudaError = cudaErrorInvalidValue;
+    }
+
+    if (g_last_cudaError == cudaSuccess) {
+        helper.writeBlob(sim_pDevice, (uint8_t*)(&device_addr), sizeof(Addr), true);
+    }
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 void
@@ -1582,13 +2021,44 @@ cudaSetValidDevices(ThreadContext *tc, gpusyscall_t *call_params)
 void
 cudaSetDeviceFlags(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    unsigned int sim_flags = *((unsigned int*)helper.getParam(0));
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaSetDeviceFlags(flags = %x)\n", sim_flags);
+
+    // Host memory mapping is always enabled, and the scheduling flags only
+    // affect how host threads wait for the GPU
+    if (sim_flags & ~cudaDeviceMapHost) {
+        warn_once("Ignoring cudaSetDeviceFlags scheduling flags\n");
+    }
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 void
 cudaEventCreateWithFlags(ThreadContext *tc, gpusyscall_t *call_params)
 {
-    cuda_not_implemented(__my_func__,__LINE__);
+    GPUSyscallHelper helper(tc, call_params);
+    CudaGPU::getCudaGPU(g_active_device)->checkUpdateThreadContext(tc);
+
+    Addr sim_event = *((Addr*)helper.getParam(0, true));
+    unsigned int sim_flags = *((unsigned int*)helper.getParam(1));
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(g_active_device);
+    Addr handle = cudaGPU->createEvent();
+
+    DPRINTF(GPUSyscalls, "gem5 GPU Syscall: cudaEventCreateWithFlags(event* = %x, flags = %x) = %d\n", sim_event, sim_flags, handle);
+    if (sim_flags) {
+        // Blocking sync and disabled timing only affect host-side behavior
+        warn_once("Ignoring cudaEventCreateWithFlags flags\n");
+    }
+
+    helper.writeBlob(sim_event, (uint8_t*)&handle, sizeof(Addr), true);
+
+    g_last_cudaError = cudaSuccess;
+    helper.setReturn((uint8_t*)&g_last_cudaError, sizeof(cudaError_t));
 }
 
 void
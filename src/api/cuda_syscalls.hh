@@ -184,7 +184,9 @@ typedef struct cudaFuncAttributes {
 
 void cudaMalloc(ThreadContext *tc, gpusyscall_t *call_params);
 void cudaMallocHost(ThreadContext *tc, gpusyscall_t *call_params);
+void cudaMallocManaged(ThreadContext *tc, gpusyscall_t *call_params);
 void cudaRegisterDeviceMemory(ThreadContext *tc, gpusyscall_t *call_params);
+void cudaAdviseDevicePlacement(ThreadContext *tc, gpusyscall_t *call_params);
 void cudaMallocPitch(ThreadContext *tc, gpusyscall_t *call_params);
 void cudaMallocArray(ThreadContext *tc, gpusyscall_t *call_params);
 void cudaFree(ThreadContext *tc, gpusyscall_t *call_params);
@@ -370,7 +372,9 @@ cudaFunc_t gpgpu_funcs[] = {
         cudaRegisterDeviceMemory,    /* 82 */
         cudaBlockThread,    /* 83 */
         __cudaCheckAllocateLocal,    /* 84 */
-        __cudaSetLocalAllocation    /* 85 */
+        __cudaSetLocalAllocation,    /* 85 */
+        cudaMallocManaged,    /* 86 */
+        cudaAdviseDevicePlacement    /* 87 */
 };
 
 #endif
@@ -29,6 +29,7 @@
 from MemObject import MemObject
 from ShaderTLB import ShaderTLB
 from m5.params import *
+from m5.proxy import *
 
 class ShaderLSQ(MemObject):
     type = 'ShaderLSQ'
@@ -40,6 +41,9 @@ class ShaderLSQ(MemObject):
     lane_port = VectorSlavePort("the ports back to the shader core")
 
     data_tlb = Param.ShaderTLB(ShaderTLB(), "Data TLB")
+    utlb_entries = Param.Unsigned(0, "Entries in the micro-TLB in front of the data TLB. 0 implies no micro-TLB")
+    tlb_lookup_ports = Param.Unsigned(0, "Data TLB lookups the LSQ can start per cycle. 0 implies unlimited")
+    gpu = Param.CudaGPU(Parent.any, "The GPU")
 
     control_port = SlavePort("The control port for this LSQ")
 
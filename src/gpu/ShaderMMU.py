@@ -31,47 +31,86 @@ from m5.defines import buildEnv
 from m5.params import *
 from m5.proxy import *
 from m5.util import fatal
-from ClockedObject import ClockedObject
+from MemObject import MemObject
 
-class ShaderMMU(ClockedObject):
+class ShaderMMU(MemObject):
     type = 'ShaderMMU'
     cxx_class = 'ShaderMMU'
     cxx_header = "gpu/shader_mmu.hh"
 
-    if buildEnv['TARGET_ISA'] == 'x86':
-        from X86TLB import X86TLB
-        pagewalkers = VectorParam.X86TLB("wrapped TLB")
-    elif buildEnv['TARGET_ISA'] == 'arm':
+    # x86 page walks are done natively by the MMU. ARM walks use the walker
+    # of a wrapped TLB for each walk slot.
+    if buildEnv['TARGET_ISA'] == 'arm':
         from ArmTLB import ArmTLB
         pagewalkers = VectorParam.ArmTLB("wrapped TLB")
         stage2_mmu = Param.ArmStage2MMU("Stage 2 MMU for port")
-    else:
+    elif buildEnv['TARGET_ISA'] != 'x86':
         fatal('ShaderMMU only supports x86 and ARM architectures currently')
 
+    walk_slots = Param.Int(32, "Maximum number of concurrent page walks")
+    walk_scheduler = Param.String('fifo', "Order to start walks waiting " \
+                        "for a walk slot: fifo, or batch to group walks " \
+                        "that share upper-level page table entries")
+    walk_batch_limit = Param.Unsigned(16, "Maximum walks the batch " \
+                        "scheduler starts ahead of the oldest waiting walk")
+
+    # By default, no fault waits for a batch to fill: faults are batched only
+    # while an earlier batch is being handled
+    fault_batch_size = Param.Unsigned(8, "Maximum page faults raised to " \
+                        "the CPU in one batch before retrying their walks")
+    fault_batch_timeout = Param.Cycles(0, "Cycles to collect page faults " \
+                        "into a batch after the first fault (0 => raise " \
+                        "faults as soon as no batch is outstanding)")
+
     latency = Param.Int(20, "Round trip latency for requests from L1 TLBs")
+    shootdown_latency = Param.Cycles(100, "Cycles to deliver a TLB " \
+                        "shootdown from the CPU and invalidate the GPU TLBs")
+    cpu_shootdowns = Param.Bool(False, "Whether the CPU TLBs deliver their " \
+                        "invalidations to the GPU (required in full-system " \
+                        "mode for TLBs that access the host page table)")
 
     l2_tlb_entries = Param.Int(0, "Number of entries in the L2 TLB (0=>no L2)")
     l2_tlb_assoc = Param.Int(4, "Associativity of the L2 TLB (0 => full)")
+    l2_tlb_replacement_policy = Param.String('lru', "L2 TLB replacement "
+                                     "policy: lru, tree_plru, random or srrip")
 
     prefetch_buffer_size = Param.Int(0, "Size of the prefetch buffer")
+    prefetcher = Param.String('next_page', "TLB prefetcher: next_page, or " \
+                        "stride to detect the strides between misses per PC")
+    prefetch_distance = Param.Unsigned(1, "Strides ahead of a miss to prefetch")
+    prefetch_degree = Param.Unsigned(1, "Maximum prefetches per miss")
+    prefetch_table_entries = Param.Unsigned(64, "Entries in the stride " \
+                        "prefetcher's history table")
+    prefetch_throttle_window = Param.Unsigned(64, "Prefetches between " \
+                        "adjusting the prefetch degree by prefetch accuracy " \
+                        "and faults (0 => no throttling)")
+
+    # In x86 full-system mode, page walks always read the page table natively
+    # through walker_port. The page walk cache lets a walk start from the
+    # deepest cached upper-level entry; a level with 0 entries is not cached
+    pwc_entries = VectorParam.Int([0, 0, 0], "Entries in the page walk " \
+                        "cache for each upper page table level (PML4, PDP, " \
+                        "PD) (0 => level not cached)")
+    walker_port = MasterPort("Port for page table reads by native walks")
+    walker_bypass_l1 = Param.Bool(False, "Native walks bypass the L1 cache")
+    sys = Param.System(Parent.any, "system the MMU is part of")
 
     def setUpPagewalkers(self, num, port, bypass_l1):
-        if buildEnv['TARGET_ISA'] == 'arm':
+        self.walk_slots = num
+        if buildEnv['TARGET_ISA'] == 'x86':
+            self.walker_port = port
+            self.walker_bypass_l1 = bypass_l1
+        elif buildEnv['TARGET_ISA'] == 'arm':
             from ArmTLB import ArmTLB, ArmStage2DMMU
             self.stage2_mmu = ArmStage2DMMU(tlb = ArmTLB())
-        tlbs = []
-        for i in range(num):
-            # set to only a single entry here so that all requests are misses
-            if buildEnv['TARGET_ISA'] == 'x86':
-                from X86TLB import X86TLB
-                t = X86TLB(size=1)
-                t.walker.bypass_l1 = bypass_l1
-            elif buildEnv['TARGET_ISA'] == 'arm':
+            tlbs = []
+            for i in range(num):
+                # set to only a single entry here so that all requests are
+                # misses. ArmTLB does not yet include bypass_l1 option
                 t = ArmTLB(size=1)
-                # ArmTLB does not yet include bypass_l1 option
-            else:
-                fatal('ShaderMMU only supports x86 and ARM architectures ' \
-                      'currently')
-            t.walker.port = port
-            tlbs.append(t)
-        self.pagewalkers = tlbs
+                t.walker.port = port
+                tlbs.append(t)
+            self.pagewalkers = tlbs
+        else:
+            fatal('ShaderMMU only supports x86 and ARM architectures ' \
+                  'currently')
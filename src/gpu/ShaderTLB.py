@@ -40,7 +40,20 @@ class ShaderTLB(BaseTLB):
 
     entries = Param.Int(0, "number entries in TLB (0 implies infinite)")
 
-    associativity = Param.Int(4, "Number of sets in the TLB")
+    associativity = Param.Int(4, "Associativity of the TLB (0 => full)")
+    replacement_policy = Param.String('lru', "TLB replacement policy: lru, "
+                                      "tree_plru, random or srrip")
 
     hit_latency = Param.Cycles(1, "number of cycles for a hit")
+    mshrs = Param.Unsigned(0, "Number of outstanding misses to different " \
+                "pages (0 => unlimited)")
+    banks = Param.Unsigned(1, "Number of banks, interleaved by page")
+    lookup_ports = Param.Unsigned(0, "Lookups each bank can start per " \
+                "cycle (0 => unlimited)")
+    shared = Param.Bool(False, "Whether the TLB is shared by multiple " \
+                "cores, to count the hits that sharing provides")
+
+    replayable_faults = Param.Bool(False, "Translations that page fault " \
+                "finish with a replayable fault, and are replayed by the " \
+                "requester once the fault is handled")
 
@@ -0,0 +1,114 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __GPU_COPY_DESCRIPTOR_HH__
+#define __GPU_COPY_DESCRIPTOR_HH__
+
+#include <vector>
+
+#include "base/types.hh"
+#include "stream_manager.h"
+
+/**
+ * A contiguous piece of a copy: length bytes from src are copied to dst.
+ * For memsets, src is unused.
+ */
+class CopySegment
+{
+  public:
+    CopySegment(Addr _src, Addr _dst, size_t _length) :
+        src(_src), dst(_dst), length(_length) {}
+
+    Addr src;
+    Addr dst;
+    size_t length;
+};
+
+/**
+ * Describes a single copy engine operation (memcpy or memset) as a list of
+ * segments, which the copy engine transfers back to back. This supports
+ * linear, pitched 2D/3D and general scatter-gather copies.
+ */
+class CopyDescriptor
+{
+  public:
+    CopyDescriptor() :
+        isMemset(false), value(0), type(stream_memcpy_host_to_device),
+        isPhysical(false), isMigration(false), migrationUnit(0),
+        totalLength(0) {}
+
+    bool isMemset;
+    // The byte value to set for memsets
+    int value;
+    // The direction of memcpys
+    stream_operation_type type;
+    // The segment addresses are physical, so they are not translated
+    bool isPhysical;
+    // Whether this copy migrates managed memory rather than executing a
+    // stream operation, and the base address of the migrated unit
+    bool isMigration;
+    Addr migrationUnit;
+
+    std::vector<CopySegment> segments;
+    // The sum of the lengths of all segments
+    size_t totalLength;
+
+    void addSegment(Addr src, Addr dst, size_t length) {
+        if (length == 0) return;
+        // Merge with the previous segment if both sides are contiguous
+        if (!segments.empty()) {
+            CopySegment &last = segments.back();
+            if (last.src + last.length == src &&
+                last.dst + last.length == dst) {
+                last.length += length;
+                totalLength += length;
+                return;
+            }
+        }
+        segments.push_back(CopySegment(src, dst, length));
+        totalLength += length;
+    }
+
+    /**
+     * Add a pitched copy of depth slices of height rows of width bytes each.
+     * Rows are pitch bytes apart and slices are slice_pitch bytes apart in
+     * the source and destination, respectively.
+     */
+    void addPitched(Addr src, size_t src_pitch, size_t src_slice_pitch,
+                    Addr dst, size_t dst_pitch, size_t dst_slice_pitch,
+                    size_t width, size_t height, size_t depth = 1) {
+        for (size_t z = 0; z < depth; z++) {
+            for (size_t y = 0; y < height; y++) {
+                addSegment(src + z * src_slice_pitch + y * src_pitch,
+                           dst + z * dst_slice_pitch + y * dst_pitch, width);
+            }
+        }
+    }
+};
+
+#endif // __GPU_COPY_DESCRIPTOR_HH__
@@ -26,8 +26,11 @@
  * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
+#include <algorithm>
+#include <cstring>
 #include <iostream>
 
+#include "arch/isa_traits.hh"
 #include "arch/utility.hh"
 #include "base/output.hh"
 #include "debug/GPUCopyEngine.hh"
@@ -45,7 +48,9 @@ GPUCopyEngine::GPUCopyEngine(const Params *p) :
     writePort(NULL), tickEvent(this), masterId(p->sys->getMasterId(name())),
     cudaGPU(p->gpu), cacheLineSize(p->cache_line_size),
     driverDelay(p->driver_delay), hostDTB(p->host_dtb),
-    deviceDTB(p->device_dtb), readDTB(NULL), writeDTB(NULL)
+    deviceDTB(p->device_dtb), readDTB(NULL), writeDTB(NULL),
+    readTranslation(this), writeTranslation(this),
+    translationFlushCallback(this)
 {
     DPRINTF(GPUCopyEngine, "Created copy engine\n");
 
@@ -56,10 +61,22 @@ GPUCopyEngine::GPUCopyEngine(const Params *p) :
     registerExitCallback(&ceExitCB);
 
     cudaGPU->registerCopyEngine(this);
+    hostDTB->addInvalidateCallback(&translationFlushCallback);
+    deviceDTB->addInvalidateCallback(&translationFlushCallback);
 
     bufferDepth = p->buffering * cacheLineSize;
 }
 
+GPUCopyEngine::~GPUCopyEngine()
+{
+    for (unsigned i = 0; i < freeChunks.size(); i++) {
+        delete freeChunks[i];
+    }
+    for (unsigned i = 0; i < freeRequests.size(); i++) {
+        delete freeRequests[i];
+    }
+}
+
 Tick GPUCopyEngine::CEPort::recvAtomic(PacketPtr pkt)
 {
     panic("GPUCopyEngine::CEPort::recvAtomic() not implemented!\n");
@@ -109,23 +126,65 @@ void GPUCopyEngine::finishMemcpy()
     operationTimeTicks += total_time;
     DPRINTF(GPUCopyEngine, "Total time was: %llu\n", total_time);
     memCpyStats.push_back(MemCpyStats(total_time, memCpyLength));
-    cudaGPU->finishCopyOperation();
+    CopyDescriptor desc = descriptors.front();
+    descriptors.pop();
+    if (desc.isMigration) {
+        cudaGPU->finishMigration(desc);
+    } else {
+        cudaGPU->finishCopyOperation();
+    }
+
+    // Pipeline queued operations back to back. The completion callback may
+    // have already started a newly queued operation.
+    if (!descriptors.empty() && !running) {
+        startCopy(0);
+    }
+}
+
+GPUCopyEngine::CopyChunk *
+GPUCopyEngine::allocateChunk(Tick offset, unsigned size)
+{
+    CopyChunk *chunk;
+    if (freeChunks.empty()) {
+        chunk = new CopyChunk(cacheLineSize);
+    } else {
+        chunk = freeChunks.back();
+        freeChunks.pop_back();
+    }
+    assert(size <= cacheLineSize);
+    chunk->offset = offset;
+    chunk->size = size;
+    chunk->done = false;
+    return chunk;
+}
+
+void GPUCopyEngine::releaseChunk(CopyChunk *chunk)
+{
+    freeChunks.push_back(chunk);
+}
+
+RequestPtr GPUCopyEngine::allocateRequest()
+{
+    if (freeRequests.empty()) {
+        return new Request();
+    }
+    RequestPtr req = freeRequests.back();
+    freeRequests.pop_back();
+    return req;
 }
 
 void GPUCopyEngine::recvPacket(PacketPtr pkt)
 {
+    CopyChunk *chunk = dynamic_cast<CopyChunk*>(pkt->senderState);
+    assert(chunk);
+
     if (pkt->isRead()) {
         DPRINTF(GPUCopyEngine, "done with a read addr: 0x%x, size: %d\n", pkt->req->getVaddr(), pkt->getSize());
-        pkt->writeData(curData + (pkt->req->getVaddr() - beginAddr));
+        // The data was returned directly into the chunk
+        chunk->done = true;
         bytesRead += pkt->getSize();
 
-        // set the addresses we just got as done
-        for (int i = pkt->req->getVaddr() - beginAddr;
-                i < pkt->req->getVaddr() - beginAddr + pkt->getSize(); i++) {
-            readsDone[i] = true;
-        }
-
-        DPRINTF(GPUCopyEngine, "Data is: %d\n", *((int*) (curData + (pkt->req->getVaddr() - beginAddr))));
+        DPRINTF(GPUCopyEngine, "Data is: %d\n", *((int*) chunk->data));
         if (readDone < totalLength) {
             DPRINTF(GPUCopyEngine, "Trying to write\n");
             needToWrite = true;
@@ -135,8 +194,11 @@ void GPUCopyEngine::recvPacket(PacketPtr pkt)
         }
 
         // mark readDone as only the contiguous region
-        while (readDone < totalLength && readsDone[readDone]) {
-            readDone++;
+        while (completedReadChunks < readChunks.size() &&
+               readChunks[completedReadChunks]->done) {
+            CopyChunk *done_chunk = readChunks[completedReadChunks];
+            readDone = done_chunk->offset + done_chunk->size;
+            completedReadChunks++;
         }
 
         if (readDone >= totalLength) {
@@ -147,12 +209,12 @@ void GPUCopyEngine::recvPacket(PacketPtr pkt)
         DPRINTF(GPUCopyEngine, "done with a write addr: 0x%x\n", pkt->req->getVaddr());
         writeDone += pkt->getSize();
         bytesWritten += pkt->getSize();
+        releaseChunk(chunk);
         if (!(writeDone < totalLength)) {
             // we are done!
             DPRINTF(GPUCopyEngine, "done writing, completely done!!!!\n");
             needToWrite = false;
-            delete[] curData;
-            delete[] readsDone;
+            assert(readChunks.empty());
             finishMemcpy();
         } else {
             if (!tickEvent.scheduled()) {
@@ -160,45 +222,106 @@ void GPUCopyEngine::recvPacket(PacketPtr pkt)
             }
         }
     }
-    if (pkt->req) delete pkt->req;
+    freeRequests.push_back(pkt->req);
     delete pkt;
 }
 
-void GPUCopyEngine::tryRead()
+bool GPUCopyEngine::translate(PageTranslation &page_trans, ShaderTLB *tlb,
+                              BaseTLB::Mode mode, Addr vaddr, unsigned size,
+                              Addr &paddr)
 {
-    RequestPtr req = new Request();
-    Request::Flags flags;
-    Addr pc = 0;
-    const int asid = 0;
-    //unsigned block_size = port.peerBlockSize();
+    if (descriptors.front().isPhysical) {
+        paddr = vaddr;
+        return true;
+    }
+    if (cudaGPU->translateManagedAddress(vaddr, paddr)) {
+        // Managed pages may migrate, so their translations are not cached
+        return true;
+    }
+
+    Addr vpage = vaddr - vaddr % TheISA::PageBytes;
+    if (!page_trans.valid || page_trans.vpage != vpage) {
+        if (page_trans.pending) {
+            // Wait for the outstanding translation to complete
+            return false;
+        }
+        page_trans.valid = false;
+        page_trans.pending = true;
 
+        Request::Flags flags;
+        Addr pc = 0;
+        const int asid = 0;
+        page_trans.tlbReq.setVirt(asid, vaddr, size, flags, masterId, pc);
+
+        DPRINTF(GPUCopyEngine, "translating page 0x%x\n", vpage);
+        numPageTranslations++;
+
+        tlb->beginTranslateTiming(&page_trans.tlbReq, &page_trans, mode);
+
+        // The translation may have completed immediately
+        if (!page_trans.valid || page_trans.vpage != vpage) {
+            return false;
+        }
+    }
+
+    paddr = page_trans.ppage + (vaddr - vpage);
+    return true;
+}
+
+void GPUCopyEngine::tryRead()
+{
     if (readLeft <= 0) {
         DPRINTF(GPUCopyEngine, "WHY ARE WE HERE?\n");
         return;
     }
 
+    const CopySegment &segment =
+        descriptors.front().segments[readSegment];
+    Addr read_addr = segment.src + readSegmentOffset;
+
     int size;
-    if (currentReadAddr % cacheLineSize) {
-        size = cacheLineSize - (currentReadAddr % cacheLineSize);
+    if (read_addr % cacheLineSize) {
+        size = cacheLineSize - (read_addr % cacheLineSize);
         DPRINTF(GPUCopyEngine, "Aligning\n");
     } else {
         size = cacheLineSize;
     }
-    size = readLeft > (size - 1) ? size : readLeft;
-    req->setVirt(asid, currentReadAddr, size, flags, masterId, pc);
+    // Accesses do not cross segment boundaries
+    size = (segment.length - readSegmentOffset) > (size - 1) ?
+           size : (segment.length - readSegmentOffset);
+
+    Addr paddr;
+    if (!translate(readTranslation, readDTB, BaseTLB::Read, read_addr, size,
+                   paddr)) {
+        // The tick is rescheduled when the translation completes
+        return;
+    }
 
-    DPRINTF(GPUCopyEngine, "trying read addr: 0x%x, %d bytes\n", currentReadAddr, size);
+    RequestPtr req = allocateRequest();
+    Request::Flags flags;
+    Addr pc = 0;
+    const int asid = 0;
+    req->setVirt(asid, read_addr, size, flags, masterId, pc);
+    req->setPaddr(paddr);
 
-    BaseTLB::Mode mode = BaseTLB::Read;
+    DPRINTF(GPUCopyEngine, "trying read addr: 0x%x, %d bytes\n", read_addr, size);
 
-    WholeTranslationState *state =
-            new WholeTranslationState(req, NULL, NULL, mode);
-    DataTranslation<GPUCopyEngine*> *translation
-            = new DataTranslation<GPUCopyEngine*>(this, state);
+    CopyChunk *chunk = allocateChunk(totalLength - readLeft, size);
+    readChunks.push_back(chunk);
 
-    readDTB->beginTranslateTiming(req, translation, mode);
+    PacketPtr pkt = new Packet(req, MemCmd::ReadReq);
+    pkt->dataStatic(chunk->data);
+    pkt->senderState = chunk;
+    if (readPort == &devicePort) {
+        cudaGPU->recordDeviceAccess(paddr, size);
+    }
+    readPort->sendPacket(pkt);
 
-    currentReadAddr += size;
+    readSegmentOffset += size;
+    if (readSegmentOffset == segment.length) {
+        readSegment++;
+        readSegmentOffset = 0;
+    }
 
     readLeft -= size;
 
@@ -221,44 +344,82 @@ void GPUCopyEngine::tryWrite()
         return;
     }
 
+    const CopyDescriptor &desc = descriptors.front();
+    const CopySegment &segment = desc.segments[writeSegment];
+    Addr write_addr = segment.dst + writeSegmentOffset;
+
     int size;
-    if (currentWriteAddr % cacheLineSize) {
-        size = cacheLineSize - (currentWriteAddr % cacheLineSize);
+    if (write_addr % cacheLineSize) {
+        size = cacheLineSize - (write_addr % cacheLineSize);
         DPRINTF(GPUCopyEngine, "Aligning\n");
     } else {
         size = cacheLineSize;
     }
-    size = writeLeft > size-1 ? size : writeLeft;
+    // Accesses do not cross segment boundaries
+    size = (segment.length - writeSegmentOffset) > (size - 1) ?
+           size : (segment.length - writeSegmentOffset);
 
-    if (readDone < size+(totalLength-writeLeft)) {
+    Tick write_offset = totalLength - writeLeft;
+    if (readDone < size + write_offset) {
         // haven't read enough yet
         DPRINTF(GPUCopyEngine, "Tried to write when we haven't read enough\n");
         return;
     }
 
-    RequestPtr req = new Request();
+    Addr paddr;
+    if (!translate(writeTranslation, writeDTB, BaseTLB::Write, write_addr,
+                   size, paddr)) {
+        // The tick is rescheduled when the translation completes
+        return;
+    }
+
+    RequestPtr req = allocateRequest();
     Request::Flags flags;
     Addr pc = 0;
     const int asid = 0;
-    req->setVirt(asid, currentWriteAddr, size, flags, masterId, pc);
-
-    assert(	(totalLength-writeLeft +size) <= readDone);
-    uint8_t *data = new uint8_t[size];
-    std::memcpy(data, &curData[totalLength-writeLeft], size);
-    req->setExtraData((uint64_t)data);
+    req->setVirt(asid, write_addr, size, flags, masterId, pc);
+    req->setPaddr(paddr);
 
-    DPRINTF(GPUCopyEngine, "trying write addr: 0x%x, %d bytes, data %d\n", currentWriteAddr, size, *((int*)(&curData[totalLength-writeLeft])));
-
-    BaseTLB::Mode mode = BaseTLB::Write;
+    CopyChunk *chunk = allocateChunk(write_offset, size);
+    if (desc.isMemset) {
+        std::memset(chunk->data, desc.value, size);
+    } else {
+        // Gather the data from the read chunks, which may not line up with
+        // the write if the source and destination alignments differ
+        unsigned copied = 0;
+        while (copied < size) {
+            assert(!readChunks.empty() && completedReadChunks > 0);
+            CopyChunk *read_chunk = readChunks.front();
+            Tick chunk_offset = write_offset + copied - read_chunk->offset;
+            assert(chunk_offset < read_chunk->size);
+            unsigned amount = std::min((Tick)(size - copied),
+                                       read_chunk->size - chunk_offset);
+            std::memcpy(chunk->data + copied,
+                        read_chunk->data + chunk_offset, amount);
+            copied += amount;
+            if (chunk_offset + amount == read_chunk->size) {
+                readChunks.pop_front();
+                completedReadChunks--;
+                releaseChunk(read_chunk);
+            }
+        }
+    }
 
-    WholeTranslationState *state =
-            new WholeTranslationState(req, NULL, NULL, mode);
-    DataTranslation<GPUCopyEngine*> *translation
-            = new DataTranslation<GPUCopyEngine*>(this, state);
+    DPRINTF(GPUCopyEngine, "trying write addr: 0x%x, %d bytes, data %d\n", write_addr, size, *((int*)chunk->data));
 
-    writeDTB->beginTranslateTiming(req, translation, mode);
+    PacketPtr pkt = new Packet(req, MemCmd::WriteReq);
+    pkt->dataStatic(chunk->data);
+    pkt->senderState = chunk;
+    if (writePort == &devicePort) {
+        cudaGPU->recordDeviceAccess(req->getPaddr(), size);
+    }
+    writePort->sendPacket(pkt);
 
-    currentWriteAddr += size;
+    writeSegmentOffset += size;
+    if (writeSegmentOffset == segment.length) {
+        writeSegment++;
+        writeSegmentOffset = 0;
+    }
 
     writeLeft -= size;
 
@@ -291,130 +452,161 @@ void GPUCopyEngine::tick()
 
 int GPUCopyEngine::memcpy(Addr src, Addr dst, size_t length, stream_operation_type type)
 {
-    switch (type) {
-    case stream_memcpy_host_to_device:
+    CopyDescriptor desc;
+    desc.type = type;
+    desc.addSegment(src, dst, length);
+    copy(desc);
+    return 0;
+}
+
+int GPUCopyEngine::memset(Addr dst, int value, size_t length)
+{
+    CopyDescriptor desc;
+    desc.isMemset = true;
+    desc.value = value;
+    desc.addSegment(0, dst, length);
+    copy(desc);
+    return 0;
+}
+
+void GPUCopyEngine::copy(const CopyDescriptor &desc)
+{
+    assert(desc.totalLength > 0);
+    descriptors.push(desc);
+
+    if (running) {
+        DPRINTF(GPUCopyEngine, "Queued operation of %d bytes behind %d others\n",
+                desc.totalLength, descriptors.size() - 1);
+        numQueuedOperations++;
+        return;
+    }
+
+    // Migrations are started by the GPU rather than the driver
+    startCopy(desc.isMigration ? 0 : driverDelay);
+}
+
+void GPUCopyEngine::startCopy(Tick delay)
+{
+    assert(!running && !readPort && !readDTB);
+    assert(!descriptors.empty());
+    const CopyDescriptor &desc = descriptors.front();
+
+    if (desc.isMemset) {
         readPort = &hostPort;
         readDTB = hostDTB;
         writePort = &devicePort;
         writeDTB = deviceDTB;
-        break;
-    case stream_memcpy_device_to_host:
-        readPort = &devicePort;
-        readDTB = deviceDTB;
-        writePort = &hostPort;
-        writeDTB = hostDTB;
-        break;
-    case stream_memcpy_device_to_device:
-        readPort = &devicePort;
-        readDTB = deviceDTB;
-        writePort = &devicePort;
-        writeDTB = deviceDTB;
-        break;
-    default:
-        panic("Unknown stream memcpy type: %d!\n", type);
-        break;
+    } else {
+        switch (desc.type) {
+        case stream_memcpy_host_to_device:
+            readPort = &hostPort;
+            readDTB = hostDTB;
+            writePort = &devicePort;
+            writeDTB = deviceDTB;
+            break;
+        case stream_memcpy_device_to_host:
+            readPort = &devicePort;
+            readDTB = deviceDTB;
+            writePort = &hostPort;
+            writeDTB = hostDTB;
+            break;
+        case stream_memcpy_device_to_device:
+            readPort = &devicePort;
+            readDTB = deviceDTB;
+            writePort = &devicePort;
+            writeDTB = deviceDTB;
+            break;
+        default:
+            panic("Unknown stream memcpy type: %d!\n", desc.type);
+            break;
+        }
     }
 
+    size_t length = desc.totalLength;
     assert(length > 0);
     memCpyLength = length;
-    assert(!running);
     running = true;
 
-    DPRINTF(GPUCopyEngine, "Initiating copy of %d bytes from 0x%x to 0x%x\n", length, src, dst);
+    if (desc.isMemset) {
+        DPRINTF(GPUCopyEngine, "Initiating memset of %d bytes in %d segments at 0x%x to %d\n",
+                length, desc.segments.size(), desc.segments.front().dst,
+                desc.value);
+    } else {
+        DPRINTF(GPUCopyEngine, "Initiating copy of %d bytes in %d segments from 0x%x to 0x%x\n",
+                length, desc.segments.size(), desc.segments.front().src,
+                desc.segments.front().dst);
+    }
     memCpyStartTime = curTick();
+    numSegments += desc.segments.size();
 
-    needToRead = true;
-    needToWrite = false;
-
-    currentReadAddr = src;
-    currentWriteAddr = dst;
+    // Memsets have nothing to read
+    needToRead = !desc.isMemset;
+    needToWrite = desc.isMemset;
 
-    beginAddr = src;
+    readSegment = 0;
+    readSegmentOffset = 0;
+    writeSegment = 0;
+    writeSegmentOffset = 0;
 
-    readLeft = length;
+    readLeft = desc.isMemset ? 0 : length;
     writeLeft = length;
 
     totalLength = length;
 
-    readDone = 0;
+    readDone = desc.isMemset ? length : 0;
     writeDone = 0;
 
-    curData = new uint8_t[length];
-    readsDone = new bool[length];
-    for (int i = 0; i < length; i++) {
-        curData[i] = 0;
-        readsDone[i] = false;
-    }
+    assert(readChunks.empty());
+    completedReadChunks = 0;
+
+    // Translations may be stale after the previous operation
+    readTranslation.valid = false;
+    writeTranslation.valid = false;
 
     if (!tickEvent.scheduled()) {
-        schedule(tickEvent, nextCycle() + driverDelay);
+        schedule(tickEvent, nextCycle() + delay);
     }
-
-    return 0;
 }
 
-int GPUCopyEngine::memset(Addr dst, int value, size_t length)
+void GPUCopyEngine::finishTranslation(PageTranslation *page_trans,
+                                      const Fault &fault)
 {
-    assert(!running && !readPort && !readDTB);
-    readPort = &hostPort;
-    readDTB = hostDTB;
-    writePort = &devicePort;
-    writeDTB = deviceDTB;
-
-    assert(length > 0);
-    running = true;
-
-    DPRINTF(GPUCopyEngine, "Initiating memset of %d bytes at 0x%x to %d\n", length, dst, value);
-    memCpyStartTime = curTick();
-    memCpyLength = length;
-
-    needToRead = false;
-    needToWrite = true;
-
-    currentWriteAddr = dst;
-
-    readLeft = 0;
-    writeLeft = length;
-
-    totalLength = length;
-
-    readDone = length;
-    writeDone = 0;
-
-    curData = new uint8_t[length];
-    readsDone = new bool[length];
-    for (int i = 0; i < length; i++) {
-        curData[i] = value;
-        readsDone[i] = true;
+    Addr vaddr = page_trans->tlbReq.getVaddr();
+    if (fault != NoFault) {
+        panic("Translation encountered fault (%s) for address 0x%x", fault->name(), vaddr);
     }
-
-    if (!tickEvent.scheduled()) {
-        schedule(tickEvent, nextCycle() + driverDelay);
+    DPRINTF(GPUCopyEngine, "Finished translation of Vaddr 0x%x -> Paddr 0x%x\n", vaddr, page_trans->tlbReq.getPaddr());
+    assert(page_trans->pending);
+    page_trans->pending = false;
+
+    if (page_trans->stale) {
+        // The translation was shot down while it was outstanding, so the
+        // next access translates the page again
+        DPRINTF(GPUCopyEngine, "Dropping stale translation of 0x%x\n", vaddr);
+        page_trans->stale = false;
+        if (running && !tickEvent.scheduled()) {
+            schedule(tickEvent, nextCycle());
+        }
+        return;
     }
 
-    return 0;
+    Addr offset = vaddr % TheISA::PageBytes;
+    page_trans->vpage = vaddr - offset;
+    page_trans->ppage = page_trans->tlbReq.getPaddr() - offset;
+    page_trans->valid = true;
+
+    if (running && !tickEvent.scheduled()) {
+        schedule(tickEvent, nextCycle());
+    }
 }
 
-void GPUCopyEngine::finishTranslation(WholeTranslationState *state)
+void GPUCopyEngine::flushTranslations()
 {
-    if (state->getFault() != NoFault) {
-        panic("Translation encountered fault (%s) for address 0x%x", state->getFault()->name(), state->mainReq->getVaddr());
-    }
-    DPRINTF(GPUCopyEngine, "Finished translation of Vaddr 0x%x -> Paddr 0x%x\n", state->mainReq->getVaddr(), state->mainReq->getPaddr());
-    PacketPtr pkt;
-    if (state->mode == BaseTLB::Read) {
-        pkt = new Packet(state->mainReq, MemCmd::ReadReq);
-        pkt->allocate();
-        readPort->sendPacket(pkt);
-    } else if (state->mode == BaseTLB::Write) {
-        pkt = new Packet(state->mainReq, MemCmd::WriteReq);
-        uint8_t *pkt_data = (uint8_t *)state->mainReq->getExtraData();
-        pkt->dataDynamic(pkt_data);
-        writePort->sendPacket(pkt);
-    } else {
-        panic("Finished translation of unknown mode: %d\n", state->mode);
-    }
-    delete state;
+    DPRINTF(GPUCopyEngine, "Flushing page translations\n");
+    readTranslation.valid = false;
+    readTranslation.stale = readTranslation.pending;
+    writeTranslation.valid = false;
+    writeTranslation.stale = writeTranslation.pending;
 }
 
 BaseMasterPort&
@@ -445,6 +637,18 @@ void GPUCopyEngine::regStats() {
         .name(name() + ".opTimeTicks")
         .desc("Total time spent in copy/memset operations")
         ;
+    numQueuedOperations
+        .name(name() + ".queuedOperations")
+        .desc("Number of operations queued behind a running operation")
+        ;
+    numSegments
+        .name(name() + ".segments")
+        .desc("Number of contiguous segments in copy/memset operations")
+        ;
+    numPageTranslations
+        .name(name() + ".pageTranslations")
+        .desc("Number of page translations requested from the TLBs")
+        ;
 }
 
 GPUCopyEngine *GPUCopyEngineParams::create() {
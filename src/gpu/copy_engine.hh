@@ -29,8 +29,13 @@
 #ifndef __GPGPU_COPY_ENGINE_HH__
 #define __GPGPU_COPY_ENGINE_HH__
 
+#include <deque>
+#include <queue>
+#include <vector>
+
 #include "base/callback.hh"
 #include "cpu/translation.hh"
+#include "gpu/copy_descriptor.hh"
 #include "mem/mem_object.hh"
 #include "params/GPUCopyEngine.hh"
 #include "stream_manager.h"
@@ -133,19 +138,102 @@ private:
     ShaderTLB *readDTB;
     ShaderTLB *writeDTB;
 
+    // Queued copy operations. The front descriptor is the running one.
+    std::queue<CopyDescriptor> descriptors;
+    void startCopy(Tick delay);
+
     bool needToRead;
     bool needToWrite;
-    Addr currentReadAddr;
-    Addr currentWriteAddr;
-    Addr beginAddr;
+
+    // The segment and offset within it of the next read and write
+    unsigned readSegment;
+    size_t readSegmentOffset;
+    unsigned writeSegment;
+    size_t writeSegmentOffset;
+
+    /**
+     * Holds the data of a single (at most cache line sized) read or write.
+     * Chunks are attached to their packets and recycled after use.
+     */
+    class CopyChunk : public Packet::SenderState
+    {
+      public:
+        CopyChunk(unsigned line_size) :
+            offset(0), size(0), done(false), data(new uint8_t[line_size]) {}
+        ~CopyChunk() { delete [] data; }
+
+        // The location of the chunk's data in the transfer
+        Tick offset;
+        unsigned size;
+        // For reads, whether the data has been returned
+        bool done;
+        uint8_t *data;
+    };
+    std::vector<CopyChunk*> freeChunks;
+    CopyChunk *allocateChunk(Tick offset, unsigned size);
+    void releaseChunk(CopyChunk *chunk);
+
+    // Requests are also recycled after their packets complete
+    std::vector<RequestPtr> freeRequests;
+    RequestPtr allocateRequest();
+
+    // Reads in transfer order that have not been completely consumed by
+    // writes. The first completedReadChunks of them have returned their data.
+    std::deque<CopyChunk*> readChunks;
+    size_t completedReadChunks;
+
+    /**
+     * The most recent translation of each side of the copy. Every line in
+     * the page uses this translation rather than accessing the TLB again.
+     * Each side has at most one translation outstanding, so the request
+     * sent to the TLB and the translation callback are reused for every
+     * page rather than being allocated per translation.
+     */
+    class PageTranslation : public BaseTLB::Translation
+    {
+      public:
+        PageTranslation(GPUCopyEngine *_engine) :
+            engine(_engine), vpage(0), ppage(0), valid(false),
+            pending(false), stale(false) {}
+        GPUCopyEngine *engine;
+        Addr vpage;
+        Addr ppage;
+        bool valid;
+        bool pending;
+        // Shot down while pending, so the result must be translated again
+        bool stale;
+        Request tlbReq;
+        void markDelayed() {}
+        void finish(const Fault &fault, RequestPtr req, ThreadContext *tc,
+                    BaseTLB::Mode mode)
+        {
+            engine->finishTranslation(this, fault);
+        }
+    };
+    PageTranslation readTranslation;
+    PageTranslation writeTranslation;
+
+    // Shootdowns in either TLB invalidate the cached page translations
+    class TranslationFlushCallback : public Callback
+    {
+        GPUCopyEngine *engine;
+
+      public:
+        TranslationFlushCallback(GPUCopyEngine *_engine) : engine(_engine) {}
+        void process() { engine->flushTranslations(); }
+    };
+    TranslationFlushCallback translationFlushCallback;
+    void flushTranslations();
+    bool translate(PageTranslation &page_trans, ShaderTLB *tlb,
+                   BaseTLB::Mode mode, Addr vaddr, unsigned size,
+                   Addr &paddr);
+
     Tick writeLeft;
     Tick writeDone;
     Tick readLeft;
     Tick readDone;
     Tick totalLength;
 
-    uint8_t *curData;
-    bool *readsDone;
     bool running;
 
     void tryRead();
@@ -167,8 +255,14 @@ private:
 public:
 
     GPUCopyEngine(const Params *p);
+    ~GPUCopyEngine();
     virtual BaseMasterPort& getMasterPort(const std::string &if_name, PortID idx = -1);
-    void finishTranslation(WholeTranslationState *state);
+    void finishTranslation(PageTranslation *page_trans, const Fault &fault);
+    /**
+     * Queue a copy operation. Operations that are queued behind a running
+     * operation start as soon as it completes, without the driver delay.
+     */
+    void copy(const CopyDescriptor &desc);
     int memcpy(Addr src, Addr dst, size_t length, stream_operation_type type);
     int memset(Addr dst, int value, size_t length);
     void recvPacket(PacketPtr pkt);
@@ -187,6 +281,9 @@ public:
     Stats::Scalar bytesRead;
     Stats::Scalar bytesWritten;
     Stats::Scalar operationTimeTicks;
+    Stats::Scalar numQueuedOperations;
+    Stats::Scalar numSegments;
+    Stats::Scalar numPageTranslations;
     void regStats();
 };
 
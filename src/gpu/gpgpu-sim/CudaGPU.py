@@ -61,6 +61,25 @@ class CudaGPU(ClockedObject):
                 "Whether to allow accesses to host page table")
     gpu_memory_range = Param.AddrRange(AddrRange('1kB'), "The address range for the GPU memory space")
 
+    # In split mode, managed memory migrates between host and GPU memory in
+    # units of the migration size. The GPU memory used for managed data can
+    # be limited to study oversubscription.
+    managed_migration_size = Param.MemorySize('4kB', "Granularity of managed memory migrations (multiple of the page size)")
+    managed_memory_limit = Param.MemorySize('0B', "GPU memory available to managed data (0 => all free GPU memory)")
+    host_region_size = Param.MemorySize('1GB', "Size of the region of the process' mmap space reserved for mapped pinned and managed host allocations")
+
+    # In split mode, device pages can be placed across the device directories.
+    # The directory count and NUMA high bit must match the Ruby directories.
+    num_dev_dirs = Param.Unsigned(1, "Number of device directories")
+    dev_numa_high_bit = Param.Unsigned(0, "High order address bit selecting the device directory (0 => just above the cache block offset)")
+    page_placement = Param.String('linear', "Device page placement policy: linear, interleave or first_touch")
+
+    # In split mode, device memory can bypass the TLBs and the GPU page table
+    # and translate with a base/limit check, like a direct segment. Identity
+    # translation places device memory at virtual addresses equal to its
+    # physical addresses. Both require linear page placement.
+    device_translation = Param.String('pagetable', "Device memory translation: pagetable, segment or identity")
+
     shader_mmu = Param.ShaderMMU(ShaderMMU(), "Memory managment unit for this GPU")
 
     # Wrapper class to clock the GPGPU-Sim side shader cores and interconnect
@@ -68,6 +87,12 @@ class CudaGPU(ClockedObject):
     cores_wrapper = Param.GPGPUSimComponentWrapper("Must define a wrapper to clock the GPGPU-Sim cores")
     icnt_wrapper = Param.GPGPUSimComponentWrapper("Must define a wrapper to clock the GPGPU-Sim interconnect")
 
+    # The component wrappers can sleep through cycles in which their
+    # components have no work (e.g. all cores are waiting on memory). This
+    # requires building with GPGPU_SIM_CYCLE_SKIP and a GPGPU-Sim that
+    # supports it.
+    skip_idle_core_cycles = Param.Bool(False, "Skip simulating GPU component cycles in which the component has no work (e.g. all cores are waiting on memory)")
+
     # TODO: Eventually, we want to remove the need for the GPGPU-Sim L2 cache
     # and DRAM. Currently, these are necessary to handle parameter memory
     # accesses.
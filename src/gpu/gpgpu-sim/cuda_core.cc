@@ -30,6 +30,7 @@
 #include <iostream>
 #include <map>
 
+#include "config/gpgpu_sim_cycle_skip.hh"
 #include "cpu/translation.hh"
 #include "debug/CudaCore.hh"
 #include "debug/CudaCoreAccess.hh"
@@ -57,7 +58,7 @@ CudaCore::CudaCore(const Params *p) :
 
     warpSize = cudaGPU->getWarpSize();
 
-    signalKernelFinish = false;
+    pendingKernelFinishes = 0;
 
     if (p->port_lsq_port_connection_count != warpSize) {
         panic("Shader core lsq_port size != to warp size\n");
@@ -71,6 +72,8 @@ CudaCore::CudaCore(const Params *p) :
 
     activeCTAs = 0;
 
+    outstandingLSQAccesses = 0;
+
     needsFenceUnblock.resize(maxNumWarpsPerCore);
     for (int i = 0; i < maxNumWarpsPerCore; i++) {
         needsFenceUnblock[i] = false;
@@ -234,6 +237,7 @@ CudaCore::recvInstResp(PacketPtr pkt)
     DPRINTF(CudaCoreFetch, "Finished fetch on vaddr 0x%x\n",
             pkt->req->getVaddr());
 
+    cudaGPU->wakeupCores();
     shaderImpl->accept_fetch_response(iter->second);
 
     busyInstCacheLineAddrs.erase(iter);
@@ -252,6 +256,13 @@ CudaCore::executeMemOp(const warp_inst_t &inst)
            inst.op == MEMORY_BARRIER_OP);
     assert(inst.valid());
 
+    if (pendingKernelFinishes > 0) {
+        // Other kernels' warps may still be running on this core, but the
+        // LSQ cannot accept requests until the kernel end flush completes
+        DPRINTF(CudaCoreAccess, "Stalling memory op during kernel flush\n");
+        return true;
+    }
+
     // for debugging
     bool completed = false;
 
@@ -395,6 +406,10 @@ CudaCore::executeMemOp(const warp_inst_t &inst)
                 return true;
             } else {
                 completed = true;
+                if (inst.is_load() || inst.op == BARRIER_OP ||
+                    inst.op == MEMORY_BARRIER_OP) {
+                    outstandingLSQAccesses++;
+                }
             }
         }
     }
@@ -418,6 +433,8 @@ CudaCore::recvLSQDataResp(PacketPtr pkt, int lane_id)
     warp_inst_t &inst = ((SenderState*)pkt->senderState)->inst;
     assert(!inst.empty() && inst.valid());
 
+    cudaGPU->wakeupCores();
+
     if (pkt->isRead()) {
         if (!shaderImpl->ldst_unit_wb_inst(inst)) {
             // Writeback register is occupied, stall
@@ -458,6 +475,9 @@ CudaCore::recvLSQDataResp(PacketPtr pkt, int lane_id)
         }
     }
 
+    assert(outstandingLSQAccesses > 0);
+    outstandingLSQAccesses--;
+
     delete pkt->senderState;
     delete pkt->req;
     delete pkt;
@@ -468,11 +488,15 @@ CudaCore::recvLSQDataResp(PacketPtr pkt, int lane_id)
 void
 CudaCore::recvLSQControlResp(PacketPtr pkt)
 {
+    cudaGPU->wakeupCores();
+
     if (pkt->isFlush()) {
         DPRINTF(CudaCoreAccess, "Got flush response\n");
-        if (signalKernelFinish) {
+        // The flush drained all accesses, so it covers every kernel that
+        // finished while it was in progress
+        while (pendingKernelFinishes > 0) {
             shaderImpl->finish_kernel();
-            signalKernelFinish = false;
+            pendingKernelFinishes--;
         }
     } else {
         panic("Received unhandled packet type in control port");
@@ -488,6 +512,31 @@ CudaCore::writebackClear()
     writebackBlocked = -1;
 }
 
+bool
+CudaCore::isIdle()
+{
+    // A blocked writeback or instruction fetch must be retried by cycling
+    if (writebackBlocked >= 0 || stallOnICacheRetry) {
+        return false;
+    }
+
+    // An empty core may be assigned a new CTA on its next cycle
+    if (activeCTAs == 0 && cudaGPU->getTheGPU()->get_more_cta_left()) {
+        return false;
+    }
+
+#if GPGPU_SIM_CYCLE_SKIP
+    // Warps that can fetch, decode or issue, and instructions still moving
+    // through the operand collectors, functional units or writeback, all
+    // change the core's state on its next cycle
+    return !shaderImpl->has_ready_warps() && shaderImpl->pipelines_empty();
+#else
+    // Without GPGPU-Sim's pipeline state queries, the core's next cycle
+    // cannot be shown to be idle
+    return false;
+#endif
+}
+
 void
 CudaCore::flush()
 {
@@ -507,8 +556,12 @@ void
 CudaCore::finishKernel()
 {
     numKernelsCompleted++;
-    signalKernelFinish = true;
-    flush();
+    pendingKernelFinishes++;
+    if (pendingKernelFinishes == 1) {
+        flush();
+    } else {
+        DPRINTF(CudaCoreAccess, "Kernel finished during flush, merging\n");
+    }
 }
 
 bool
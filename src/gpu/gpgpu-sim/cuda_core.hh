@@ -218,8 +218,10 @@ class CudaCore : public MemObject
     std::vector<bool> needsFenceUnblock;
     unsigned maxNumWarpsPerCore;
 
-    // if true then need to signal GPGPU-Sim once cleanup is done
-    bool signalKernelFinish;
+    // Number of kernels that finished on this core and need to be signaled
+    // to GPGPU-Sim once cleanup (i.e. the LSQ flush) is done. More than one
+    // kernel may finish during a flush when kernels run concurrently.
+    int pendingKernelFinishes;
 
     // Returns the line of the address, a
     Addr addrToLine(Addr a);
@@ -229,6 +231,10 @@ class CudaCore : public MemObject
 
     Cycles lastActiveCycle;
 
+    // Number of lane accesses sent to the LSQ that will return a response
+    // to this core (i.e. loads, atomics and fences)
+    int outstandingLSQAccesses;
+
     std::map<unsigned, bool> coreCTAActive;
     std::map<unsigned, std::vector<Tick> > coreCTAActiveStats;
     Cycles beginActiveCycle;
@@ -303,6 +309,22 @@ class CudaCore : public MemObject
      */
     void writebackClear();
 
+    /**
+     * Returns true if no warp on the core is ready, its pipelines are empty
+     * and it is not waiting to retry a memory access, so that cycling it
+     * cannot change its state until an access returns.
+     */
+    bool isIdle();
+
+    /**
+     * Returns true if the core has gem5-side memory accesses in flight that
+     * will respond to it (and wake up the cores wrapper if it is sleeping)
+     */
+    bool hasOutstandingAccesses() {
+        return outstandingLSQAccesses > 0 || !busyInstCacheLineAddrs.empty() ||
+               pendingKernelFinishes > 0;
+    }
+
     /**
      * Flush the core of all pending instructions,
      * This is currently used to force the LSQ to flush on kernel end
@@ -37,6 +37,7 @@
 #include "arch/utility.hh"
 #include "arch/vtophys.hh"
 #include "base/chunk_generator.hh"
+#include "base/intmath.hh"
 #include "base/statistics.hh"
 #include "cpu/thread_context.hh"
 #include "cuda-sim/cuda-sim.h"
@@ -45,11 +46,13 @@
 #include "debug/CudaGPUAccess.hh"
 #include "debug/CudaGPUPageTable.hh"
 #include "debug/CudaGPUTick.hh"
+#include "gpgpu-sim/icnt_wrapper.h"
 #include "gpu/gpgpu-sim/cuda_gpu.hh"
 #include "mem/ruby/system/System.hh"
 #include "params/GPGPUSimComponentWrapper.hh"
 #include "params/CudaGPU.hh"
 #include "sim/full_system.hh"
+#include "sim/process.hh"
 #include "gpgpusim_entrypoint.h"
 
 using namespace std;
@@ -66,13 +69,17 @@ CudaGPU::CudaGPU(const Params *p) :
     clkDomain((SrcClockDomain*)p->clk_domain),
     coresWrapper(*p->cores_wrapper), icntWrapper(*p->icnt_wrapper),
     l2Wrapper(*p->l2_wrapper), dramWrapper(*p->dram_wrapper),
+    skipIdleCoreCycles(p->skip_idle_core_cycles),
     system(p->sys), warpSize(p->warp_size), sharedMemDelay(p->shared_mem_delay),
-    gpgpusimConfigPath(p->config_path), unblockNeeded(false), ruby(p->ruby),
-    runningTC(NULL), runningStream(NULL), runningTID(-1), runningPTBase(0),
+    gpgpusimConfigPath(p->config_path), ruby(p->ruby),
+    runningTC(NULL), runningTID(-1), runningPTBase(0),
+    lastCopyOverlapUpdate(0), nextStreamHandle(1), nextEventHandle(1),
     clearTick(0), dumpKernelStats(p->dump_kernel_stats), pageTable(),
     manageGPUMemory(p->manage_gpu_memory),
     accessHostPageTable(p->access_host_pagetable),
-    gpuMemoryRange(p->gpu_memory_range), shaderMMU(p->shader_mmu)
+    gpuMemoryRange(p->gpu_memory_range),
+    managedMigrationSize(p->managed_migration_size),
+    managedMemoryLimit(p->managed_memory_limit), shaderMMU(p->shader_mmu)
 {
     // Register this device as a CUDA-enabled GPU
     cudaDeviceID = registerCudaDevice(this);
@@ -83,8 +90,6 @@ CudaGPU::CudaGPU(const Params *p) :
 
     streamDelay = 1;
 
-    running = false;
-
     streamScheduled = false;
 
     restoring = false;
@@ -96,9 +101,97 @@ CudaGPU::CudaGPU(const Params *p) :
     instBaseVaddr = 0;
     instBaseVaddrSet = false;
     localBaseVaddr = 0;
-    // Reserve the 0 virtual page for NULL pointers
-    virtualGPUBrkAddr = TheISA::PageBytes;
-    physicalGPUBrkAddr = gpuMemoryRange.start();
+    deviceAllocator = NULL;
+    mappedHostAllocator = NULL;
+    hostRegionSize = roundUp((size_t)p->host_region_size, TheISA::PageBytes);
+    hostRegionBase = 0;
+    hostRegionAllocator = NULL;
+    deviceVaddrBase = 0;
+    mappedHostVaddrBase = 0;
+    virtualGPUMemoryEnd = 0;
+    if (p->device_translation == "pagetable") {
+        deviceSegment = false;
+    } else if (p->device_translation == "segment" ||
+               p->device_translation == "identity") {
+        deviceSegment = true;
+        if (!manageGPUMemory) {
+            fatal("%s: Device memory %s translation requires a split "
+                  "address space\n", name(), p->device_translation);
+        }
+    } else {
+        fatal("%s: Unknown device memory translation: %s\n", name(),
+              p->device_translation);
+    }
+    if (manageGPUMemory) {
+        // Reserve the 0 virtual page for NULL pointers, unless device memory
+        // is identity mapped. Allocations are aligned to cache blocks, and
+        // mapped host memory to pages.
+        deviceVaddrBase = TheISA::PageBytes;
+        if (p->device_translation == "identity") {
+            deviceVaddrBase = gpuMemoryRange.start();
+            if (deviceVaddrBase == 0) {
+                fatal("%s: Identity translation requires GPU memory above "
+                      "physical address 0\n", name());
+            }
+        }
+        deviceAllocator = new GPUMemoryAllocator(deviceVaddrBase,
+                gpuMemoryRange.size(), ruby->getBlockSizeBytes());
+        mappedHostVaddrBase = deviceVaddrBase + gpuMemoryRange.size();
+        mappedHostAllocator = new GPUMemoryAllocator(mappedHostVaddrBase,
+                gpuMemoryRange.size(), TheISA::PageBytes);
+        virtualGPUMemoryEnd = mappedHostVaddrBase + gpuMemoryRange.size();
+    }
+
+    if (!managedMigrationSize ||
+        managedMigrationSize % TheISA::PageBytes != 0) {
+        fatal("%s: Managed memory migration size (%d B) must be a multiple "
+              "of the page size\n", name(), managedMigrationSize);
+    }
+    managedFrameBytes = 0;
+
+    // Device page placement
+    if (p->page_placement == "linear") {
+        pagePlacement = LinearPlacement;
+    } else if (p->page_placement == "interleave") {
+        pagePlacement = InterleavePlacement;
+    } else if (p->page_placement == "first_touch") {
+        pagePlacement = FirstTouchPlacement;
+    } else {
+        fatal("%s: Unknown page placement policy: %s\n", name(),
+              p->page_placement);
+    }
+    numDevDirs = std::max(p->num_dev_dirs, 1U);
+    if (!isPowerOf2(numDevDirs)) {
+        fatal("%s: Number of device directories (%d) must be a power of 2\n",
+              name(), numDevDirs);
+    }
+    // Match the Ruby directory mapping: the directory bits are just above
+    // the cache block offset unless the NUMA high bit is set
+    if (p->dev_numa_high_bit) {
+        devDirLowBit = p->dev_numa_high_bit - floorLog2(numDevDirs) + 1;
+    } else {
+        devDirLowBit = floorLog2(ruby->getBlockSizeBytes());
+    }
+    nextInterleaveDir = 0;
+    if (deviceSegment && pagePlacement != LinearPlacement) {
+        fatal("%s: Device memory %s translation requires linear page "
+              "placement\n", name(), p->device_translation);
+    }
+    if (pagePlacement != LinearPlacement) {
+        if (!manageGPUMemory) {
+            fatal("%s: Page placement requires a split address space\n",
+                  name());
+        }
+        if (numDevDirs > 1 &&
+            ((Addr)1 << devDirLowBit) < TheISA::PageBytes) {
+            fatal("%s: Page placement requires the device directories to be "
+                  "interleaved at page granularity or coarser. Set the "
+                  "device NUMA high bit to at least %d.\n", name(),
+                  floorLog2(TheISA::PageBytes) + floorLog2(numDevDirs) - 1);
+        }
+        freeDirFrames.resize(numDevDirs);
+        nextDirFrame.resize(numDevDirs, gpuMemoryRange.start());
+    }
 
     // Initialize GPGPU-Sim
     theGPU = gem5_ptx_sim_init_perf(&streamManager, this, getConfigPath());
@@ -119,6 +212,23 @@ CudaGPU::CudaGPU(const Params *p) :
     l2Wrapper.setStartCycleFunction(&gpgpu_sim::l2_cycle);
     dramWrapper.setGPU(theGPU);
     dramWrapper.setStartCycleFunction(&gpgpu_sim::dram_cycle);
+    if (skipIdleCoreCycles) {
+        // Skipping idle cycles needs GPGPU-Sim to report when its components
+        // are idle and to fast-forward their cycle counters
+#if GPGPU_SIM_CYCLE_SKIP
+        coresWrapper.setSkipCyclesFunction(&gpgpu_sim::core_skip_cycles);
+        coresWrapper.setCudaGPU(this);
+        icntWrapper.setSkipCyclesFunction(&gpgpu_sim::icnt_skip_cycles);
+        icntWrapper.setCudaGPU(this);
+        l2Wrapper.setSkipCyclesFunction(&gpgpu_sim::l2_skip_cycles);
+        l2Wrapper.setCudaGPU(this);
+        dramWrapper.setSkipCyclesFunction(&gpgpu_sim::dram_skip_cycles);
+        dramWrapper.setCudaGPU(this);
+#else
+        fatal("%s: Skipping idle cycles requires a GPGPU-Sim build with "
+              "cycle skipping support (GPGPU_SIM_CYCLE_SKIP)\n", name());
+#endif
+    }
 
     // Setup the device properties for this GPU
     snprintf(deviceProperties.name, 256, "GPGPU-Sim_v%s", g_gpgpusim_version_string);
@@ -143,6 +253,10 @@ CudaGPU::CudaGPU(const Params *p) :
 #if (CUDART_VERSION >= 2010)
     deviceProperties.multiProcessorCount = theGPU->get_config().num_shader();
 #endif
+#if (CUDART_VERSION >= 2020)
+    // Mapped pinned host memory is only supported in syscall emulation mode
+    deviceProperties.canMapHostMemory = FullSystem ? 0 : 1;
+#endif
 
     // Print gpu configuration and stats at exit
     GPUExitCallback* gpuExitCB = new GPUExitCallback(this, p->stats_filename);
@@ -153,9 +267,12 @@ CudaGPU::CudaGPU(const Params *p) :
 void CudaGPU::serialize(CheckpointOut &cp) const
 {
     DPRINTF(CudaGPU, "Serializing\n");
-    if (running) {
+    if (!runningStreams.empty()) {
         panic("Checkpointing during GPU execution not supported\n");
     }
+    if (!pendingGPUMemoryFrees.empty()) {
+        panic("Checkpointing with deferred GPU memory frees not supported\n");
+    }
 
     SERIALIZE_SCALAR(m_last_fat_cubin_handle);
     SERIALIZE_SCALAR(instBaseVaddr);
@@ -199,6 +316,77 @@ void CudaGPU::serialize(CheckpointOut &cp) const
     }
 
     pageTable.serialize(cp);
+    if (deviceAllocator) {
+        deviceAllocator->serialize("deviceAllocator", cp);
+    }
+    if (mappedHostAllocator) {
+        mappedHostAllocator->serialize("mappedHostAllocator", cp);
+    }
+
+    if (hostRegionAllocator) {
+        SERIALIZE_SCALAR(hostRegionBase);
+        SERIALIZE_SCALAR(hostRegionSize);
+        hostRegionAllocator->serialize("hostRegionAllocator", cp);
+    }
+
+    int numHostAllocations = hostAllocations.size();
+    SERIALIZE_SCALAR(numHostAllocations);
+    map<Addr, _HostAllocation>::const_iterator host_iter =
+        hostAllocations.begin();
+    for (int i = 0; host_iter != hostAllocations.end(); ++host_iter) {
+        paramOut(cp, csprintf("hostAllocations[%d].vaddr", i),
+                 host_iter->first);
+        paramOut(cp, csprintf("hostAllocations[%d].size", i),
+                 host_iter->second.size);
+        paramOut(cp, csprintf("hostAllocations[%d].deviceVaddr", i),
+                 host_iter->second.deviceVaddr);
+        i++;
+    }
+
+    if (pagePlacement != LinearPlacement) {
+        for (unsigned i = 0; i < numDevDirs; i++) {
+            paramOut(cp, csprintf("nextDirFrame[%d]", i), nextDirFrame[i]);
+            arrayParamOut(cp, csprintf("freeDirFrames[%d]", i),
+                          freeDirFrames[i]);
+        }
+        vector<Addr> unplaced(unplacedPages.begin(), unplacedPages.end());
+        arrayParamOut(cp, "unplacedPages", unplaced);
+    }
+
+    // Managed memory. Unit frames are allocated from device memory, so they
+    // are restored with the device allocator and the page table
+    int numManagedAllocations = managedAllocations.size();
+    SERIALIZE_SCALAR(numManagedAllocations);
+    map<Addr, size_t>::const_iterator alloc_iter = managedAllocations.begin();
+    for (int i = 0; alloc_iter != managedAllocations.end(); ++alloc_iter) {
+        paramOut(cp, csprintf("managedAllocations[%d].base", i),
+                 alloc_iter->first);
+        paramOut(cp, csprintf("managedAllocations[%d].size", i),
+                 alloc_iter->second);
+        i++;
+    }
+    if (!evictingManagedFrames.empty()) {
+        panic("Checkpointing during managed memory eviction not supported\n");
+    }
+    int numManagedUnits = managedUnits.size();
+    SERIALIZE_SCALAR(numManagedUnits);
+    map<Addr, _ManagedUnit>::const_iterator unit_iter = managedUnits.begin();
+    for (int i = 0; unit_iter != managedUnits.end(); ++unit_iter) {
+        const _ManagedUnit &unit = unit_iter->second;
+        if (unit.migrating) {
+            panic("Checkpointing during managed memory migration not "
+                  "supported\n");
+        }
+        paramOut(cp, csprintf("managedUnits[%d].base", i), unit_iter->first);
+        paramOut(cp, csprintf("managedUnits[%d].size", i), unit.size);
+        paramOut(cp, csprintf("managedUnits[%d].frame", i), unit.frame);
+        paramOut(cp, csprintf("managedUnits[%d].resident", i), unit.resident);
+        i++;
+    }
+    vector<Addr> resident_units(residentManagedUnits.begin(),
+                                residentManagedUnits.end());
+    arrayParamOut(cp, "residentManagedUnits", resident_units);
+    SERIALIZE_SCALAR(managedFrameBytes);
 }
 
 void CudaGPU::unserialize(CheckpointIn &cp)
@@ -255,6 +443,88 @@ void CudaGPU::unserialize(CheckpointIn &cp)
     }
 
     pageTable.unserialize(cp);
+    if (deviceAllocator) {
+        if (!deviceAllocator->unserialize("deviceAllocator", cp)) {
+            warn("Checkpoint has no GPU memory allocator state. Memory "
+                 "allocated before the checkpoint may be reallocated.\n");
+        }
+        updateDeviceMemoryStats();
+    }
+    if (mappedHostAllocator &&
+        !mappedHostAllocator->unserialize("mappedHostAllocator", cp)) {
+        warn("Checkpoint has no mapped host memory allocator state. Mapped "
+             "host memory allocated before the checkpoint may be "
+             "reallocated.\n");
+    }
+
+    if (optParamIn(cp, "hostRegionBase", hostRegionBase)) {
+        // The process' checkpoint already accounts for the reserved region
+        UNSERIALIZE_SCALAR(hostRegionSize);
+        hostRegionAllocator = new GPUMemoryAllocator(hostRegionBase,
+                hostRegionSize, TheISA::PageBytes);
+        if (!hostRegionAllocator->unserialize("hostRegionAllocator", cp)) {
+            fatal("Checkpoint has no host region allocator state\n");
+        }
+    }
+
+    int numHostAllocations;
+    if (optParamIn(cp, "numHostAllocations", numHostAllocations)) {
+        hostAllocations.clear();
+        for (int i = 0; i < numHostAllocations; i++) {
+            Addr vaddr;
+            paramIn(cp, csprintf("hostAllocations[%d].vaddr", i), vaddr);
+            _HostAllocation &alloc = hostAllocations[vaddr];
+            paramIn(cp, csprintf("hostAllocations[%d].size", i), alloc.size);
+            paramIn(cp, csprintf("hostAllocations[%d].deviceVaddr", i),
+                    alloc.deviceVaddr);
+        }
+    }
+
+    if (pagePlacement != LinearPlacement) {
+        if (!optParamIn(cp, "nextDirFrame[0]", nextDirFrame[0])) {
+            fatal("Checkpoint has no device page placement state. Restore "
+                  "with linear page placement.\n");
+        }
+        for (unsigned i = 0; i < numDevDirs; i++) {
+            paramIn(cp, csprintf("nextDirFrame[%d]", i), nextDirFrame[i]);
+            arrayParamIn(cp, csprintf("freeDirFrames[%d]", i),
+                         freeDirFrames[i]);
+        }
+        vector<Addr> unplaced;
+        arrayParamIn(cp, "unplacedPages", unplaced);
+        unplacedPages.clear();
+        unplacedPages.insert(unplaced.begin(), unplaced.end());
+    }
+
+    int numManagedAllocations;
+    if (!optParamIn(cp, "numManagedAllocations", numManagedAllocations)) {
+        warn("Checkpoint has no managed memory state. Managed memory "
+             "allocated before the checkpoint is lost.\n");
+        return;
+    }
+    managedAllocations.clear();
+    for (int i = 0; i < numManagedAllocations; i++) {
+        Addr base;
+        size_t size;
+        paramIn(cp, csprintf("managedAllocations[%d].base", i), base);
+        paramIn(cp, csprintf("managedAllocations[%d].size", i), size);
+        managedAllocations[base] = size;
+    }
+    int numManagedUnits;
+    UNSERIALIZE_SCALAR(numManagedUnits);
+    managedUnits.clear();
+    for (int i = 0; i < numManagedUnits; i++) {
+        Addr base;
+        paramIn(cp, csprintf("managedUnits[%d].base", i), base);
+        _ManagedUnit &unit = managedUnits[base];
+        paramIn(cp, csprintf("managedUnits[%d].size", i), unit.size);
+        paramIn(cp, csprintf("managedUnits[%d].frame", i), unit.frame);
+        paramIn(cp, csprintf("managedUnits[%d].resident", i), unit.resident);
+    }
+    vector<Addr> resident_units;
+    arrayParamIn(cp, "residentManagedUnits", resident_units);
+    residentManagedUnits.assign(resident_units.begin(), resident_units.end());
+    UNSERIALIZE_SCALAR(managedFrameBytes);
 }
 
 void CudaGPU::startup()
@@ -322,16 +592,92 @@ void CudaGPU::streamTick() {
 
     streamScheduled = false;
 
-    // launch operation on device if one is pending and can be run
-    stream_operation op = streamManager->front();
-    op.do_operation(theGPU);
+    // Launch an operation on the device if one is pending and can be run.
+    // Operations that cannot start yet stay claimed until another stream's
+    // operation starts, so that front() moves on to the next ready stream
+    std::vector<stream_operation> deferred_ops;
+    Tick retry_tick = MaxTick;
+    bool started = false;
+    while (!started) {
+        stream_operation op = streamManager->front();
+        if (op.is_noop()) {
+            DPRINTF(CudaGPUTick, "No stream operation ready\n");
+            break;
+        }
+        if ((op.get_type() != stream_kernel_launch ||
+             canBeginKernel(op.get_kernel(), retry_tick)) &&
+            op.do_operation(theGPU)) {
+            started = true;
+        } else {
+            DPRINTF(CudaGPUTick, "Stream operation deferred\n");
+            deferred_ops.push_back(op);
+        }
+    }
+
+    // Return the deferred operations to their streams
+    std::vector<stream_operation>::iterator iter;
+    for (iter = deferred_ops.begin(); iter != deferred_ops.end(); ++iter) {
+        iter->get_stream()->cancel_front();
+    }
+
+    if (!started) {
+        // The completion of a running operation will schedule another
+        // attempt at the deferred operations. If none is running, or a
+        // kernel is waiting for its launch delay, retry
+        if (retry_tick != MaxTick) {
+            schedule(streamTickEvent, retry_tick);
+            streamScheduled = true;
+        } else if (runningStreams.empty() && copyStreams.empty() &&
+                   streamManager->ready()) {
+            schedule(streamTickEvent, curTick() + streamDelay);
+            streamScheduled = true;
+        }
+        return;
+    }
+    numStreamOperations++;
+
+    // Event records complete as soon as their stream reaches them
+    if (!pendingEvents.empty()) {
+        updateEvents();
+    }
 
+    // Back-to-back operations from other streams each incur the stream delay
     if (streamManager->ready()) {
         schedule(streamTickEvent, curTick() + streamDelay);
         streamScheduled = true;
     }
 }
 
+bool CudaGPU::canBeginKernel(kernel_info_t *kernel, Tick &retry_tick)
+{
+    if (runningKernels.empty()) {
+        // The launch delay is applied when the cores start cycling
+        return true;
+    }
+
+    map<unsigned, Tick>::iterator iter =
+        kernelLaunchTicks.find(kernel->get_uid());
+    if (iter != kernelLaunchTicks.end() &&
+        iter->second + launchDelay > curTick()) {
+        DPRINTF(CudaGPUTick, "Kernel %d waiting for its launch delay\n",
+                kernel->get_uid());
+        retry_tick = std::min(retry_tick, iter->second + launchDelay);
+        return false;
+    }
+    return true;
+}
+
+void CudaGPU::streamOperationDone()
+{
+    // Only schedule the stream event if there is an operation to execute.
+    // Otherwise, pushing the next operation will schedule it.
+    if (streamManager->ready()) {
+        scheduleStreamEvent();
+    } else {
+        DPRINTF(CudaGPUTick, "No stream operation ready, not scheduling\n");
+    }
+}
+
 void CudaGPU::scheduleStreamEvent() {
     if (streamScheduled) {
         DPRINTF(CudaGPUTick, "Already scheduled a tick, ignoring\n");
@@ -342,21 +688,133 @@ void CudaGPU::scheduleStreamEvent() {
     streamScheduled = true;
 }
 
+bool CudaGPU::coresIdle()
+{
+    // Responses from GPGPU-Sim-side memory (e.g. parameter memory) are
+    // delivered to the cores through the interconnect
+    if (::icnt_busy()) {
+        return false;
+    }
+
+    bool waiting_on_memory = false;
+    vector<CudaCore*>::iterator iter;
+    for (iter = cudaCores.begin(); iter != cudaCores.end(); ++iter) {
+        if (!(*iter)->isIdle()) {
+            return false;
+        }
+        waiting_on_memory |= (*iter)->hasOutstandingAccesses();
+    }
+
+    // Only sleep if some access will return to wake the cores back up
+    return waiting_on_memory;
+}
+
+bool CudaGPU::canComponentSleep(GPGPUSimComponentWrapper *component)
+{
+    if (!skipIdleCoreCycles) {
+        return false;
+    }
+
+#if GPGPU_SIM_CYCLE_SKIP
+    if (component == &coresWrapper) {
+        return coresIdle();
+    } else if (component == &icntWrapper) {
+        return !::icnt_busy();
+    } else if (component == &l2Wrapper) {
+        return !theGPU->l2_busy();
+    } else if (component == &dramWrapper) {
+        return !theGPU->dram_busy();
+    }
+#endif
+
+    return false;
+}
+
+void CudaGPU::componentCycled(GPGPUSimComponentWrapper *component)
+{
+    if (!skipIdleCoreCycles) {
+        return;
+    }
+
+    // Once the GPU goes idle, the components stop cycling. Wake them so
+    // they account for the cycles they skipped up to now.
+    if (!theGPU->active()) {
+        coresWrapper.wakeup();
+        icntWrapper.wakeup();
+        l2Wrapper.wakeup();
+        dramWrapper.wakeup();
+        return;
+    }
+
+    // Wake up any sleeping component that the simulated cycle handed work
+    // to. It resumes at its next clock edge.
+    if (::icnt_busy()) {
+        if (icntWrapper.isSleeping()) {
+            DPRINTF(CudaGPUTick, "Interconnect busy, waking it up\n");
+            icntWrapper.wakeup();
+        }
+        // The interconnect may hold a response headed for a core
+        if (coresWrapper.isSleeping()) {
+            DPRINTF(CudaGPUTick, "Interconnect busy, waking up cores\n");
+            coresWrapper.wakeup();
+        }
+    }
+#if GPGPU_SIM_CYCLE_SKIP
+    if (l2Wrapper.isSleeping() && theGPU->l2_busy()) {
+        DPRINTF(CudaGPUTick, "L2 busy, waking it up\n");
+        l2Wrapper.wakeup();
+    }
+    if (dramWrapper.isSleeping() && theGPU->dram_busy()) {
+        DPRINTF(CudaGPUTick, "DRAM busy, waking it up\n");
+        dramWrapper.wakeup();
+    }
+#endif
+}
+
 void CudaGPU::beginRunning(Tick stream_queued_time, struct CUstream_st *_stream)
 {
     beginStreamOperation(_stream);
 
-    DPRINTF(CudaGPU, "Beginning kernel execution at %llu\n", curTick());
-    kernelTimes.push_back(curTick());
+    kernel_info_t *kernel = _stream->front().get_kernel();
+    unsigned grid_id = kernel->get_uid();
+
+    DPRINTF(CudaGPU, "Beginning kernel %d execution at %llu\n", grid_id,
+            curTick());
+    if (runningKernels.empty()) {
+        // The GPU becomes busy
+        kernelTimes.push_back(curTick());
+    }
     if (dumpKernelStats) {
         Stats::dump();
         Stats::reset();
     }
     numKernelsStarted++;
-    if (running) {
-        panic("Should not already be running if we are starting\n");
+    if (runningKernels.count(grid_id)) {
+        panic("Kernel %d should not already be running if we are starting\n",
+              grid_id);
+    }
+    kernelLaunchTicks.erase(grid_id);
+    updateCopyOverlap();
+    runningKernels[grid_id] = _stream;
+    concurrentKernels.sample(runningKernels.size());
+
+    _KernelRecord record;
+    record.gridId = grid_id;
+    record.start = curTick();
+    record.end = 0;
+    runningKernelRecords[grid_id] = kernelRecords.size();
+    kernelRecords.push_back(record);
+
+    if (coresWrapper.isRunning()) {
+        // Other kernels are already executing, and canBeginKernel held this
+        // kernel back until its launch delay passed. GPGPU-Sim distributes
+        // the CTAs of this kernel to cores as they free up resources, so the
+        // cores just need to be cycling to pick them up.
+        DPRINTF(CudaGPU, "Kernel %d running concurrently with %d others\n",
+                grid_id, runningKernels.size() - 1);
+        coresWrapper.wakeup();
+        return;
     }
-    running = true;
 
     Tick delay = clockPeriod();
     if ((stream_queued_time + launchDelay) > curTick()) {
@@ -381,24 +839,36 @@ void CudaGPU::processFinishKernelEvent(int grid_id)
 {
     DPRINTF(CudaGPU, "GPU finished a kernel id %d\n", grid_id);
 
+    map<unsigned, struct CUstream_st*>::iterator iter =
+        runningKernels.find(grid_id);
+    if (iter == runningKernels.end()) {
+        panic("Finished kernel %d is not running!\n", grid_id);
+    }
+    struct CUstream_st *stream = iter->second;
+    updateCopyOverlap();
+    runningKernels.erase(iter);
+
+    kernelRecords[runningKernelRecords[grid_id]].end = curTick();
+    runningKernelRecords.erase(grid_id);
+
     streamManager->register_finished_kernel(grid_id);
 
-    kernelTimes.push_back(curTick());
+    if (runningKernels.empty()) {
+        // The GPU becomes idle
+        kernelTimes.push_back(curTick());
+    }
     if (dumpKernelStats) {
         Stats::dump();
         Stats::reset();
     }
 
-    if (unblockNeeded && streamManager->empty()) {
-        DPRINTF(CudaGPU, "Stream manager is empty, unblocking\n");
-        unblockThread(runningTC);
-    }
-
-    scheduleStreamEvent();
+    endStreamOperation(stream);
 
-    running = false;
+    unblockThreads();
+    destroyCompletedStreams();
+    releasePendingGPUMemory();
 
-    endStreamOperation();
+    streamOperationDone();
 }
 
 CudaCore *CudaGPU::getCudaCore(int coreId)
@@ -434,6 +904,20 @@ void CudaGPU::gpuPrintStats(std::ostream& out) {
     }
     out << curTick() << "\n";
 
+    // Print the times of each kernel, which may overlap
+    out << "\nper-kernel times (ticks):\n";
+    out << "grid ID, start, end\n";
+    vector<_KernelRecord>::iterator record;
+    for (record = kernelRecords.begin(); record != kernelRecords.end();
+         record++) {
+        out << record->gridId << ", " << record->start << ", ";
+        if (record->end) {
+            out << record->end << "\n";
+        } else {
+            out << curTick() << " (unfinished)\n";
+        }
+    }
+
     // Print Shader CTA statistics
     out << "\nshader CTA times (ticks):\n";
     out << "shader, CTA ID, start, end, start, end, ..., exit\n";
@@ -464,14 +948,15 @@ void CudaGPU::printPTXFileLineStats() {
 }
 
 void CudaGPU::memcpy(void *src, void *dst, size_t count, struct CUstream_st *_stream, stream_operation_type type) {
-    beginStreamOperation(_stream);
-    copyEngine->memcpy((Addr)src, (Addr)dst, count, type);
+    CopyDescriptor desc;
+    if (!takeSegmentedCopy(_stream, false, (Addr)dst, count, desc)) {
+        desc.addSegment((Addr)src, (Addr)dst, count);
+    }
+    desc.type = type;
+    issueCopyOperation(desc, _stream);
 }
 
 void CudaGPU::memcpy_to_symbol(const char *hostVar, const void *src, size_t count, size_t offset, struct CUstream_st *_stream) {
-    // First, initialize the stream operation
-    beginStreamOperation(_stream);
-
     // Lookup destination address for transfer:
     std::string sym_name = gpgpu_ptx_sim_hostvar_to_sym_name(hostVar);
     std::map<std::string,symbol_table*>::iterator st = g_sym_name_to_symbol_table.find(sym_name.c_str());
@@ -484,13 +969,10 @@ void CudaGPU::memcpy_to_symbol(const char *hostVar, const void *src, size_t coun
     printf("GPGPU-Sim PTX: gpgpu_ptx_sim_memcpy_symbol: copying %zu bytes to symbol %s+%zu @0x%x ...\n",
            count, sym_name.c_str(), offset, dst);
 
-    copyEngine->memcpy((Addr)src, (Addr)dst, count, stream_memcpy_host_to_device);
+    memcpy((void*)src, (void*)(Addr)dst, count, _stream, stream_memcpy_host_to_device);
 }
 
 void CudaGPU::memcpy_from_symbol(void *dst, const char *hostVar, size_t count, size_t offset, struct CUstream_st *_stream) {
-    // First, initialize the stream operation
-    beginStreamOperation(_stream);
-
     // Lookup destination address for transfer:
     std::string sym_name = gpgpu_ptx_sim_hostvar_to_sym_name(hostVar);
     std::map<std::string,symbol_table*>::iterator st = g_sym_name_to_symbol_table.find(sym_name.c_str());
@@ -503,47 +985,212 @@ void CudaGPU::memcpy_from_symbol(void *dst, const char *hostVar, size_t count, s
     printf("GPGPU-Sim PTX: gpgpu_ptx_sim_memcpy_symbol: copying %zu bytes from symbol %s+%zu @0x%x ...\n",
            count, sym_name.c_str(), offset, src);
 
-    copyEngine->memcpy((Addr)src, (Addr)dst, count, stream_memcpy_device_to_host);
+    memcpy((void*)(Addr)src, dst, count, _stream, stream_memcpy_device_to_host);
 }
 
 void CudaGPU::memset(Addr dst, int value, size_t count, struct CUstream_st *_stream) {
+    CopyDescriptor desc;
+    if (!takeSegmentedCopy(_stream, true, dst, count, desc)) {
+        desc.addSegment(0, dst, count);
+    }
+    desc.isMemset = true;
+    desc.value = value;
+    issueCopyOperation(desc, _stream);
+}
+
+void CudaGPU::pushCopyOperation(stream_operation &op,
+                                const CopyDescriptor *desc)
+{
+    StreamCopies &copies = streamCopies[op.get_stream()];
+    if (desc) {
+        assert(!desc->segments.empty());
+        copies.segmented[copies.pushed] = *desc;
+    }
+    copies.pushed++;
+    streamManager->push(op);
+}
+
+bool CudaGPU::takeSegmentedCopy(struct CUstream_st *_stream, bool is_memset,
+                                Addr dst, size_t count, CopyDescriptor &desc)
+{
+    // Operations pushed to the default stream start with GPGPU-Sim's own
+    // default stream, which is never pushed to directly
+    map<struct CUstream_st*, StreamCopies>::iterator copies_iter =
+        streamCopies.find(_stream);
+    if (copies_iter == streamCopies.end()) {
+        copies_iter = streamCopies.find(NULL);
+    }
+    assert(copies_iter != streamCopies.end());
+    StreamCopies &copies = copies_iter->second;
+    assert(copies.started < copies.pushed);
+
+    map<uint64_t, CopyDescriptor>::iterator iter =
+        copies.segmented.find(copies.started++);
+    if (iter == copies.segmented.end()) {
+        return false;
+    }
+
+    desc = iter->second;
+    copies.segmented.erase(iter);
+    if (desc.isMemset != is_memset ||
+        desc.segments.front().dst != dst || desc.totalLength != count) {
+        panic("Segmented copy does not match its stream operation\n");
+    }
+    return true;
+}
+
+void CudaGPU::issueCopyOperation(const CopyDescriptor &desc,
+                                 struct CUstream_st *_stream)
+{
+    // The stream's operation is in flight even while it waits for the copy
+    // engine, which may be busy with a copy from another stream
     beginStreamOperation(_stream);
-    copyEngine->memset(dst, value, count);
+
+    updateCopyOverlap();
+    copyStreams.push(_stream);
+    copyEngine->copy(desc);
+}
+
+void CudaGPU::updateCopyOverlap()
+{
+    if (!copyStreams.empty() && !runningKernels.empty()) {
+        copyKernelOverlapTicks += curTick() - lastCopyOverlapUpdate;
+    }
+    lastCopyOverlapUpdate = curTick();
 }
 
 void CudaGPU::finishCopyOperation()
 {
-    runningStream->record_next_done();
-    scheduleStreamEvent();
-    unblockThread(runningTC);
-    endStreamOperation();
+    assert(!copyStreams.empty());
+    updateCopyOverlap();
+    struct CUstream_st *stream = copyStreams.front();
+    copyStreams.pop();
+
+    stream->record_next_done();
+    endStreamOperation(stream);
+
+    unblockThreads();
+    destroyCompletedStreams();
+    releasePendingGPUMemory();
+    streamOperationDone();
+}
+
+void CudaGPU::beginStreamOperation(struct CUstream_st *_stream)
+{
+    if (runningStreams.count(_stream)) {
+        panic("Stream already has an operation running!");
+    }
+
+    // NOTE: This may cause a race: The stream's thread context may have
+    // changed (i.e. the thread was migrated) between when the thread queued
+    // the stream operation and when that operation starts executing here. By
+    // reading CR3 here, we could use this to double check that the correct
+    // thread is running. On the other hand, we could move the CR3 read into
+    // the operation queuing code to avoid the race, but we would not be able
+    // to detect of the thread had migrated since it queued the operation.
+    ThreadContext *tc = _stream->getThreadContext();
+#if THE_ISA == X86_ISA
+    Addr pagetable_base = tc->readMiscRegNoEffect(X86ISA::MISCREG_CR3);
+#else
+    // TODO: ARM ISA should use the TTBCR for user space (which appears
+    // to be called the TTBR1 register). Further investigation required.
+    warn_once("ISA's pagetable base register handling needs to be set up");
+    Addr pagetable_base = 0;
+#endif
+
+    if (runningStreams.empty()) {
+        runningTC = tc;
+        runningTID = runningTC->threadId();
+        runningPTBase = pagetable_base;
+    } else if (pagetable_base != runningPTBase) {
+        // The GPU can only translate addresses for a single address space
+        panic("Concurrent stream operations from different address spaces! "
+              "(running PT: %p, new PT: %p)\n", runningPTBase, pagetable_base);
+    }
+
+    runningStreams.insert(_stream);
+    DPRINTF(CudaGPU, "Stream operation started, %d stream(s) running\n",
+            runningStreams.size());
+}
+
+void CudaGPU::endStreamOperation(struct CUstream_st *_stream)
+{
+    assert(runningStreams.count(_stream));
+    runningStreams.erase(_stream);
+
+    if (runningStreams.empty()) {
+        runningTC = NULL;
+        runningTID = -1;
+        runningPTBase = 0;
+    }
 }
 
 // TODO: When we move the stream manager into libcuda, this will need to be
 // eliminated, and libcuda will have to decide when to block the calling thread
-bool CudaGPU::needsToBlock()
+bool CudaGPU::needsToBlock(ThreadContext *tc, struct CUstream_st *stream)
 {
-    if (!streamManager->empty()) {
+    threadWaitStreams[tc] = stream;
+    if (!threadWaitComplete(tc)) {
         DPRINTF(CudaGPU, "Suspend request: Need to activate CPU later\n");
-        unblockNeeded = true;
         streamManager->print(stdout);
         return true;
     } else {
         DPRINTF(CudaGPU, "Suspend request: Already done.\n");
+        threadWaitStreams.erase(tc);
+        return false;
+    }
+}
+
+bool CudaGPU::needsToBlockOnEvent(ThreadContext *tc, struct CUevent_st *event)
+{
+    threadWaitEvents[tc] = event;
+    if (!threadWaitComplete(tc)) {
+        DPRINTF(CudaGPU, "Suspend request: Need to activate CPU on event\n");
+        return true;
+    } else {
+        DPRINTF(CudaGPU, "Suspend request: Event already complete.\n");
+        threadWaitEvents.erase(tc);
         return false;
     }
 }
 
+bool CudaGPU::threadWaitComplete(ThreadContext *tc)
+{
+    map<ThreadContext*, struct CUevent_st*>::iterator event_iter =
+        threadWaitEvents.find(tc);
+    bool complete;
+    if (event_iter != threadWaitEvents.end()) {
+        complete = isEventComplete(event_iter->second);
+    } else {
+        // Threads that did not wait on a particular stream wait for all
+        // streams
+        struct CUstream_st *stream = NULL;
+        map<ThreadContext*, struct CUstream_st*>::iterator iter =
+            threadWaitStreams.find(tc);
+        if (iter != threadWaitStreams.end()) {
+            stream = iter->second;
+        }
+        complete = stream ? stream->empty() : streamManager->empty();
+    }
+
+    // The thread may access managed memory once its wait completes
+    return complete && writeBackManagedMemory(tc);
+}
+
 void CudaGPU::blockThread(ThreadContext *tc, Addr signal_ptr)
 {
-    if (streamManager->empty()) {
+    if (threadWaitComplete(tc)) {
         // It is common in small memcpys for the stream operation to be complete
         // by the time cudaMemcpy calls blockThread. In this case, just signal
         DPRINTF(CudaGPU, "No stream operations to block thread %p. Continuing...\n", tc);
         signalThread(tc, signal_ptr);
         blockedThreads.erase(tc);
-        unblockNeeded = false;
+        threadWaitStreams.erase(tc);
+        threadWaitEvents.erase(tc);
     } else {
+        // Faults still being collected must be raised before the thread
+        // blocks, or it will not be running to take the interrupt
+        shaderMMU->raiseCollectedFaults();
         if (!shaderMMU->isFaultInFlight(tc)) {
             DPRINTF(CudaGPU, "Blocking thread %p for GPU syscall\n", tc);
             blockedThreads[tc] = signal_ptr;
@@ -572,11 +1219,9 @@ void CudaGPU::signalThread(ThreadContext *tc, Addr signal_ptr)
 
 void CudaGPU::unblockThread(ThreadContext *tc)
 {
-    if (!tc) tc = runningTC;
     if (tc->status() != ThreadContext::Suspended) return;
-    assert(unblockNeeded);
 
-    if (!streamManager->empty()) {
+    if (!threadWaitComplete(tc)) {
         // There must be more in the queue of work to complete. Need to
         // continue blocking
         DPRINTF(CudaGPU, "Still something in the queue, continuing block\n");
@@ -593,10 +1238,159 @@ void CudaGPU::unblockThread(ThreadContext *tc)
     signalThread(tc, signal_ptr);
 
     blockedThreads.erase(tc);
-    unblockNeeded = false;
+    threadWaitStreams.erase(tc);
+    threadWaitEvents.erase(tc);
     tc->activate();
 }
 
+void CudaGPU::unblockThreads()
+{
+    std::map<ThreadContext*, Addr>::iterator iter = blockedThreads.begin();
+    while (iter != blockedThreads.end()) {
+        // Unblocking the thread removes it from blockedThreads
+        ThreadContext *tc = iter->first;
+        iter++;
+        unblockThread(tc);
+    }
+}
+
+Addr CudaGPU::createStream()
+{
+    struct CUstream_st *stream = new CUstream_st();
+    streamManager->add_stream(stream);
+
+    Addr handle = nextStreamHandle++;
+    streamHandles[handle] = stream;
+    DPRINTF(CudaGPU, "Created stream %p with handle %d\n", stream, handle);
+    return handle;
+}
+
+struct CUstream_st *CudaGPU::getStream(Addr handle)
+{
+    if (!handle) {
+        // The default stream
+        return NULL;
+    }
+
+    map<Addr, struct CUstream_st*>::iterator iter = streamHandles.find(handle);
+    if (iter == streamHandles.end()) {
+        panic("Unknown stream handle: %d\n", handle);
+    }
+    return iter->second;
+}
+
+void CudaGPU::destroyStream(Addr handle)
+{
+    struct CUstream_st *stream = getStream(handle);
+    if (!stream) {
+        warn("Ignoring attempt to destroy the default stream\n");
+        return;
+    }
+    streamHandles.erase(handle);
+
+    // The stream is released after its pending operations complete
+    streamsToDestroy.insert(stream);
+    destroyCompletedStreams();
+}
+
+void CudaGPU::destroyCompletedStreams()
+{
+    std::set<struct CUstream_st*>::iterator iter = streamsToDestroy.begin();
+    while (iter != streamsToDestroy.end()) {
+        struct CUstream_st *stream = *iter;
+        if (stream->empty() && !runningStreams.count(stream)) {
+            DPRINTF(CudaGPU, "Destroying stream %p\n", stream);
+            streamCopies.erase(stream);
+            streamManager->destroy_stream(stream);
+            streamsToDestroy.erase(iter++);
+        } else {
+            iter++;
+        }
+    }
+}
+
+Addr CudaGPU::createEvent()
+{
+    struct CUevent_st *event = new CUevent_st(false);
+
+    Addr handle = nextEventHandle++;
+    eventHandles[handle] = event;
+    DPRINTF(CudaGPU, "Created event %p with handle %d\n", event, handle);
+    return handle;
+}
+
+struct CUevent_st *CudaGPU::getEvent(Addr handle)
+{
+    map<Addr, struct CUevent_st*>::iterator iter = eventHandles.find(handle);
+    if (iter == eventHandles.end()) {
+        panic("Unknown event handle: %d\n", handle);
+    }
+    return iter->second;
+}
+
+void CudaGPU::recordEvent(struct CUevent_st *event)
+{
+    // Each record of the event updates it once when reached in its stream
+    map<struct CUevent_st*, unsigned>::iterator iter =
+        pendingEvents.find(event);
+    if (iter != pendingEvents.end()) {
+        iter->second++;
+    } else {
+        pendingEvents[event] = event->num_updates() + 1;
+    }
+}
+
+void CudaGPU::updateEvents()
+{
+    map<struct CUevent_st*, unsigned>::iterator iter = pendingEvents.begin();
+    bool completed = false;
+    while (iter != pendingEvents.end()) {
+        struct CUevent_st *event = iter->first;
+        if (event->num_updates() >= iter->second) {
+            DPRINTF(CudaGPU, "Event %p completed\n", event);
+            eventTicks[event] = curTick();
+            pendingEvents.erase(iter++);
+            completed = true;
+
+            if (eventsToDestroy.count(event)) {
+                eventsToDestroy.erase(event);
+                eventTicks.erase(event);
+                delete event;
+            }
+        } else {
+            iter++;
+        }
+    }
+
+    if (completed) {
+        unblockThreads();
+    }
+}
+
+Tick CudaGPU::getEventTick(struct CUevent_st *event)
+{
+    assert(isEventComplete(event));
+    map<struct CUevent_st*, Tick>::iterator iter = eventTicks.find(event);
+    if (iter == eventTicks.end()) {
+        panic("Event %p was never recorded!\n", event);
+    }
+    return iter->second;
+}
+
+void CudaGPU::destroyEvent(Addr handle)
+{
+    struct CUevent_st *event = getEvent(handle);
+    eventHandles.erase(handle);
+
+    if (isEventComplete(event)) {
+        eventTicks.erase(event);
+        delete event;
+    } else {
+        // The event is freed when its stream reaches it
+        eventsToDestroy.insert(event);
+    }
+}
+
 void CudaGPU::add_binary( symbol_table *symtab, unsigned fat_cubin_handle )
 {
     m_code[fat_cubin_handle] = symtab;
@@ -668,35 +1462,147 @@ Addr CudaGPU::GPUPageTable::addrToPage(Addr addr)
     return addr - offset;
 }
 
-void CudaGPU::GPUPageTable::serialize(CheckpointOut &cp) const
+CudaGPU::GPUPageTable::ExtentMap::iterator
+CudaGPU::GPUPageTable::findExtent(Addr vaddr)
 {
-    unsigned int num_ptes = pageMap.size();
-    unsigned int index = 0;
-    Addr* pagetable_vaddrs = new Addr[num_ptes];
-    Addr* pagetable_paddrs = new Addr[num_ptes];
-    std::map<Addr, Addr>::const_iterator it = pageMap.begin();
-    for (; it != pageMap.end(); ++it) {
-        pagetable_vaddrs[index] = (*it).first;
-        pagetable_paddrs[index++] = (*it).second;
+    ExtentMap::iterator iter = extents.upper_bound(vaddr);
+    if (iter == extents.begin()) {
+        return extents.end();
     }
-    SERIALIZE_SCALAR(num_ptes);
-    SERIALIZE_ARRAY(pagetable_vaddrs, num_ptes);
-    SERIALIZE_ARRAY(pagetable_paddrs, num_ptes);
-    delete[] pagetable_vaddrs;
-    delete[] pagetable_paddrs;
+    --iter;
+    if (vaddr >= iter->first + iter->second.size) {
+        return extents.end();
+    }
+    return iter;
 }
 
-void CudaGPU::GPUPageTable::unserialize(CheckpointIn &cp)
+void CudaGPU::GPUPageTable::mergeWithNext(ExtentMap::iterator iter)
 {
-    unsigned int num_ptes = 0;
+    ExtentMap::iterator next = iter;
+    ++next;
+    if (next != extents.end() &&
+        iter->first + iter->second.size == next->first &&
+        iter->second.paddr + iter->second.size == next->second.paddr) {
+        iter->second.size += next->second.size;
+        extents.erase(next);
+    }
+}
+
+void CudaGPU::GPUPageTable::insert(Addr vaddr, Addr paddr)
+{
+    insertRange(vaddr, paddr, TheISA::PageBytes);
+}
+
+void CudaGPU::GPUPageTable::insertRange(Addr vaddr, Addr paddr, Addr size)
+{
+    assert(vaddr == addrToPage(vaddr));
+    assert(size % TheISA::PageBytes == 0);
+    Addr end = vaddr + size;
+    while (vaddr < end) {
+        ExtentMap::iterator iter = findExtent(vaddr);
+        if (iter != extents.end()) {
+            // Pages that are already mapped must map to the same frames
+            assert(paddr == iter->second.paddr + (vaddr - iter->first));
+            Addr mapped_end = std::min(end, iter->first + iter->second.size);
+            paddr += mapped_end - vaddr;
+            vaddr = mapped_end;
+            continue;
+        }
+
+        // Map the pages up to the next extent
+        Addr gap_end = end;
+        iter = extents.upper_bound(vaddr);
+        if (iter != extents.end() && iter->first < end) {
+            gap_end = iter->first;
+        }
+        iter = extents.insert(iter,
+                std::make_pair(vaddr, Extent(gap_end - vaddr, paddr)));
+        mergeWithNext(iter);
+        if (iter != extents.begin()) {
+            --iter;
+            mergeWithNext(iter);
+        }
+        paddr += gap_end - vaddr;
+        vaddr = gap_end;
+    }
+}
+
+bool CudaGPU::GPUPageTable::lookup(Addr vaddr, Addr& paddr,
+                                   Addr &extent_vaddr, Addr &extent_size)
+{
+    ExtentMap::iterator iter = findExtent(vaddr);
+    if (iter == extents.end()) {
+        return false;
+    }
+    paddr = iter->second.paddr + (vaddr - iter->first);
+    extent_vaddr = iter->first;
+    extent_size = iter->second.size;
+    return true;
+}
+
+void CudaGPU::GPUPageTable::remove(Addr vaddr)
+{
+    Addr page_vaddr = addrToPage(vaddr);
+    ExtentMap::iterator iter = findExtent(page_vaddr);
+    if (iter == extents.end()) {
+        return;
+    }
+
+    // Split the extent around the removed page
+    Addr extent_vaddr = iter->first;
+    Extent extent = iter->second;
+    extents.erase(iter);
+    if (page_vaddr > extent_vaddr) {
+        extents[extent_vaddr] = Extent(page_vaddr - extent_vaddr,
+                                       extent.paddr);
+    }
+    Addr next_vaddr = page_vaddr + TheISA::PageBytes;
+    Addr extent_end = extent_vaddr + extent.size;
+    if (next_vaddr < extent_end) {
+        extents[next_vaddr] = Extent(extent_end - next_vaddr,
+                extent.paddr + (next_vaddr - extent_vaddr));
+    }
+    version++;
+}
+
+void CudaGPU::GPUPageTable::serialize(CheckpointOut &cp) const
+{
+    // Checkpoints hold a PTE for each page, independent of the extents
+    unsigned int num_ptes = 0;
+    ExtentMap::const_iterator it = extents.begin();
+    for (; it != extents.end(); ++it) {
+        num_ptes += it->second.size / TheISA::PageBytes;
+    }
+    unsigned int index = 0;
+    Addr* pagetable_vaddrs = new Addr[num_ptes];
+    Addr* pagetable_paddrs = new Addr[num_ptes];
+    for (it = extents.begin(); it != extents.end(); ++it) {
+        for (Addr offset = 0; offset < it->second.size;
+             offset += TheISA::PageBytes) {
+            pagetable_vaddrs[index] = it->first + offset;
+            pagetable_paddrs[index++] = it->second.paddr + offset;
+        }
+    }
+    SERIALIZE_SCALAR(num_ptes);
+    SERIALIZE_ARRAY(pagetable_vaddrs, num_ptes);
+    SERIALIZE_ARRAY(pagetable_paddrs, num_ptes);
+    delete[] pagetable_vaddrs;
+    delete[] pagetable_paddrs;
+}
+
+void CudaGPU::GPUPageTable::unserialize(CheckpointIn &cp)
+{
+    unsigned int num_ptes = 0;
     UNSERIALIZE_SCALAR(num_ptes);
     Addr* pagetable_vaddrs = new Addr[num_ptes];
     Addr* pagetable_paddrs = new Addr[num_ptes];
     UNSERIALIZE_ARRAY(pagetable_vaddrs, num_ptes);
     UNSERIALIZE_ARRAY(pagetable_paddrs, num_ptes);
+    extents.clear();
     for (unsigned int i = 0; i < num_ptes; ++i) {
-        pageMap[pagetable_vaddrs[i]] = pagetable_paddrs[i];
+        insert(pagetable_vaddrs[i], pagetable_paddrs[i]);
     }
+    version++;
     delete[] pagetable_vaddrs;
     delete[] pagetable_paddrs;
 }
@@ -723,6 +1629,9 @@ void CudaGPU::registerDeviceInstText(ThreadContext *tc, Addr vaddr, size_t size)
     if (manageGPUMemory) {
         // Allocate virtual and physical memory for the device text
         Addr gpu_vaddr = allocateGPUMemory(size);
+        if (!gpu_vaddr && size) {
+            panic("Ran out of GPU memory for device instructions!");
+        }
         setInstBaseVaddr(gpu_vaddr);
     } else {
         setInstBaseVaddr(vaddr);
@@ -730,45 +1639,723 @@ void CudaGPU::registerDeviceInstText(ThreadContext *tc, Addr vaddr, size_t size)
     }
 }
 
-Addr CudaGPU::allocateGPUMemory(size_t size)
+Addr CudaGPU::allocateGPUMemory(size_t size, bool first_touch)
 {
     assert(manageGPUMemory);
     DPRINTF(CudaGPUPageTable, "GPU allocating %d bytes\n", size);
 
     if (size == 0) return 0;
 
-    // TODO: When we need to reclaim memory, this will need to be modified
-    // heavily to actually track allocated and free physical and virtual memory
+    Addr base_vaddr;
+    if (!deviceAllocator->allocate(size, base_vaddr)) {
+        warn("Unable to allocate %d bytes of GPU memory (%d bytes free, "
+             "largest free block %d bytes)\n", size,
+             deviceAllocator->getFreeBytes(),
+             deviceAllocator->getLargestFreeBlock());
+        deviceMemFailedAllocations++;
+        return 0;
+    }
+    deviceMemAllocations++;
+    updateDeviceMemoryStats();
+
+    mapDevicePages(base_vaddr, size, first_touch);
+
+    DPRINTF(CudaGPUAccess, "Allocating %d bytes for GPU at address 0x%x\n", size, base_vaddr);
+
+    return base_vaddr;
+}
+
+bool CudaGPU::freeGPUMemory(Addr vaddr)
+{
+    assert(manageGPUMemory);
+    Addr base_vaddr;
+    size_t size;
+    if (!deviceAllocator->lookup(vaddr, base_vaddr, size) ||
+        base_vaddr != vaddr || pendingGPUMemoryFrees.count(vaddr)) {
+        return false;
+    }
+
+    // Kernels and copies still in the streams may access the memory, so
+    // it cannot be unmapped or reallocated until they complete
+    if (!streamManager->empty()) {
+        DPRINTF(CudaGPUAccess, "Deferring free of GPU memory at address "
+                "0x%x until stream operations complete\n", vaddr);
+        pendingGPUMemoryFrees[vaddr] = size;
+        return true;
+    }
+
+    releaseGPUMemory(vaddr, size);
+    return true;
+}
+
+void CudaGPU::releaseGPUMemory(Addr vaddr, size_t size)
+{
+    deviceAllocator->free(vaddr);
+    unmapDevicePages(vaddr, size);
+
+    DPRINTF(CudaGPUAccess, "Freeing GPU memory at address 0x%x\n", vaddr);
+    deviceMemFrees++;
+    updateDeviceMemoryStats();
+}
+
+void CudaGPU::releasePendingGPUMemory()
+{
+    if (pendingGPUMemoryFrees.empty() || !streamManager->empty()) {
+        return;
+    }
+
+    std::map<Addr, size_t>::iterator iter;
+    for (iter = pendingGPUMemoryFrees.begin();
+         iter != pendingGPUMemoryFrees.end(); ++iter) {
+        releaseGPUMemory(iter->first, iter->second);
+    }
+    pendingGPUMemoryFrees.clear();
+}
+
+void CudaGPU::updateDeviceMemoryStats()
+{
+    size_t allocated = deviceAllocator->getAllocatedBytes();
+    deviceMemAllocatedBytes = allocated;
+    if (allocated > deviceMemPeakBytes.value()) {
+        deviceMemPeakBytes = allocated;
+    }
+    deviceMemInternalFragmentation =
+        allocated - deviceAllocator->getRequestedBytes();
+    deviceMemExternalFragmentation = deviceAllocator->getFragmentation();
+}
+
+unsigned CudaGPU::nearestDevDir(int core_id)
+{
+    if (core_id < 0) {
+        // Accesses from outside the cores (e.g. the copy engine) interleave
+        unsigned dir = nextInterleaveDir;
+        nextInterleaveDir = (nextInterleaveDir + 1) % numDevDirs;
+        return dir;
+    }
+    // Cores are divided evenly among the directories in order of their IDs
+    return core_id * numDevDirs / cudaCores.size();
+}
+
+Addr CudaGPU::allocateFrame(unsigned dir)
+{
+    // Fall back to the next directories if the requested one is full
+    Addr dir_granularity = (Addr)1 << devDirLowBit;
+    Addr end = gpuMemoryRange.start() + gpuMemoryRange.size();
+    for (unsigned i = 0; i < numDevDirs; i++) {
+        unsigned cur_dir = (dir + i) % numDevDirs;
+        if (!freeDirFrames[cur_dir].empty()) {
+            Addr frame = freeDirFrames[cur_dir].back();
+            freeDirFrames[cur_dir].pop_back();
+            return frame;
+        }
+        Addr &next = nextDirFrame[cur_dir];
+        while (next < end && getDevDir(next) != cur_dir) {
+            next = roundDown(next, dir_granularity) + dir_granularity;
+        }
+        if (next < end) {
+            Addr frame = next;
+            next += TheISA::PageBytes;
+            return frame;
+        }
+    }
+    panic("Ran out of GPU physical memory!");
+    return 0;
+}
 
-    // Cache block align the allocation size
-    size_t block_part = size % ruby->getBlockSizeBytes();
-    size_t aligned_size = size + (block_part ? (ruby->getBlockSizeBytes() - block_part) : 0);
+void CudaGPU::releaseFrame(Addr frame)
+{
+    unsigned dir = getDevDir(frame);
+    freeDirFrames[dir].push_back(frame);
+    devDirPages[dir]--;
+}
 
-    Addr base_vaddr = virtualGPUBrkAddr;
-    virtualGPUBrkAddr += aligned_size;
-    Addr base_paddr = physicalGPUBrkAddr;
-    physicalGPUBrkAddr += aligned_size;
+void CudaGPU::placeDevicePage(Addr page_vaddr, unsigned dir)
+{
+    Addr frame = allocateFrame(dir);
+    DPRINTF(CudaGPUPageTable, "  Placing page at vaddr %x in directory %d "
+            "(paddr %x)\n", page_vaddr, getDevDir(frame), frame);
+    pageTable.insert(page_vaddr, frame);
+    devDirPages[getDevDir(frame)]++;
+}
 
-    if (virtualGPUBrkAddr > gpuMemoryRange.size()) {
-        panic("Ran out of GPU memory!");
+void CudaGPU::mapDevicePages(Addr vaddr, size_t size, bool first_touch)
+{
+    if (pagePlacement == LinearPlacement) {
+        // Map all pages with one extent. Pages shared with neighboring
+        // allocations are already mapped to the same frames.
+        Addr base_vaddr = pageTable.addrToPage(vaddr);
+        Addr end_vaddr = roundUp(vaddr + size, TheISA::PageBytes);
+        Addr base_paddr =
+            gpuMemoryRange.start() + (base_vaddr - deviceVaddrBase);
+        DPRINTF(CudaGPUPageTable, "  Mapping vaddrs [%x, %x) to paddr %x\n",
+                base_vaddr, end_vaddr, base_paddr);
+        pageTable.insertRange(base_vaddr, base_paddr, end_vaddr - base_vaddr);
+        return;
     }
 
-    // Map pages to physical pages
-    for (ChunkGenerator gen(base_vaddr, aligned_size, TheISA::PageBytes); !gen.done(); gen.next()) {
+    for (ChunkGenerator gen(vaddr, size, TheISA::PageBytes); !gen.done(); gen.next()) {
         Addr page_vaddr = pageTable.addrToPage(gen.addr());
         Addr page_paddr;
-        if (page_vaddr <= base_vaddr) {
-            page_paddr = base_paddr - (base_vaddr - page_vaddr);
+        if (pageTable.lookup(page_vaddr, page_paddr) ||
+            unplacedPages.count(page_vaddr)) {
+            // Shared with a neighboring allocation
+            continue;
+        }
+        if (pagePlacement == FirstTouchPlacement && first_touch) {
+            unplacedPages.insert(page_vaddr);
         } else {
-            page_paddr = base_paddr + (page_vaddr - base_vaddr);
+            placeDevicePage(page_vaddr, nearestDevDir(-1));
         }
-        DPRINTF(CudaGPUPageTable, "  Trying to allocate page at vaddr %x with addr %x\n", page_vaddr, gen.addr());
-        pageTable.insert(page_vaddr, page_paddr);
     }
+}
 
-    DPRINTF(CudaGPUAccess, "Allocating %d bytes for GPU at address 0x%x\n", size, base_vaddr);
+void CudaGPU::unmapDevicePages(Addr vaddr, size_t size)
+{
+    if (pagePlacement == LinearPlacement) {
+        // NOTE: The pages stay mapped, since they may be shared with
+        // neighboring allocations. The mapping is linear, so a stale access
+        // just reads or writes the freed memory, as it would on hardware.
+        return;
+    }
 
-    return base_vaddr;
+    for (ChunkGenerator gen(vaddr, size, TheISA::PageBytes); !gen.done(); gen.next()) {
+        Addr page_vaddr = pageTable.addrToPage(gen.addr());
+        if (deviceAllocator->overlaps(page_vaddr, TheISA::PageBytes)) {
+            // Still used by a neighboring allocation
+            continue;
+        }
+        Addr page_paddr;
+        if (pageTable.lookup(page_vaddr, page_paddr)) {
+            pageTable.remove(page_vaddr);
+            releaseFrame(page_paddr);
+        } else {
+            unplacedPages.erase(page_vaddr);
+        }
+    }
+}
+
+bool CudaGPU::touchDevicePage(Addr vaddr, int core_id)
+{
+    Addr page_vaddr = pageTable.addrToPage(vaddr);
+    set<Addr>::iterator iter = unplacedPages.find(page_vaddr);
+    if (iter == unplacedPages.end()) {
+        return false;
+    }
+    unplacedPages.erase(iter);
+    placeDevicePage(page_vaddr, nearestDevDir(core_id));
+    firstTouchPlacements++;
+    return true;
+}
+
+bool CudaGPU::adviseDevicePlacement(Addr vaddr, size_t size, unsigned dir)
+{
+    Addr base_vaddr;
+    size_t alloc_size;
+    if (!manageGPUMemory || dir >= numDevDirs ||
+        !deviceAllocator->lookup(vaddr, base_vaddr, alloc_size) ||
+        vaddr + size > base_vaddr + alloc_size) {
+        return false;
+    }
+    if (pagePlacement == LinearPlacement) {
+        warn_once("Ignoring device placement hints with linear page "
+                  "placement\n");
+        return true;
+    }
+
+    DPRINTF(CudaGPUPageTable, "Placing %d bytes at 0x%x in directory %d\n",
+            size, vaddr, dir);
+
+    uint8_t *data = new uint8_t[TheISA::PageBytes];
+    PortProxy &proxy = system->getPhysProxy();
+    for (ChunkGenerator gen(vaddr, size, TheISA::PageBytes); !gen.done(); gen.next()) {
+        Addr page_vaddr = pageTable.addrToPage(gen.addr());
+        set<Addr>::iterator iter = unplacedPages.find(page_vaddr);
+        if (iter != unplacedPages.end()) {
+            unplacedPages.erase(iter);
+            placeDevicePage(page_vaddr, dir);
+            continue;
+        }
+
+        Addr old_paddr;
+        bool mapped = pageTable.lookup(page_vaddr, old_paddr);
+        assert(mapped);
+        if (getDevDir(old_paddr) == dir) {
+            continue;
+        }
+        // Move the page's data to a frame in the hinted directory. This copy
+        // is not timed.
+        pageTable.remove(page_vaddr);
+        placeDevicePage(page_vaddr, dir);
+        Addr new_paddr;
+        pageTable.lookup(page_vaddr, new_paddr);
+        proxy.readBlob(old_paddr, data, TheISA::PageBytes);
+        proxy.writeBlob(new_paddr, data, TheISA::PageBytes);
+        releaseFrame(old_paddr);
+        placementHintMoves++;
+    }
+    delete [] data;
+    return true;
+}
+
+void CudaGPU::recordDeviceAccess(Addr paddr, unsigned size)
+{
+    if (!gpuMemoryRange.contains(paddr)) {
+        return;
+    }
+    unsigned dir = getDevDir(paddr);
+    devDirAccesses[dir]++;
+    devDirBytes[dir] += size;
+}
+
+void CudaGPU::reserveHostRegion(ThreadContext *tc)
+{
+    assert(!hostRegionAllocator);
+
+    // Take the region from the process' mmap space like the mmap syscall
+    // does for an anonymous mapping without a fixed address
+    Process *process = tc->getProcessPtr();
+    if (process->mmapGrowsDown()) {
+        process->mmap_end -= hostRegionSize;
+        hostRegionBase = process->mmap_end;
+    } else {
+        hostRegionBase = process->mmap_end;
+        process->mmap_end += hostRegionSize;
+    }
+    DPRINTF(CudaGPUPageTable, "Reserved host region 0x%x-0x%x\n",
+            hostRegionBase, hostRegionBase + hostRegionSize);
+    hostRegionAllocator = new GPUMemoryAllocator(hostRegionBase,
+            hostRegionSize, TheISA::PageBytes);
+}
+
+Addr CudaGPU::allocateHostPages(ThreadContext *tc, size_t size)
+{
+    assert(!FullSystem);
+    assert(size % TheISA::PageBytes == 0);
+
+    if (!hostRegionAllocator) {
+        reserveHostRegion(tc);
+    }
+    Addr vaddr;
+    if (!hostRegionAllocator->allocate(size, vaddr)) {
+        fatal("%s: Out of host region space allocating %d bytes. Increase "
+              "host_region_size\n", name(), size);
+    }
+
+    // Back the pages with physical memory before the GPU maps them. Pages
+    // of freed allocations are still backed.
+    Process *process = tc->getProcessPtr();
+    for (ChunkGenerator gen(vaddr, size, TheISA::PageBytes); !gen.done();
+         gen.next()) {
+        Addr paddr;
+        if (!process->pTable->translate(gen.addr(), paddr)) {
+            process->allocateMem(gen.addr(), TheISA::PageBytes);
+        }
+    }
+    return vaddr;
+}
+
+void CudaGPU::freeHostPages(Addr vaddr)
+{
+    if (!hostRegionAllocator || !hostRegionAllocator->free(vaddr)) {
+        // Allocated outside of the region by an older checkpoint
+        warn("Host pages at 0x%x are not in the host region. Not reusing "
+             "them\n", vaddr);
+    }
+}
+
+Addr CudaGPU::allocateMappedHostMemory(ThreadContext *tc, size_t size)
+{
+    if (size == 0) return 0;
+
+    Process *process = tc->getProcessPtr();
+    size_t aligned_size = roundUp(size, TheISA::PageBytes);
+    Addr host_vaddr = allocateHostPages(tc, aligned_size);
+
+    Addr device_vaddr = host_vaddr;
+    if (manageGPUMemory) {
+        // Map the host pages into the GPU's virtual address space. GPU
+        // accesses to them translate to host physical addresses, so they are
+        // handled by the host directories rather than copied to GPU memory
+        if (!mappedHostAllocator->allocate(aligned_size, device_vaddr)) {
+            panic("Ran out of GPU virtual memory mapping host memory!");
+        }
+        for (ChunkGenerator gen(host_vaddr, aligned_size, TheISA::PageBytes);
+             !gen.done(); gen.next()) {
+            Addr page_paddr;
+            if (!process->pTable->translate(gen.addr(), page_paddr)) {
+                panic("Mapped host memory 0x%x has no physical page!",
+                      gen.addr());
+            }
+            DPRINTF(CudaGPUPageTable, "  Mapping host page %x (paddr %x) at vaddr %x\n",
+                    gen.addr(), page_paddr, device_vaddr + gen.complete());
+            pageTable.insert(device_vaddr + gen.complete(), page_paddr);
+        }
+    } else {
+        // The GPU shares the host's virtual address space
+        registerDeviceMemory(tc, host_vaddr, aligned_size);
+    }
+
+    DPRINTF(CudaGPUPageTable, "Allocated %d bytes of mapped host memory at 0x%x (device 0x%x)\n",
+            size, host_vaddr, device_vaddr);
+
+    hostAllocations[host_vaddr] = _HostAllocation(aligned_size, device_vaddr);
+    mappedHostBytes += aligned_size;
+
+    return host_vaddr;
+}
+
+bool CudaGPU::freeMappedHostMemory(Addr host_vaddr)
+{
+    map<Addr, _HostAllocation>::iterator iter =
+        hostAllocations.find(host_vaddr);
+    if (iter == hostAllocations.end()) {
+        return false;
+    }
+
+    DPRINTF(CudaGPUPageTable, "Freeing mapped host memory at 0x%x\n",
+            host_vaddr);
+
+    // The host pages stay backed, but the GPU may no longer access them.
+    // Later host allocations may reuse them.
+    const _HostAllocation &alloc = iter->second;
+    if (manageGPUMemory || !accessHostPageTable) {
+        for (ChunkGenerator gen(alloc.deviceVaddr, alloc.size,
+                                TheISA::PageBytes);
+             !gen.done(); gen.next()) {
+            pageTable.remove(gen.addr());
+        }
+    }
+    if (manageGPUMemory) {
+        mappedHostAllocator->free(alloc.deviceVaddr);
+    }
+    freeHostPages(host_vaddr);
+    hostAllocations.erase(iter);
+    return true;
+}
+
+bool CudaGPU::getMappedDevicePointer(Addr host_vaddr, Addr &device_vaddr)
+{
+    // Find the allocation containing host_vaddr
+    map<Addr, _HostAllocation>::iterator iter =
+        hostAllocations.upper_bound(host_vaddr);
+    if (iter == hostAllocations.begin()) {
+        return false;
+    }
+    --iter;
+    if (host_vaddr >= iter->first + iter->second.size) {
+        return false;
+    }
+    device_vaddr = iter->second.deviceVaddr + (host_vaddr - iter->first);
+    return true;
+}
+
+Addr CudaGPU::allocateManagedMemory(ThreadContext *tc, size_t size)
+{
+    if (!manageGPUMemory) {
+        // The GPU can directly access host memory, so managed memory is just
+        // host memory mapped into the GPU's address space
+        return allocateMappedHostMemory(tc, size);
+    }
+    if (size == 0) return 0;
+
+    size_t aligned_size = roundUp(size, TheISA::PageBytes);
+    Addr base = allocateHostPages(tc, aligned_size);
+
+    // The GPU's own allocations are at low virtual addresses, so the host
+    // virtual addresses are free in the GPU's address space
+    if (base < virtualGPUMemoryEnd) {
+        panic("Managed memory 0x%x overlaps GPU virtual memory!", base);
+    }
+
+    DPRINTF(CudaGPUPageTable, "Allocated %d bytes of managed memory at 0x%x\n",
+            size, base);
+
+    managedAllocations[base] = aligned_size;
+    for (Addr unit_base = base; unit_base < base + aligned_size;
+         unit_base += managedMigrationSize) {
+        _ManagedUnit &unit = managedUnits[unit_base];
+        unit.size = std::min((Addr)managedMigrationSize,
+                             base + aligned_size - unit_base);
+    }
+
+    return base;
+}
+
+bool CudaGPU::freeManagedMemory(Addr vaddr)
+{
+    if (!manageGPUMemory) {
+        return freeMappedHostMemory(vaddr);
+    }
+
+    map<Addr, size_t>::iterator iter = managedAllocations.find(vaddr);
+    if (iter == managedAllocations.end()) {
+        return false;
+    }
+
+    DPRINTF(CudaGPUPageTable, "Freeing managed memory at 0x%x\n", vaddr);
+
+    // Release the GPU memory of resident units. The host pages stay backed
+    // for reuse by later host allocations.
+    for (Addr unit_base = vaddr; unit_base < vaddr + iter->second;
+         unit_base += managedMigrationSize) {
+        map<Addr, _ManagedUnit>::iterator unit_iter =
+            managedUnits.find(unit_base);
+        assert(unit_iter != managedUnits.end());
+        _ManagedUnit &unit = unit_iter->second;
+        if (unit.migrating) {
+            panic("Freeing managed memory 0x%x while it migrates!", vaddr);
+        }
+        if (unit.resident) {
+            mapManagedUnit(unit_base, unit, false);
+            residentManagedUnits.remove(unit_base);
+            releaseManagedFrame(unit.frame);
+        }
+        managedUnits.erase(unit_iter);
+    }
+    managedAllocations.erase(iter);
+    freeHostPages(vaddr);
+    return true;
+}
+
+bool CudaGPU::getManagedUnit(Addr vaddr, Addr &unit_base)
+{
+    if (managedAllocations.empty()) {
+        return false;
+    }
+
+    // Find the allocation containing vaddr
+    map<Addr, size_t>::iterator iter = managedAllocations.upper_bound(vaddr);
+    if (iter == managedAllocations.begin()) {
+        return false;
+    }
+    --iter;
+    if (vaddr >= iter->first + iter->second) {
+        return false;
+    }
+    Addr offset = vaddr - iter->first;
+    unit_base = iter->first + offset - offset % managedMigrationSize;
+    return true;
+}
+
+Addr CudaGPU::translateHostAddress(ThreadContext *tc, Addr vaddr)
+{
+    assert(tc);
+    Addr paddr;
+    if (!tc->getProcessPtr()->pTable->translate(vaddr, paddr)) {
+        panic("Managed memory 0x%x has no host physical page!", vaddr);
+    }
+    return paddr;
+}
+
+bool CudaGPU::translateManagedAddress(Addr vaddr, Addr &paddr)
+{
+    Addr unit_base;
+    if (!manageGPUMemory || !getManagedUnit(vaddr, unit_base)) {
+        return false;
+    }
+    const _ManagedUnit &unit = managedUnits[unit_base];
+    if (unit.resident) {
+        paddr = managedFramePaddr(unit, vaddr - unit_base);
+    } else {
+        paddr = translateHostAddress(runningTC, vaddr);
+    }
+    return true;
+}
+
+void CudaGPU::mapManagedUnit(Addr unit_base, const _ManagedUnit &unit,
+                             bool map)
+{
+    for (Addr offset = 0; offset < unit.size; offset += TheISA::PageBytes) {
+        if (map) {
+            pageTable.insert(unit_base + offset,
+                             managedFramePaddr(unit, offset));
+        } else {
+            pageTable.remove(unit_base + offset);
+        }
+    }
+}
+
+void CudaGPU::addManagedSegments(CopyDescriptor &desc, ThreadContext *tc,
+                                 Addr unit_base, const _ManagedUnit &unit,
+                                 bool to_gpu)
+{
+    // Host pages are not necessarily physically contiguous, so each page is
+    // a separate segment
+    desc.type = to_gpu ? stream_memcpy_host_to_device :
+                         stream_memcpy_device_to_host;
+    desc.isPhysical = true;
+    desc.isMigration = true;
+    desc.migrationUnit = unit_base;
+    for (Addr offset = 0; offset < unit.size; offset += TheISA::PageBytes) {
+        Addr host_paddr = translateHostAddress(tc, unit_base + offset);
+        Addr frame_paddr = managedFramePaddr(unit, offset);
+        if (to_gpu) {
+            desc.addSegment(host_paddr, frame_paddr, TheISA::PageBytes);
+        } else {
+            desc.addSegment(frame_paddr, host_paddr, TheISA::PageBytes);
+        }
+    }
+}
+
+bool CudaGPU::allocateManagedFrame(Addr &frame)
+{
+    if (managedMemoryLimit &&
+        managedFrameBytes + managedMigrationSize > managedMemoryLimit) {
+        return false;
+    }
+    if (!deviceAllocator->allocate(managedMigrationSize, frame)) {
+        return false;
+    }
+    managedFrameBytes += managedMigrationSize;
+    updateDeviceMemoryStats();
+    mapDevicePages(frame, managedMigrationSize, false);
+    return true;
+}
+
+void CudaGPU::releaseManagedFrame(Addr frame)
+{
+    bool freed = deviceAllocator->free(frame);
+    assert(freed);
+    unmapDevicePages(frame, managedMigrationSize);
+    managedFrameBytes -= managedMigrationSize;
+    updateDeviceMemoryStats();
+}
+
+Addr CudaGPU::managedFramePaddr(const _ManagedUnit &unit, Addr offset)
+{
+    Addr paddr;
+    bool mapped = pageTable.lookup(unit.frame + offset, paddr);
+    assert(mapped);
+    return paddr;
+}
+
+void CudaGPU::evictManagedUnit(ThreadContext *tc)
+{
+    assert(!residentManagedUnits.empty());
+    Addr unit_base = residentManagedUnits.front();
+    residentManagedUnits.pop_front();
+    _ManagedUnit &unit = managedUnits[unit_base];
+    assert(unit.resident);
+
+    DPRINTF(CudaGPUPageTable, "Evicting managed memory 0x%x from frame 0x%x\n",
+            unit_base, unit.frame);
+
+    // Unmap the unit so that further GPU accesses fault and migrate it back
+    unit.resident = false;
+    mapManagedUnit(unit_base, unit, false);
+
+    CopyDescriptor desc;
+    addManagedSegments(desc, tc, unit_base, unit, false);
+    managedEvictions++;
+    managedEvictionBytes += unit.size;
+
+    // The frame is released when the copy completes, so that nothing else
+    // allocated in it can overwrite the unit before the copy reads it
+    evictingManagedFrames.push(unit.frame);
+    copyEngine->copy(desc);
+}
+
+void CudaGPU::migrateManagedMemory(Addr unit_base)
+{
+    assert(manageGPUMemory);
+    map<Addr, _ManagedUnit>::iterator iter = managedUnits.find(unit_base);
+    assert(iter != managedUnits.end());
+    assert(!iter->second.resident && !iter->second.migrating);
+
+    iter->second.migrating = true;
+    waitingManagedMigrations.push_back(unit_base);
+    startManagedMigrations();
+}
+
+void CudaGPU::startManagedMigrations()
+{
+    while (!waitingManagedMigrations.empty()) {
+        Addr frame;
+        if (!allocateManagedFrame(frame)) {
+            // Evict a unit for each waiting migration that an eviction in
+            // flight will not make room for. Completed evictions retry.
+            while (evictingManagedFrames.size() <
+                   waitingManagedMigrations.size() &&
+                   !residentManagedUnits.empty()) {
+                evictManagedUnit(runningTC);
+            }
+            if (evictingManagedFrames.empty()) {
+                panic("No GPU memory available for managed memory!");
+            }
+            return;
+        }
+
+        Addr unit_base = waitingManagedMigrations.front();
+        waitingManagedMigrations.pop_front();
+        _ManagedUnit &unit = managedUnits[unit_base];
+        assert(unit.migrating);
+        unit.frame = frame;
+
+        DPRINTF(CudaGPUPageTable, "Migrating managed memory 0x%x to frame "
+                "0x%x\n", unit_base, unit.frame);
+
+        CopyDescriptor desc;
+        addManagedSegments(desc, runningTC, unit_base, unit, true);
+        managedMigrations++;
+        managedMigrationBytes += unit.size;
+        copyEngine->copy(desc);
+    }
+}
+
+void CudaGPU::finishMigration(const CopyDescriptor &desc)
+{
+    if (desc.type == stream_memcpy_device_to_host) {
+        DPRINTF(CudaGPUPageTable, "Finished evicting managed memory 0x%x\n",
+                desc.migrationUnit);
+        // The copy engine completes copies in order
+        assert(!evictingManagedFrames.empty());
+        releaseManagedFrame(evictingManagedFrames.front());
+        evictingManagedFrames.pop();
+        startManagedMigrations();
+        if (evictingManagedFrames.empty()) {
+            // Threads may be waiting for managed memory to be written back
+            unblockThreads();
+        }
+        return;
+    }
+
+    map<Addr, _ManagedUnit>::iterator iter =
+        managedUnits.find(desc.migrationUnit);
+    assert(iter != managedUnits.end());
+    _ManagedUnit &unit = iter->second;
+    assert(unit.migrating);
+
+    DPRINTF(CudaGPUPageTable, "Finished migrating managed memory 0x%x\n",
+            desc.migrationUnit);
+
+    unit.migrating = false;
+    unit.resident = true;
+    mapManagedUnit(desc.migrationUnit, unit, true);
+    residentManagedUnits.push_back(desc.migrationUnit);
+
+    shaderMMU->finishMigration(desc.migrationUnit);
+}
+
+bool CudaGPU::writeBackManagedMemory(ThreadContext *tc)
+{
+    // NOTE: The CPU does not fault on managed memory, so it only sees host
+    // memory. It may only access managed memory while the GPU is idle, so
+    // the resident units are evicted when a thread's wait on the idle GPU
+    // completes, and are migrated back on demand once the GPU uses them
+    // again.
+    if (!evictingManagedFrames.empty()) {
+        return false;
+    }
+    if (!runningStreams.empty() || residentManagedUnits.empty()) {
+        return true;
+    }
+
+    DPRINTF(CudaGPUPageTable, "Writing back %d resident managed units\n",
+            residentManagedUnits.size());
+    while (!residentManagedUnits.empty()) {
+        evictManagedUnit(tc);
+    }
+    return false;
 }
 
 void CudaGPU::regStats()
@@ -779,6 +2366,173 @@ void CudaGPU::regStats()
     numKernelsCompleted
         .name(name() + ".kernels_completed")
         .desc("Number of kernels completed");
+    numStreamOperations
+        .name(name() + ".stream_operations")
+        .desc("Number of stream operations started");
+    concurrentKernels
+        .name(name() + ".concurrent_kernels")
+        .desc("Number of kernels running when each kernel is launched")
+        .init(16);
+    copyKernelOverlapTicks
+        .name(name() + ".copy_kernel_overlap_ticks")
+        .desc("Ticks during which copies overlapped with kernel execution");
+    mappedHostBytes
+        .name(name() + ".mapped_host_bytes")
+        .desc("Bytes of pinned host memory mapped into the GPU address space");
+    managedMigrations
+        .name(name() + ".managed_migrations")
+        .desc("Number of managed memory units migrated to GPU memory");
+    managedMigrationBytes
+        .name(name() + ".managed_migration_bytes")
+        .desc("Bytes of managed memory migrated to GPU memory");
+    managedEvictions
+        .name(name() + ".managed_evictions")
+        .desc("Number of managed memory units evicted from GPU memory");
+    managedEvictionBytes
+        .name(name() + ".managed_eviction_bytes")
+        .desc("Bytes of managed memory evicted from GPU memory");
+    deviceMemAllocations
+        .name(name() + ".device_mem_allocations")
+        .desc("Number of device memory allocations");
+    deviceMemFrees
+        .name(name() + ".device_mem_frees")
+        .desc("Number of device memory allocations freed");
+    deviceMemFailedAllocations
+        .name(name() + ".device_mem_failed_allocations")
+        .desc("Number of device memory allocations that did not fit");
+    deviceMemAllocatedBytes
+        .name(name() + ".device_mem_allocated_bytes")
+        .desc("Bytes of device memory allocated, including managed frames");
+    deviceMemPeakBytes
+        .name(name() + ".device_mem_peak_bytes")
+        .desc("Peak bytes of device memory allocated");
+    deviceMemInternalFragmentation
+        .name(name() + ".device_mem_internal_fragmentation")
+        .desc("Bytes of device memory allocated beyond the requested sizes");
+    deviceMemExternalFragmentation
+        .name(name() + ".device_mem_external_fragmentation")
+        .desc("Fraction of free device memory outside the largest free block");
+    devDirPages
+        .init(numDevDirs)
+        .name(name() + ".dev_dir_pages")
+        .desc("Device pages placed in each device directory");
+    devDirAccesses
+        .init(numDevDirs)
+        .name(name() + ".dev_dir_accesses")
+        .desc("GPU core and copy engine accesses to each device directory");
+    devDirBytes
+        .init(numDevDirs)
+        .name(name() + ".dev_dir_bytes")
+        .desc("Bytes accessed in each device directory");
+    firstTouchPlacements
+        .name(name() + ".first_touch_placements")
+        .desc("Device pages placed on their first access");
+    placementHintMoves
+        .name(name() + ".placement_hint_moves")
+        .desc("Device pages moved to another directory by placement hints");
+}
+
+void
+GPGPUSimComponentWrapper::componentCycleStart()
+{
+    assert(startCycleFunction);
+    assert(!sleeping);
+
+    if (theGPU->active()) {
+        (theGPU->*startCycleFunction)();
+        if (cudaGPU) {
+            cudaGPU->componentCycled(this);
+        }
+    }
+
+    if (theGPU->active()) {
+        // Reschedule the start cycle event
+        schedule(componentCycleStartEvent, nextCycle());
+    }
+}
+
+void
+GPGPUSimComponentWrapper::componentCycleEnd()
+{
+    assert(endCycleFunction || cudaGPU);
+    assert(!sleeping);
+
+    if (theGPU->active() && endCycleFunction) {
+        (theGPU->*endCycleFunction)();
+    }
+
+    if (cudaGPU) {
+        cudaGPU->componentCycled(this);
+    }
+
+    if (theGPU->active()) {
+        if (cudaGPU && cudaGPU->canComponentSleep(this)) {
+            sleep();
+            return;
+        }
+
+        // Reschedule the end cycle event
+        schedule(componentCycleEndEvent, nextCycle());
+    }
+}
+
+void
+GPGPUSimComponentWrapper::sleep()
+{
+    assert(!sleeping);
+    sleeping = true;
+
+    // The start event of the next cycle has already been scheduled
+    if (componentCycleStartEvent.scheduled()) {
+        deschedule(componentCycleStartEvent);
+    }
+    sleepEdge = nextCycle();
+
+    DPRINTF(CudaGPUTick, "%s going to sleep\n", name());
+}
+
+void
+GPGPUSimComponentWrapper::wakeup()
+{
+    if (!sleeping) {
+        return;
+    }
+    sleeping = false;
+
+    // Cycles from the first skipped one up to the next clock edge are
+    // accounted for without simulating them
+    Tick resume = std::max(clockEdge(), sleepEdge);
+    unsigned long long skipped = (resume - sleepEdge) / clockPeriod();
+    if (skipped > 0) {
+#if GPGPU_SIM_CYCLE_SKIP
+        assert(skipCyclesFunction);
+        (theGPU->*skipCyclesFunction)(skipped);
+        numSkippedCycles += skipped;
+#else
+        panic("%s slept without GPGPU-Sim cycle skipping support\n",
+              name());
+#endif
+    }
+
+    DPRINTF(CudaGPUTick, "%s waking up after skipping %d cycles\n", name(),
+            skipped);
+
+    if (theGPU->active()) {
+        schedule(componentCycleStartEvent, resume);
+        schedule(componentCycleEndEvent, resume);
+    }
+}
+
+void
+GPGPUSimComponentWrapper::regStats()
+{
+    ClockedObject::regStats();
+
+#if GPGPU_SIM_CYCLE_SKIP
+    numSkippedCycles
+        .name(name() + ".skipped_cycles")
+        .desc("Number of idle cycles skipped while sleeping");
+#endif
 }
 
 GPGPUSimComponentWrapper *GPGPUSimComponentWrapperParams::create() {
@@ -29,6 +29,7 @@
 #ifndef __CUDA_GPU_HH__
 #define __CUDA_GPU_HH__
 
+#include <list>
 #include <map>
 #include <queue>
 #include <set>
@@ -36,11 +37,14 @@
 #include <vector>
 
 #include "base/callback.hh"
+#include "config/gpgpu_sim_cycle_skip.hh"
 #include "debug/CudaGPU.hh"
 #include "debug/CudaGPUPageTable.hh"
 #include "gpgpu-sim/gpu-sim.h"
 #include "gpu/gpgpu-sim/cuda_core.hh"
+#include "gpu/copy_descriptor.hh"
 #include "gpu/copy_engine.hh"
+#include "gpu/gpu_memory_allocator.hh"
 #include "gpu/shader_mmu.hh"
 #include "params/CudaGPU.hh"
 #include "params/GPGPUSimComponentWrapper.hh"
@@ -50,6 +54,8 @@
 #include "sim/system.hh"
 #include "stream_manager.h"
 
+class CudaGPU;
+
 /**
  * A wrapper class to manage the clocking of GPGPU-Sim-side components.
  * The CudaGPU must contain one of these wrappers for each clocked component or
@@ -57,6 +63,12 @@
  * GPGPU-Sim components that are separately cycled: the shader cores, the
  * interconnect, the GPU L2 cache and the DRAM.
  *
+ * At the end of each cycle, a component asks the CudaGPU whether it can
+ * sleep. A sleeping component's cycle events are descheduled until it is
+ * woken up with wakeup(), which resumes cycling at the next clock edge and
+ * fast-forwards GPGPU-Sim's cycle counters over the skipped cycles. The
+ * number of cycles skipped is recorded in the component's statistics.
+ *
  * TODO: Eventually, the L2 and DRAM events should be eliminated by migrating
  * all GPU parameter and local memory accesses over to gem5-gpu.
  */
@@ -65,13 +77,34 @@ class GPGPUSimComponentWrapper : public ClockedObject
   private:
     gpgpu_sim *theGPU;
     typedef void (gpgpu_sim::*CycleFunc)();
+    typedef void (gpgpu_sim::*SkipCyclesFunc)(unsigned long long);
     CycleFunc startCycleFunction;
     CycleFunc endCycleFunction;
 
+    // Called when the component wakes up with the number of cycles it
+    // slept through. It must advance the component's cycle counters and
+    // per-cycle statistics as if it had simulated that many cycles without
+    // any work
+    SkipCyclesFunc skipCyclesFunction;
+
+    // The GPU that decides whether this component can sleep
+    CudaGPU *cudaGPU;
+
+    // Whether the component is currently skipping cycles, and the clock
+    // edge of the first cycle it skipped
+    bool sleeping;
+    Tick sleepEdge;
+
+#if GPGPU_SIM_CYCLE_SKIP
+    Stats::Scalar numSkippedCycles;
+#endif
+
   public:
     GPGPUSimComponentWrapper(const GPGPUSimComponentWrapperParams *p) :
         ClockedObject(p), theGPU(NULL), startCycleFunction(NULL),
-        endCycleFunction(NULL), componentCycleStartEvent(this),
+        endCycleFunction(NULL), skipCyclesFunction(NULL), cudaGPU(NULL),
+        sleeping(false), sleepEdge(0),
+        componentCycleStartEvent(this),
         // End cycle events must happen after all other components are cycled
         componentCycleEndEvent(this, false, Event::Progress_Event_Pri) {}
 
@@ -80,6 +113,11 @@ class GPGPUSimComponentWrapper : public ClockedObject
         theGPU = _gpu;
     }
 
+    void setCudaGPU(CudaGPU *_cuda_gpu) {
+        assert(!cudaGPU);
+        cudaGPU = _cuda_gpu;
+    }
+
     void setStartCycleFunction(CycleFunc _cycle_func) {
         assert(!startCycleFunction);
         startCycleFunction = _cycle_func;
@@ -90,6 +128,11 @@ class GPGPUSimComponentWrapper : public ClockedObject
         endCycleFunction = _cycle_func;
     }
 
+    void setSkipCyclesFunction(SkipCyclesFunc _skip_func) {
+        assert(!skipCyclesFunction);
+        skipCyclesFunction = _skip_func;
+    }
+
     void scheduleEvent(Tick ticks_in_future) {
         Tick start_time;
         if (ticks_in_future < clockPeriod()) {
@@ -98,43 +141,45 @@ class GPGPUSimComponentWrapper : public ClockedObject
             start_time = clockEdge(ticksToCycles(ticks_in_future));
         }
 
+        assert(!sleeping);
         assert(startCycleFunction);
         assert(!componentCycleStartEvent.scheduled());
         schedule(componentCycleStartEvent, start_time);
 
-        if (endCycleFunction) {
+        // Components without an end cycle function still need the end of
+        // each cycle to decide whether they can sleep
+        if (endCycleFunction || cudaGPU) {
             assert(!componentCycleEndEvent.scheduled());
             schedule(componentCycleEndEvent, start_time);
         }
     }
 
-  protected:
+    bool isSleeping() const { return sleeping; }
 
-    void componentCycleStart() {
-        assert(startCycleFunction);
+    /// True if the component is being cycled, even if currently sleeping
+    bool isRunning() const {
+        return sleeping || componentCycleStartEvent.scheduled() ||
+               componentCycleEndEvent.scheduled();
+    }
 
-        if (theGPU->active()) {
-            (theGPU->*startCycleFunction)();
-        }
+    /**
+     * Resume cycling a sleeping component at the next clock edge, the
+     * first one that can observe the event that woke it up, after
+     * fast-forwarding its cycle counters over the cycles it skipped. Does
+     * nothing if it is not sleeping.
+     */
+    void wakeup();
 
-        if (theGPU->active()) {
-            // Reschedule the start cycle event
-            schedule(componentCycleStartEvent, nextCycle());
-        }
-    }
+    void regStats();
 
-    void componentCycleEnd() {
-        assert(endCycleFunction);
+  protected:
 
-        if (theGPU->active()) {
-            (theGPU->*endCycleFunction)();
-        }
+    void componentCycleStart();
 
-        if (theGPU->active()) {
-            // Reschedule the end cycle event
-            schedule(componentCycleEndEvent, nextCycle());
-        }
-    }
+    void componentCycleEnd();
+
+    /// Deschedule the component's cycles until it is woken up
+    void sleep();
 
     EventWrapper<GPGPUSimComponentWrapper, &GPGPUSimComponentWrapper::componentCycleStart>
                                            componentCycleStartEvent;
@@ -149,8 +194,9 @@ class GPGPUSimComponentWrapper : public ClockedObject
  *  This class also holds pointers to all of the CUDA cores and the copy engine.
  *  Statistics for kernel times are also kept in this class.
  *
- *  Currently this class only supports a single GPU device and does not support
- *  concurrent kernels.
+ *  Currently this class only supports a single GPU device. Kernels from
+ *  different streams may execute concurrently as long as the streams belong
+ *  to the same address space.
  */
 class CudaGPU : public ClockedObject
 {
@@ -271,9 +317,20 @@ class CudaGPU : public ClockedObject
     GPGPUSimComponentWrapper &l2Wrapper;
     GPGPUSimComponentWrapper &dramWrapper;
 
+    /// Whether the component wrappers may sleep through cycles in which
+    /// their components have no work, e.g. while all cores are waiting on
+    /// memory accesses
+    bool skipIdleCoreCycles;
+
+    /// Returns true if all cores are waiting on gem5-side memory accesses
+    bool coresIdle();
+
     /// Callback for the stream manager tick
     void streamTick();
 
+    /// Called when a stream operation completes to start the next one
+    void streamOperationDone();
+
     /// Pointer to the copy engine for this device
     GPUCopyEngine *copyEngine;
 
@@ -291,12 +348,14 @@ class CudaGPU : public ClockedObject
     Tick launchDelay;
     Tick returnDelay;
 
-    /// If true there is a kernel currently executing
-    /// NOTE: Jason doesn't think we need this
-    bool running;
+    /// Tick at which each launched kernel was queued, by grid ID. A kernel
+    /// that would run concurrently with others does not start until the
+    /// launch delay has passed since it was queued
+    std::map<unsigned, Tick> kernelLaunchTicks;
 
-    /// True if the running thread is currently blocked and needs to be activated
-    bool unblockNeeded;
+    /// Returns true if the kernel may begin running now. If it has to wait
+    /// for its launch delay, retry_tick is lowered to when it may begin
+    bool canBeginKernel(kernel_info_t *kernel, Tick &retry_tick);
 
     /// Pointer to ruby system used to clear the Ruby stats
     /// NOTE: I think there is a more right way to do this
@@ -305,43 +364,96 @@ class CudaGPU : public ClockedObject
     /// Holds all of the CUDA cores in this GPU
     std::vector<CudaCore*> cudaCores;
 
-    /// The thread context, stream and thread ID currently running on the SPA
+    /// The thread context, thread ID and pagetable base of the address space
+    /// that the GPU is currently executing in. All concurrently running
+    /// stream operations must share this address space.
     ThreadContext *runningTC;
-    struct CUstream_st *runningStream;
     int runningTID;
     Addr runningPTBase;
-    void beginStreamOperation(struct CUstream_st *_stream) {
-        // We currently do not support multiple concurrent streams
-        if (runningStream || runningTC) {
-            panic("Already a stream operation running (only support one at a time)!");
-        }
-        // NOTE: This may cause a race: The runningTC may have changed (i.e.
-        // the thread was migrated) between when the thread queued the stream
-        // operation and when that operation starts executing here. By reading
-        // CR3 here, we could use this to double check that the correct thread
-        // is running. On the other hand, we could move the CR3 read into the
-        // operation queuing code to avoid the race, but we would not be able
-        // to detect of the thread had migrated since it queued the operation.
-        runningStream = _stream;
-        runningTC = runningStream->getThreadContext();
-        runningTID = runningTC->threadId();
-#if THE_ISA == X86_ISA
-        runningPTBase = runningTC->readMiscRegNoEffect(X86ISA::MISCREG_CR3);
-#else
-        // TODO: ARM ISA should use the TTBCR for user space (which appears
-        // to be called the TTBR1 register). Further investigation required.
-        warn_once("ISA's pagetable base register handling needs to be set up");
-#endif
-    }
-    void endStreamOperation() {
-        runningStream = NULL;
-        runningTC = NULL;
-        runningTID = -1;
-        runningPTBase = 0;
-    }
+
+    /// The streams that currently have an operation running on the GPU
+    std::set<struct CUstream_st*> runningStreams;
+    void beginStreamOperation(struct CUstream_st *_stream);
+    void endStreamOperation(struct CUstream_st *_stream);
+
+    /// The kernels currently running on the GPU by grid ID, and their streams
+    std::map<unsigned, struct CUstream_st*> runningKernels;
+
+    /// Hand a copy to the copy engine, which queues it if it is busy
+    void issueCopyOperation(const CopyDescriptor &desc,
+                            struct CUstream_st *_stream);
+
+    /// The streams of the operations queued in the copy engine, in order
+    std::queue<struct CUstream_st*> copyStreams;
+
+    /// Copy and memset operations of a stream. Stream copy operations only
+    /// carry a base and a total length, so the descriptors of non-linear
+    /// copies (e.g. pitched copies) are kept by their position in the
+    /// stream and taken by the operation at that position when it starts.
+    struct StreamCopies
+    {
+        StreamCopies() : pushed(0), started(0) {}
+        uint64_t pushed;
+        uint64_t started;
+        std::map<uint64_t, CopyDescriptor> segmented;
+    };
+    std::map<struct CUstream_st*, StreamCopies> streamCopies;
+    bool takeSegmentedCopy(struct CUstream_st *_stream, bool is_memset,
+                           Addr dst, size_t count, CopyDescriptor &desc);
+
+    /// Accounts the time that copies overlap with kernel execution. Must be
+    /// called before the copy engine or the set of running kernels changes.
+    void updateCopyOverlap();
+    Tick lastCopyOverlapUpdate;
+
+    /// Stream handles given to the application, mapped to GPGPU-Sim streams.
+    /// Handle 0 refers to the default stream.
+    std::map<Addr, struct CUstream_st*> streamHandles;
+    Addr nextStreamHandle;
+
+    /// Streams that were destroyed while they still had pending operations.
+    /// They are released once their operations complete.
+    std::set<struct CUstream_st*> streamsToDestroy;
+    void destroyCompletedStreams();
+
+    /// Device allocations freed while stream operations were still queued
+    /// or running, which may access them. They are released once all
+    /// stream operations complete. Maps base address to size.
+    std::map<Addr, size_t> pendingGPUMemoryFrees;
+    void releasePendingGPUMemory();
+    void releaseGPUMemory(Addr vaddr, size_t size);
+
+    /// Event handles given to the application, mapped to GPGPU-Sim events
+    std::map<Addr, struct CUevent_st*> eventHandles;
+    Addr nextEventHandle;
+
+    /// Recorded events that have not completed yet, with the number of
+    /// updates each must reach to complete, and the completion tick of the
+    /// latest record of each completed event
+    std::map<struct CUevent_st*, unsigned> pendingEvents;
+    std::map<struct CUevent_st*, Tick> eventTicks;
+    std::set<struct CUevent_st*> eventsToDestroy;
+    void updateEvents();
 
     /// For statistics
+    /// kernelTimes holds the start and end of each period in which the GPU
+    /// was executing at least one kernel
     std::vector<Tick> kernelTimes;
+
+    /**
+     * Start and end times of each individual kernel, which may overlap with
+     * other kernels when running concurrently from multiple streams
+     */
+    class _KernelRecord
+    {
+      public:
+        unsigned gridId;
+        Tick start;
+        Tick end;
+    };
+    std::vector<_KernelRecord> kernelRecords;
+    std::map<unsigned, size_t> runningKernelRecords;
+
     Tick clearTick;
     bool dumpKernelStats;
 
@@ -397,28 +509,48 @@ class CudaGPU : public ClockedObject
     class GPUPageTable
     {
       private:
-        std::map<Addr, Addr> pageMap;
+        /**
+         * The page table maps contiguous ranges of whole pages with a single
+         * extent, indexed by the extent's base virtual address. Adjacent
+         * extents that are also physically contiguous are merged.
+         */
+        class Extent
+        {
+          public:
+            Extent() : size(0), paddr(0) {}
+            Extent(Addr _size, Addr _paddr) : size(_size), paddr(_paddr) {}
+            Addr size;
+            Addr paddr;
+        };
+        typedef std::map<Addr, Extent> ExtentMap;
+        ExtentMap extents;
+
+        // Incremented whenever a mapping is removed, so that cached
+        // translations can be checked for staleness
+        uint64_t version;
+
+        ExtentMap::iterator findExtent(Addr vaddr);
+        void mergeWithNext(ExtentMap::iterator iter);
 
       public:
-        GPUPageTable() {};
+        GPUPageTable() : version(0) {};
 
         Addr addrToPage(Addr addr);
-        void insert(Addr vaddr, Addr paddr) {
-            if (pageMap.find(vaddr) == pageMap.end()) {
-                pageMap[vaddr] = paddr;
-            } else {
-                assert(paddr == pageMap[vaddr]);
-            }
-        }
+        void insert(Addr vaddr, Addr paddr);
+        /// Map size bytes of whole pages starting at vaddr to contiguous
+        /// physical memory starting at paddr
+        void insertRange(Addr vaddr, Addr paddr, Addr size);
         bool lookup(Addr vaddr, Addr& paddr) {
-            Addr page_vaddr = addrToPage(vaddr);
-            Addr offset = vaddr - page_vaddr;
-            if (pageMap.find(page_vaddr) != pageMap.end()) {
-                paddr = pageMap[page_vaddr] + offset;
-                return true;
-            }
-            return false;
+            Addr extent_vaddr, extent_size;
+            return lookup(vaddr, paddr, extent_vaddr, extent_size);
         }
+        /// Also returns the extent containing vaddr, which is contiguous in
+        /// both virtual and physical memory
+        bool lookup(Addr vaddr, Addr& paddr, Addr &extent_vaddr,
+                    Addr &extent_size);
+        void remove(Addr vaddr);
+        uint64_t getVersion() { return version; }
+        size_t getNumExtents() { return extents.size(); }
         /// For checkpointing
         void serialize(CheckpointOut &cp) const;
         void unserialize(CheckpointIn &cp);
@@ -427,9 +559,148 @@ class CudaGPU : public ClockedObject
     bool manageGPUMemory;
     bool accessHostPageTable;
     AddrRange gpuMemoryRange;
-    Addr physicalGPUBrkAddr;
-    Addr virtualGPUBrkAddr;
-    std::map<Addr,size_t> allocatedGPUMemory;
+
+    /**
+     * Allocators for the GPU's virtual address space. Device memory is
+     * allocated from [PageBytes, PageBytes + gpuMemoryRange.size()), which
+     * is mapped linearly onto GPU physical memory. Mapped host memory is
+     * allocated from a window of the same size above it.
+     */
+    GPUMemoryAllocator *deviceAllocator;
+    GPUMemoryAllocator *mappedHostAllocator;
+    Addr deviceVaddrBase;
+    Addr mappedHostVaddrBase;
+    Addr virtualGPUMemoryEnd;
+    void updateDeviceMemoryStats();
+
+    /**
+     * Device page placement. GPU physical memory is interleaved across the
+     * device directories by the address bits starting at devDirLowBit. With
+     * linear placement, device virtual addresses map linearly onto physical
+     * memory. Otherwise, each device page is mapped to a frame in the
+     * directory chosen by the placement policy: pages are interleaved
+     * across directories, or, with first-touch placement, placed in the
+     * directory nearest to the core that first accesses them. Pages first
+     * touched by the copy engine are interleaved.
+     */
+    enum PagePlacement {
+        LinearPlacement,
+        InterleavePlacement,
+        FirstTouchPlacement
+    };
+    PagePlacement pagePlacement;
+
+    /**
+     * Device memory translation. By default, GPU accesses to device memory
+     * translate through the TLBs and the GPU page table. With segment
+     * translation, they instead translate with a base/limit check and an
+     * offset, like a direct segment, since linear placement maps all of
+     * device memory contiguously. Identity translation also allocates
+     * device memory at the virtual addresses equal to its physical
+     * addresses, so the offset is 0. The GPU page table is still kept up
+     * to date for functional accesses.
+     */
+    bool deviceSegment;
+    unsigned numDevDirs;
+    unsigned devDirLowBit;
+    unsigned nextInterleaveDir;
+    // Freed frames of each directory, and the next frame of each directory
+    // that has never been allocated
+    std::vector<std::vector<Addr> > freeDirFrames;
+    std::vector<Addr> nextDirFrame;
+    // Allocated device pages waiting for their first touch
+    std::set<Addr> unplacedPages;
+    unsigned getDevDir(Addr paddr) {
+        return (paddr >> devDirLowBit) & (numDevDirs - 1);
+    }
+    unsigned nearestDevDir(int core_id);
+    Addr allocateFrame(unsigned dir);
+    void releaseFrame(Addr frame);
+    void placeDevicePage(Addr page_vaddr, unsigned dir);
+    void mapDevicePages(Addr vaddr, size_t size, bool first_touch);
+    void unmapDevicePages(Addr vaddr, size_t size);
+
+    /**
+     * Mapped pinned (zero-copy) host allocations, indexed by host virtual
+     * address. The GPU accesses these directly in host memory through
+     * deviceVaddr, so they never need to be copied by the copy engine.
+     */
+    class _HostAllocation
+    {
+      public:
+        _HostAllocation() : size(0), deviceVaddr(0) {}
+        _HostAllocation(size_t _size, Addr device_vaddr) :
+            size(_size), deviceVaddr(device_vaddr) {}
+        size_t size;
+        Addr deviceVaddr;
+    };
+    std::map<Addr, _HostAllocation> hostAllocations;
+
+    /**
+     * Host pages that the simulator allocates for the process (mapped pinned
+     * and managed memory) come from a region of the process' mmap space.
+     * The region is reserved from the process once, the same way an
+     * anonymous mmap would be, so the process' own mmaps never overlap it.
+     * Its pages are backed by physical memory when first allocated, and
+     * freed ranges are reused by later allocations.
+     */
+    size_t hostRegionSize;
+    Addr hostRegionBase;
+    GPUMemoryAllocator *hostRegionAllocator;
+    void reserveHostRegion(ThreadContext *tc);
+    Addr allocateHostPages(ThreadContext *tc, size_t size);
+    void freeHostPages(Addr vaddr);
+
+    /**
+     * Managed (unified) memory. Managed allocations are backed by host pages
+     * and use the same virtual addresses on the CPU and the GPU. In split
+     * mode, they are divided into units of managedMigrationSize bytes. A GPU
+     * access to a unit that is not resident in GPU memory faults to the
+     * ShaderMMU, and the copy engine migrates the unit into a frame of GPU
+     * memory. When there are no free frames, resident units are evicted back
+     * to host memory in the order that they were migrated. The CPU only
+     * accesses host memory, so when a thread's wait for the GPU completes
+     * while the GPU is idle, all resident units are evicted first. All of
+     * these copies are timed by the copy engine.
+     */
+    class _ManagedUnit
+    {
+      public:
+        _ManagedUnit() :
+            size(0), frame(0), resident(false), migrating(false) {}
+        size_t size;
+        Addr frame;
+        bool resident;
+        bool migrating;
+    };
+    // Managed allocations (base address to size) and their units
+    std::map<Addr, size_t> managedAllocations;
+    std::map<Addr, _ManagedUnit> managedUnits;
+    // Resident units, in the order they were migrated
+    std::list<Addr> residentManagedUnits;
+    size_t managedMigrationSize;
+    size_t managedMemoryLimit;
+    // Frames are allocated from device memory, up to managedMemoryLimit.
+    // Unit frames hold the device virtual address of the frame memory.
+    size_t managedFrameBytes;
+    Addr managedFramePaddr(const _ManagedUnit &unit, Addr offset);
+    bool allocateManagedFrame(Addr &frame);
+    void releaseManagedFrame(Addr frame);
+    void evictManagedUnit(ThreadContext *tc);
+    // Units waiting for a frame to migrate into, in the order they faulted
+    std::list<Addr> waitingManagedMigrations;
+    void startManagedMigrations();
+    // Frames of units being evicted, in eviction order. A frame stays
+    // allocated until its unit has been copied back to host memory.
+    std::queue<Addr> evictingManagedFrames;
+    void addManagedSegments(CopyDescriptor &desc, ThreadContext *tc,
+                            Addr unit_base, const _ManagedUnit &unit,
+                            bool to_gpu);
+    void mapManagedUnit(Addr unit_base, const _ManagedUnit &unit, bool map);
+    Addr translateHostAddress(ThreadContext *tc, Addr vaddr);
+    /// Evict resident units if the GPU is idle. Returns whether host memory
+    /// is up to date for the CPU to access.
+    bool writeBackManagedMemory(ThreadContext *tc);
 
     ShaderMMU *shaderMMU;
 
@@ -481,9 +752,33 @@ class CudaGPU : public ClockedObject
     void handleFinishPageFault(ThreadContext *tc)
         { shaderMMU->handleFinishPageFault(tc); }
 
+    /**
+     * Called by the CPU TLBs when they invalidate the host translation of
+     * vaddr (e.g. INVLPG) or all host translations (e.g. a CR3 write), to
+     * shoot the translations down from the GPU TLBs and the copy engine
+     */
+    void demapHostPage(Addr vaddr) { shaderMMU->demapPage(vaddr); }
+    void flushHostTranslations() { shaderMMU->flushAll(); }
+
     ShaderMMU *getMMU() { return shaderMMU; }
 
-    /// Schedules the stream manager to be checked in 'ticks' ticks from now
+    /**
+     * Called by the component wrappers at the end of each cycle. Returns
+     * true if the component can sleep until it is explicitly woken up
+     */
+    bool canComponentSleep(GPGPUSimComponentWrapper *component);
+
+    /**
+     * Called by the component wrappers after each simulated part of a
+     * cycle to wake up any sleeping component that now has work to do
+     */
+    void componentCycled(GPGPUSimComponentWrapper *component);
+
+    /// Wake the shader cores wrapper if it is skipping idle cycles
+    void wakeupCores() { coresWrapper.wakeup(); }
+
+    /// Schedules the stream manager to be checked on the next cycle. Called
+    /// by the stream manager when an operation is pushed
     void scheduleStreamEvent();
 
     /// Reset statistics for the SPA and for all of Ruby
@@ -516,6 +811,12 @@ class CudaGPU : public ClockedObject
     /// Called by the copy engine when a memcpy or memset is complete
     void finishCopyOperation();
 
+    /// Push a copy or memset stream operation. A non-linear copy is pushed
+    /// with its first segment's addresses and its total length, and its
+    /// descriptor is attached to the operation
+    void pushCopyOperation(stream_operation &op,
+                           const CopyDescriptor *desc = NULL);
+
     /// Called from shader TLB to be used for TLB lookups
     /// TODO: Move the thread context handling to GPU context when we get there
     ThreadContext *getThreadContext() { return runningTC; }
@@ -552,12 +853,34 @@ class CudaGPU : public ClockedObject
         // those that are in page-walks). This possibility seems unlikely.
     }
 
-    /// Used when blocking and signaling threads
+    /// Used when blocking and signaling threads. Each blocked thread waits
+    /// for the completion of a single stream, or of all streams if NULL.
     std::map<ThreadContext*, Addr> blockedThreads;
-    bool needsToBlock();
+    std::map<ThreadContext*, struct CUstream_st*> threadWaitStreams;
+    std::map<ThreadContext*, struct CUevent_st*> threadWaitEvents;
+    bool needsToBlock(ThreadContext *tc, struct CUstream_st *stream = NULL);
+    bool needsToBlockOnEvent(ThreadContext *tc, struct CUevent_st *event);
+    bool threadWaitComplete(ThreadContext *tc);
     void blockThread(ThreadContext *tc, Addr signal_ptr);
     void signalThread(ThreadContext *tc, Addr signal_ptr);
     void unblockThread(ThreadContext *tc);
+    void unblockThreads();
+
+    /// Create, look up and destroy the streams named by application handles
+    Addr createStream();
+    struct CUstream_st *getStream(Addr handle);
+    void destroyStream(Addr handle);
+
+    /// Create, look up, record and destroy the events named by application
+    /// handles. Events complete when their stream reaches them.
+    Addr createEvent();
+    struct CUevent_st *getEvent(Addr handle);
+    void recordEvent(struct CUevent_st *event);
+    bool isEventComplete(struct CUevent_st *event) {
+        return !pendingEvents.count(event);
+    }
+    Tick getEventTick(struct CUevent_st *event);
+    void destroyEvent(Addr handle);
 
     void saveFatBinaryInfoTop(int tid, unsigned int handle, Addr sim_fatCubin, size_t sim_binSize) {
         _FatBinary bin;
@@ -604,11 +927,68 @@ class CudaGPU : public ClockedObject
     void registerDeviceInstText(ThreadContext *tc, Addr vaddr, size_t size);
     bool isManagingGPUMemory() { return manageGPUMemory; }
     bool isAccessingHostPagetable() { return accessHostPageTable; }
-    Addr allocateGPUMemory(size_t size);
+    Addr allocateGPUMemory(size_t size, bool first_touch = false);
+    bool freeGPUMemory(Addr vaddr);
+    /// Translate vaddr with the device memory segment. Returns false if
+    /// segment translation is off or vaddr is not in device memory.
+    bool translateDeviceSegment(Addr vaddr, Addr &paddr) {
+        if (!deviceSegment ||
+            vaddr - deviceVaddrBase >= gpuMemoryRange.size()) {
+            return false;
+        }
+        paddr = gpuMemoryRange.start() + (vaddr - deviceVaddrBase);
+        return true;
+    }
+
+    /// For placing device pages across the device directories
+    bool touchDevicePage(Addr vaddr, int core_id);
+    bool adviseDevicePlacement(Addr vaddr, size_t size, unsigned dir);
+    void recordDeviceAccess(Addr paddr, unsigned size);
+
+    /// For handling mapped pinned host memory
+    Addr allocateMappedHostMemory(ThreadContext *tc, size_t size);
+    bool freeMappedHostMemory(Addr host_vaddr);
+    bool getMappedDevicePointer(Addr host_vaddr, Addr &device_vaddr);
+
+    /// For handling managed memory
+    Addr allocateManagedMemory(ThreadContext *tc, size_t size);
+    bool freeManagedMemory(Addr vaddr);
+    bool getManagedUnit(Addr vaddr, Addr &unit_base);
+    bool isManagedAddress(Addr vaddr) {
+        Addr unit_base;
+        return getManagedUnit(vaddr, unit_base);
+    }
+    bool translateManagedAddress(Addr vaddr, Addr &paddr);
+    void migrateManagedMemory(Addr unit_base);
+    void finishMigration(const CopyDescriptor &desc);
+
+    void recordKernelLaunch(unsigned grid_id) {
+        kernelLaunchTicks[grid_id] = curTick();
+    }
 
     /// Statistics for this GPU
     Stats::Scalar numKernelsStarted;
     Stats::Scalar numKernelsCompleted;
+    Stats::Scalar numStreamOperations;
+    Stats::Histogram concurrentKernels;
+    Stats::Scalar copyKernelOverlapTicks;
+    Stats::Scalar mappedHostBytes;
+    Stats::Scalar managedMigrations;
+    Stats::Scalar managedMigrationBytes;
+    Stats::Scalar managedEvictions;
+    Stats::Scalar managedEvictionBytes;
+    Stats::Scalar deviceMemAllocations;
+    Stats::Scalar deviceMemFrees;
+    Stats::Scalar deviceMemFailedAllocations;
+    Stats::Scalar deviceMemAllocatedBytes;
+    Stats::Scalar deviceMemPeakBytes;
+    Stats::Scalar deviceMemInternalFragmentation;
+    Stats::Scalar deviceMemExternalFragmentation;
+    Stats::Vector devDirPages;
+    Stats::Vector devDirAccesses;
+    Stats::Vector devDirBytes;
+    Stats::Scalar firstTouchPlacements;
+    Stats::Scalar placementHintMoves;
     void regStats();
 };
 
@@ -0,0 +1,296 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <algorithm>
+
+#include "base/intmath.hh"
+#include "base/misc.hh"
+#include "gpu/gpu_memory_allocator.hh"
+
+using namespace std;
+
+GPUMemoryAllocator::GPUMemoryAllocator(Addr _base, size_t size,
+                                       size_t min_block_size) :
+    base(_base), end(_base + size), minOrder(ceilLog2(min_block_size)),
+    maxOrder(floorLog2(_base + size)), allocatedBytes(0), requestedBytes(0)
+{
+    if (!isPowerOf2(min_block_size)) {
+        fatal("GPU memory allocator block size (%d) must be a power of 2\n",
+              min_block_size);
+    }
+    if (base % min_block_size || end % min_block_size) {
+        fatal("GPU memory allocator range [%#x, %#x) must be aligned to the "
+              "block size (%d)\n", base, end, min_block_size);
+    }
+    freeBlocks.resize(maxOrder + 1);
+    reset();
+}
+
+void
+GPUMemoryAllocator::reset()
+{
+    for (unsigned order = 0; order <= maxOrder; order++) {
+        freeBlocks[order].clear();
+    }
+    allocations.clear();
+    allocatedBytes = 0;
+    requestedBytes = 0;
+    releaseRange(base, end);
+}
+
+void
+GPUMemoryAllocator::freeBlock(Addr addr, unsigned order)
+{
+    // Merge with the buddy block for as long as it is free
+    while (order < maxOrder) {
+        Addr buddy = addr ^ ((Addr)1 << order);
+        if (!freeBlocks[order].erase(buddy)) {
+            break;
+        }
+        addr = std::min(addr, buddy);
+        order++;
+    }
+    freeBlocks[order].insert(addr);
+}
+
+void
+GPUMemoryAllocator::releaseRange(Addr start, Addr range_end)
+{
+    // Split the range into the largest naturally aligned blocks
+    while (start < range_end) {
+        unsigned order = minOrder;
+        while (order < maxOrder &&
+               start % ((Addr)1 << (order + 1)) == 0 &&
+               start + ((Addr)1 << (order + 1)) <= range_end) {
+            order++;
+        }
+        freeBlock(start, order);
+        start += (Addr)1 << order;
+    }
+}
+
+bool
+GPUMemoryAllocator::reserveRange(Addr start, Addr range_end)
+{
+    Addr cur = start;
+    while (cur < range_end) {
+        // Find the free block containing cur, and return the parts of it
+        // outside of the range to the free lists
+        bool found = false;
+        for (unsigned order = minOrder; order <= maxOrder; order++) {
+            Addr block = cur & ~(((Addr)1 << order) - 1);
+            if (freeBlocks[order].erase(block)) {
+                Addr block_end = block + ((Addr)1 << order);
+                Addr used_end = std::min(block_end, range_end);
+                releaseRange(block, cur);
+                releaseRange(used_end, block_end);
+                cur = used_end;
+                found = true;
+                break;
+            }
+        }
+        if (!found) {
+            return false;
+        }
+    }
+    return true;
+}
+
+bool
+GPUMemoryAllocator::findFreeRun(size_t size, Addr &addr) const
+{
+    // Allocations larger than any free block may still fit in a run of
+    // adjacent free blocks that are not buddies
+    map<Addr, Addr> free_ranges;
+    for (unsigned order = minOrder; order <= maxOrder; order++) {
+        set<Addr>::const_iterator it = freeBlocks[order].begin();
+        for (; it != freeBlocks[order].end(); ++it) {
+            free_ranges[*it] = *it + ((Addr)1 << order);
+        }
+    }
+
+    Addr run_start = 0;
+    Addr run_end = 0;
+    map<Addr, Addr>::iterator it = free_ranges.begin();
+    for (; it != free_ranges.end(); ++it) {
+        if (it->first != run_end) {
+            run_start = it->first;
+        }
+        run_end = it->second;
+        if (run_end - run_start >= size) {
+            addr = run_start;
+            return true;
+        }
+    }
+    return false;
+}
+
+bool
+GPUMemoryAllocator::allocate(size_t size, Addr &addr)
+{
+    size_t alloc_size = roundUp(std::max(size, (size_t)1),
+                                (size_t)1 << minOrder);
+    unsigned order = std::max(ceilLog2(alloc_size), (int)minOrder);
+
+    // Use the lowest addressed block of the smallest sufficient order
+    unsigned found_order = order;
+    while (found_order <= maxOrder && freeBlocks[found_order].empty()) {
+        found_order++;
+    }
+    if (found_order <= maxOrder) {
+        set<Addr>::iterator iter = freeBlocks[found_order].begin();
+        addr = *iter;
+        freeBlocks[found_order].erase(iter);
+
+        // Return the unused tail of the block to the free lists
+        releaseRange(addr + alloc_size, addr + ((Addr)1 << found_order));
+    } else if (!findFreeRun(alloc_size, addr) ||
+               !reserveRange(addr, addr + alloc_size)) {
+        return false;
+    }
+
+    allocations[addr] = Allocation(size, alloc_size);
+    allocatedBytes += alloc_size;
+    requestedBytes += size;
+    return true;
+}
+
+bool
+GPUMemoryAllocator::free(Addr addr)
+{
+    map<Addr, Allocation>::iterator iter = allocations.find(addr);
+    if (iter == allocations.end()) {
+        return false;
+    }
+    releaseRange(addr, addr + iter->second.size);
+    allocatedBytes -= iter->second.size;
+    requestedBytes -= iter->second.requested;
+    allocations.erase(iter);
+    return true;
+}
+
+bool
+GPUMemoryAllocator::lookup(Addr addr, Addr &alloc_base, size_t &size) const
+{
+    map<Addr, Allocation>::const_iterator iter = allocations.upper_bound(addr);
+    if (iter == allocations.begin()) {
+        return false;
+    }
+    --iter;
+    if (addr >= iter->first + iter->second.size) {
+        return false;
+    }
+    alloc_base = iter->first;
+    size = iter->second.requested;
+    return true;
+}
+
+bool
+GPUMemoryAllocator::overlaps(Addr start, size_t size) const
+{
+    map<Addr, Allocation>::const_iterator iter =
+        allocations.lower_bound(start + size);
+    if (iter == allocations.begin()) {
+        return false;
+    }
+    --iter;
+    return iter->first + iter->second.size > start;
+}
+
+size_t
+GPUMemoryAllocator::getLargestFreeBlock() const
+{
+    for (int order = maxOrder; order >= (int)minOrder; order--) {
+        if (!freeBlocks[order].empty()) {
+            return (size_t)1 << order;
+        }
+    }
+    return 0;
+}
+
+double
+GPUMemoryAllocator::getFragmentation() const
+{
+    size_t free_bytes = getFreeBytes();
+    if (free_bytes == 0) {
+        return 0.0;
+    }
+    return 1.0 - (double)getLargestFreeBlock() / free_bytes;
+}
+
+void
+GPUMemoryAllocator::serialize(const string &name, CheckpointOut &cp) const
+{
+    unsigned int num_allocations = allocations.size();
+    Addr *alloc_addrs = new Addr[num_allocations];
+    uint64_t *alloc_requested = new uint64_t[num_allocations];
+    unsigned int index = 0;
+    map<Addr, Allocation>::const_iterator it = allocations.begin();
+    for (; it != allocations.end(); ++it) {
+        alloc_addrs[index] = it->first;
+        alloc_requested[index++] = it->second.requested;
+    }
+    paramOut(cp, name + ".num_allocations", num_allocations);
+    arrayParamOut(cp, name + ".alloc_addrs", alloc_addrs, num_allocations);
+    arrayParamOut(cp, name + ".alloc_requested", alloc_requested,
+                  num_allocations);
+    delete[] alloc_addrs;
+    delete[] alloc_requested;
+}
+
+bool
+GPUMemoryAllocator::unserialize(const string &name, CheckpointIn &cp)
+{
+    unsigned int num_allocations = 0;
+    if (!optParamIn(cp, name + ".num_allocations", num_allocations)) {
+        return false;
+    }
+    Addr *alloc_addrs = new Addr[num_allocations];
+    uint64_t *alloc_requested = new uint64_t[num_allocations];
+    arrayParamIn(cp, name + ".alloc_addrs", alloc_addrs, num_allocations);
+    arrayParamIn(cp, name + ".alloc_requested", alloc_requested,
+                 num_allocations);
+
+    reset();
+    for (unsigned int i = 0; i < num_allocations; ++i) {
+        size_t alloc_size = roundUp(std::max(alloc_requested[i], (uint64_t)1),
+                                    (uint64_t)1 << minOrder);
+        if (!reserveRange(alloc_addrs[i], alloc_addrs[i] + alloc_size)) {
+            panic("Unable to restore GPU memory allocation %#x\n",
+                  alloc_addrs[i]);
+        }
+        allocations[alloc_addrs[i]] =
+            Allocation(alloc_requested[i], alloc_size);
+        allocatedBytes += alloc_size;
+        requestedBytes += alloc_requested[i];
+    }
+
+    delete[] alloc_addrs;
+    delete[] alloc_requested;
+    return true;
+}
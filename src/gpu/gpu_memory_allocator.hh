@@ -0,0 +1,107 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __GPU_MEMORY_ALLOCATOR_HH__
+#define __GPU_MEMORY_ALLOCATOR_HH__
+
+#include <map>
+#include <set>
+#include <string>
+#include <vector>
+
+#include "base/types.hh"
+#include "sim/serialize.hh"
+
+/**
+ * A buddy allocator for ranges of GPU memory. Free memory is kept in lists of
+ * naturally aligned power-of-two blocks, which are split to satisfy
+ * allocations and merged with their buddies when freed. Allocations are
+ * rounded up to the minimum block size (e.g. a cache block), and the unused
+ * tail of the block that satisfies an allocation is returned to the free
+ * lists, so internal fragmentation is less than a minimum block.
+ */
+class GPUMemoryAllocator
+{
+  private:
+    class Allocation
+    {
+      public:
+        Allocation() : requested(0), size(0) {}
+        Allocation(size_t _requested, size_t _size) :
+            requested(_requested), size(_size) {}
+        // The number of bytes requested and actually allocated
+        size_t requested;
+        size_t size;
+    };
+
+    Addr base;
+    Addr end;
+    unsigned minOrder;
+    unsigned maxOrder;
+
+    // Free blocks of each order (i.e. of size 2^order)
+    std::vector<std::set<Addr> > freeBlocks;
+    std::map<Addr, Allocation> allocations;
+
+    size_t allocatedBytes;
+    size_t requestedBytes;
+
+    void freeBlock(Addr addr, unsigned order);
+    void releaseRange(Addr start, Addr range_end);
+    bool reserveRange(Addr start, Addr range_end);
+    bool findFreeRun(size_t size, Addr &addr) const;
+    void reset();
+
+  public:
+    GPUMemoryAllocator(Addr _base, size_t size, size_t min_block_size);
+
+    /// Allocate size bytes, returning false if there is no free range large
+    /// enough. Allocations are aligned to the minimum block size.
+    bool allocate(size_t size, Addr &addr);
+    /// Free the allocation at addr, returning false if there is none
+    bool free(Addr addr);
+    /// Get the allocation containing addr
+    bool lookup(Addr addr, Addr &alloc_base, size_t &size) const;
+    /// Whether any allocation overlaps [start, start + size)
+    bool overlaps(Addr start, size_t size) const;
+
+    size_t getAllocatedBytes() const { return allocatedBytes; }
+    size_t getRequestedBytes() const { return requestedBytes; }
+    size_t getFreeBytes() const { return (end - base) - allocatedBytes; }
+    size_t getLargestFreeBlock() const;
+    size_t getNumAllocations() const { return allocations.size(); }
+    /// The fraction of free memory that is not in the largest free block
+    double getFragmentation() const;
+
+    /// For checkpointing
+    void serialize(const std::string &name, CheckpointOut &cp) const;
+    /// Returns false if the checkpoint has no allocator state
+    bool unserialize(const std::string &name, CheckpointIn &cp);
+};
+
+#endif // __GPU_MEMORY_ALLOCATOR_HH__
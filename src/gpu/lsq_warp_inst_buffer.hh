@@ -80,6 +80,9 @@ class WarpInstBuffer {
     Tick firstCycleTick;
     Tick completeCycleTick;
     MasterID masterId;
+    // The core issuing the instruction, so the coalesced requests identify
+    // their core like the lane requests do
+    int contextId;
     // An array to hold warp instruction requests per lane (thread) while
     // they are coalesced and access the caches
     PacketPtr* laneRequestPkts;
@@ -229,6 +232,7 @@ class WarpInstBuffer {
         requestDataSize = pkt->getSize();
         pc = pkt->req->getPC();
         masterId = pkt->req->masterId();
+        contextId = pkt->req->contextId();
         bypassL1 = pkt->req->isBypassL1();
     }
     void startFence() {
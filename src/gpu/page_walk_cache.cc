@@ -0,0 +1,114 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <cassert>
+
+#include "base/misc.hh"
+#include "gpu/page_walk_cache.hh"
+
+using namespace std;
+
+PageWalkCache::PageWalkCache(const vector<int> &level_entries)
+{
+    if (level_entries.size() > NumLevels) {
+        fatal("Page walk cache has %d levels, but %d sizes were given\n",
+              NumLevels, level_entries.size());
+    }
+    for (unsigned level = 0; level < level_entries.size(); level++) {
+        if (level_entries[level] < 0) {
+            fatal("Page walk cache level %d size must not be negative\n",
+                  level);
+        }
+        levels[level].capacity = level_entries[level];
+        levels[level].entries.reserve(level_entries[level]);
+    }
+}
+
+bool
+PageWalkCache::enabled() const
+{
+    for (int level = 0; level < NumLevels; level++) {
+        if (levels[level].capacity > 0) {
+            return true;
+        }
+    }
+    return false;
+}
+
+int
+PageWalkCache::lookup(Addr vaddr, Entry &entry)
+{
+    for (int level = NumLevels - 1; level >= 0; level--) {
+        LevelCache &cache = levels[level];
+        if (cache.entries.empty()) {
+            continue;
+        }
+        auto it = cache.entries.find(getTag(level, vaddr));
+        if (it != cache.entries.end()) {
+            entry = it->second.first;
+            // Move the entry to the front of the LRU order
+            cache.lruTags.splice(cache.lruTags.begin(), cache.lruTags,
+                                 it->second.second);
+            return level;
+        }
+    }
+    return -1;
+}
+
+void
+PageWalkCache::insert(int level, Addr vaddr, const Entry &entry)
+{
+    assert(level >= 0 && level < NumLevels);
+    LevelCache &cache = levels[level];
+    if (cache.capacity == 0) {
+        return;
+    }
+    Addr tag = getTag(level, vaddr);
+    auto it = cache.entries.find(tag);
+    if (it != cache.entries.end()) {
+        it->second.first = entry;
+        cache.lruTags.splice(cache.lruTags.begin(), cache.lruTags,
+                             it->second.second);
+        return;
+    }
+    if (cache.entries.size() >= cache.capacity) {
+        cache.entries.erase(cache.lruTags.back());
+        cache.lruTags.pop_back();
+    }
+    cache.lruTags.push_front(tag);
+    cache.entries[tag] = make_pair(entry, cache.lruTags.begin());
+}
+
+void
+PageWalkCache::flush()
+{
+    for (int level = 0; level < NumLevels; level++) {
+        levels[level].entries.clear();
+        levels[level].lruTags.clear();
+    }
+}
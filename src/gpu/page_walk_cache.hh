@@ -0,0 +1,107 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __GPU_PAGE_WALK_CACHE_HH__
+#define __GPU_PAGE_WALK_CACHE_HH__
+
+#include <list>
+#include <unordered_map>
+#include <vector>
+
+#include "base/types.hh"
+
+/**
+ * Caches the upper-level entries of a 4-level (x86-64 style) page table, so
+ * page walks can skip the reads that would fetch them. Each level caches
+ * the base of the next-level table that an entry points to, tagged by the
+ * virtual address bits that index the page table down to that entry. Each
+ * level is fully associative with LRU replacement, and has its own size.
+ */
+class PageWalkCache
+{
+  public:
+    /// The levels of page table entries that are cached
+    enum Level {
+        PML4 = 0,
+        PDP,
+        PD,
+        NumLevels
+    };
+
+    class Entry
+    {
+      public:
+        Entry() : tableBase(0), writable(false), user(false) {}
+        Entry(Addr table_base, bool _writable, bool _user) :
+            tableBase(table_base), writable(_writable), user(_user) {}
+        // The physical base of the next-level table
+        Addr tableBase;
+        // Permissions accumulated over the levels down to this entry
+        bool writable;
+        bool user;
+    };
+
+  private:
+    class LevelCache
+    {
+      public:
+        LevelCache() : capacity(0) {}
+        unsigned capacity;
+        // Tags in LRU order, with the most recently used at the front
+        std::list<Addr> lruTags;
+        std::unordered_map<Addr,
+            std::pair<Entry, std::list<Addr>::iterator> > entries;
+    };
+
+    LevelCache levels[NumLevels];
+
+    /// The tag of the entry at level that maps vaddr
+    static Addr getTag(int level, Addr vaddr) {
+        return (vaddr & ((ULL(1) << 48) - 1)) >> (39 - 9 * level);
+    }
+
+  public:
+    /// level_entries gives the number of entries for each level, in order
+    /// from PML4. Levels with no entries are not cached.
+    PageWalkCache(const std::vector<int> &level_entries);
+
+    /// Whether any level has entries
+    bool enabled() const;
+
+    /// Find the deepest cached entry on the walk for vaddr, returning its
+    /// level, or -1 if no level has an entry for vaddr
+    int lookup(Addr vaddr, Entry &entry);
+
+    /// Cache the entry at level read while walking for vaddr
+    void insert(int level, Addr vaddr, const Entry &entry);
+
+    /// Remove all entries, e.g. when the page table root changes
+    void flush();
+};
+
+#endif // __GPU_PAGE_WALK_CACHE_HH__
@@ -30,6 +30,7 @@
  */
 
 #include "debug/ShaderLSQ.hh"
+#include "gpu/gpgpu-sim/cuda_gpu.hh"
 #include "gpu/shader_lsq.hh"
 
 using namespace std;
@@ -40,16 +41,22 @@ ShaderLSQ::ShaderLSQ(Params *p)
       warpSize(p->warp_size), maxNumWarpsPerCore(p->warp_contexts),
       atomsPerSubline(p->atoms_per_subline),
       flushing(false), flushingPkt(NULL), forwardFlush(p->forward_flush),
-      warpInstBufPoolSize(p->num_warp_inst_buffers), dispatchWarpInstBuf(NULL),
+      warpInstBufPoolSize(p->num_warp_inst_buffers), warpInstBufDebt(0),
+      dispatchWarpInstBuf(NULL),
       perWarpInstructionQueues(p->warp_contexts),
       perWarpOutstandingAccesses(p->warp_contexts),
       overallLatencyCycles(p->latency), l1TagAccessCycles(p->l1_tag_cycles),
-      tlb(p->data_tlb), sublineBytes(p->subline_bytes),
+      tlb(p->data_tlb), microTLB(NULL), microTLBFlushed(false),
+      microTLBFlushCycle(0),
+      tlbLookupPorts(p->tlb_lookup_ports), tlbPortCycle(0), tlbPortsUsed(0),
+      cudaGPU(p->gpu), sublineBytes(p->subline_bytes),
       nextAllowedInject(Cycles(0)), injectWidth(p->inject_width),
       mshrsFull(false), ejectWidth(p->eject_width), cacheLineAddrMaskBits(-1),
       lastWarpInstBufferChange(0), numActiveWarpInstBuffers(0),
-      dispatchInstEvent(this), injectAccessesEvent(this),
-      ejectAccessesEvent(this), commitInstEvent(this)
+      tlbRetryCallback(this), microTLBFlushCallback(this),
+      dispatchInstEvent(this),
+      injectAccessesEvent(this), ejectAccessesEvent(this),
+      commitInstEvent(this), retryTranslationsEvent(this)
 {
     // Create the lane ports based on the number threads per warp
     for (int i = 0; i < warpSize; i++) {
@@ -81,6 +88,20 @@ ShaderLSQ::ShaderLSQ(Params *p)
 
     // Set the number of bits to mask for cache line addresses
     cacheLineAddrMaskBits = log2(p->cache_line_size);
+
+    tlb->addMSHRRetry(&tlbRetryCallback);
+
+    if (p->utlb_entries > 0) {
+        // Only translations from the host page table are cached, since the
+        // data TLB does not cache translations from the GPU page table
+        if (tlb->accessesHostPageTable()) {
+            microTLB = new TLBMemory(p->utlb_entries, 0);
+            tlb->addInvalidateCallback(&microTLBFlushCallback);
+        } else {
+            warn("%s: micro-TLB is only used with the host page table\n",
+                 name());
+        }
+    }
 }
 
 ShaderLSQ::~ShaderLSQ()
@@ -90,6 +111,11 @@ ShaderLSQ::~ShaderLSQ()
     for (int i = 0; i < warpInstBufPoolSize; i++)
         delete warpInstBufPool[i];
     delete [] warpInstBufPool;
+    for (unsigned i = 0; i < extraWarpInstBufs.size(); i++)
+        delete extraWarpInstBufs[i];
+    if (microTLB) {
+        delete microTLB;
+    }
 }
 
 BaseMasterPort &
@@ -329,6 +355,128 @@ ShaderLSQ::dispatchWarpInst()
 void
 ShaderLSQ::issueWarpInstTranslations(WarpInstBuffer *warp_inst)
 {
+    const list<WarpInstBuffer::CoalescedAccess*> *coalesced_accesses =
+            warp_inst->getCoalescedAccesses();
+    warpCoalescedAccesses.sample(coalesced_accesses->size());
+    list<WarpInstBuffer::CoalescedAccess*>::const_iterator iter =
+            coalesced_accesses->begin();
+    for (; iter != coalesced_accesses->end(); iter++) {
+        translateAccess(*iter);
+    }
+}
+
+void
+ShaderLSQ::translateAccess(WarpInstBuffer::CoalescedAccess *mem_access)
+{
+    mem_access->tlbStartCycle = curCycle();
+    if (translateInMicroTLB(mem_access)) {
+        return;
+    }
+    // Hold accesses back while the TLB cannot accept more misses or all
+    // lookup ports are used this cycle, keeping them in order behind any
+    // accesses already waiting
+    if (tlb->isStalled() || !stalledTranslations.empty() || !claimTLBPort()) {
+        DPRINTF(ShaderLSQ, "[%d: ] TLB stalled translating vaddr: %p\n",
+                mem_access->getWarpId(), mem_access->req->getVaddr());
+        if (stalledTranslations.empty()) {
+            tlbStallStarted = curCycle();
+        }
+        stalledTranslations.push_back(mem_access);
+        if (tlb->isStalled()) {
+            tlbStalledAccesses++;
+        } else {
+            // The TLB calls back when an MSHR frees up, but waiting for a
+            // lookup port needs a retry in the next cycle
+            tlbPortStalledAccesses++;
+            if (!retryTranslationsEvent.scheduled()) {
+                schedule(retryTranslationsEvent, clockEdge(Cycles(1)));
+            }
+        }
+        return;
+    }
+    issueTranslation(mem_access);
+}
+
+bool
+ShaderLSQ::translateInMicroTLB(WarpInstBuffer::CoalescedAccess *mem_access)
+{
+    if (!microTLB) {
+        return false;
+    }
+    Addr vaddr = mem_access->req->getVaddr();
+    Addr pp_base;
+    Addr page_size;
+    if (!microTLB->lookup(vaddr, pp_base, page_size)) {
+        microTLBMisses++;
+        return false;
+    }
+    microTLBHits++;
+    mem_access->req->setPaddr(pp_base + vaddr % page_size);
+    DPRINTF(ShaderLSQ, "[%d: ] Micro-TLB hit for vaddr: %p, paddr: %p\n",
+            mem_access->getWarpId(), vaddr, mem_access->req->getPaddr());
+    completeTranslation(mem_access);
+    return true;
+}
+
+bool
+ShaderLSQ::claimTLBPort()
+{
+    if (tlbLookupPorts == 0) {
+        return true;
+    }
+    if (tlbPortCycle != curCycle()) {
+        tlbPortCycle = curCycle();
+        tlbPortsUsed = 0;
+    }
+    if (tlbPortsUsed >= tlbLookupPorts) {
+        return false;
+    }
+    tlbPortsUsed++;
+    return true;
+}
+
+void
+ShaderLSQ::flushMicroTLB()
+{
+    assert(microTLB);
+    DPRINTF(ShaderLSQ, "Flushing the micro-TLB\n");
+    microTLB->flush();
+    microTLBFlushed = true;
+    microTLBFlushCycle = curCycle();
+    microTLBFlushes++;
+}
+
+void
+ShaderLSQ::scheduleRetryTranslations()
+{
+    if (!stalledTranslations.empty() && !retryTranslationsEvent.scheduled()) {
+        schedule(retryTranslationsEvent, clockEdge(Cycles(0)));
+    }
+}
+
+void
+ShaderLSQ::issueStalledTranslations()
+{
+    while (!stalledTranslations.empty() && !tlb->isStalled() &&
+           claimTLBPort()) {
+        WarpInstBuffer::CoalescedAccess *mem_access =
+            stalledTranslations.front();
+        stalledTranslations.pop_front();
+        tlbQueueLatency.sample(curCycle() - mem_access->tlbStartCycle);
+        issueTranslation(mem_access);
+    }
+    if (stalledTranslations.empty()) {
+        tlbStallCycles += curCycle() - tlbStallStarted;
+    } else if (!tlb->isStalled() && !retryTranslationsEvent.scheduled()) {
+        // Out of lookup ports for this cycle
+        schedule(retryTranslationsEvent, clockEdge(Cycles(1)));
+    }
+}
+
+void
+ShaderLSQ::issueTranslation(WarpInstBuffer::CoalescedAccess *mem_access)
+{
+    WarpInstBuffer *warp_inst = mem_access->getWarpBuffer();
     BaseTLB::Mode mode;
     if (warp_inst->isLoad()) {
         mode = BaseTLB::Read;
@@ -338,33 +486,112 @@ ShaderLSQ::issueWarpInstTranslations(WarpInstBuffer *warp_inst)
         panic("Trying to issue translations for unknown instruction type!");
     }
 
-    const list<WarpInstBuffer::CoalescedAccess*> *coalesced_accesses =
-            warp_inst->getCoalescedAccesses();
-    warpCoalescedAccesses.sample(coalesced_accesses->size());
-    list<WarpInstBuffer::CoalescedAccess*>::const_iterator iter =
-            coalesced_accesses->begin();
-    for (; iter != coalesced_accesses->end(); iter++) {
-        WarpInstBuffer::CoalescedAccess *mem_access = *iter;
-        RequestPtr req = mem_access->req;
-        DPRINTF(ShaderLSQ, "[%d: ] Translating vaddr: %p\n",
-                mem_access->getWarpId(), req->getVaddr());
+    RequestPtr req = mem_access->req;
+    DPRINTF(ShaderLSQ, "[%d: ] Translating vaddr: %p\n",
+            mem_access->getWarpId(), req->getVaddr());
 
-        req->setExtraData((uint64_t)mem_access);
+    req->setExtraData((uint64_t)mem_access);
 
-        WholeTranslationState *state =
-                new WholeTranslationState(req, NULL, NULL, mode);
-        DataTranslation<ShaderLSQ*> *translation
-                = new DataTranslation<ShaderLSQ*>(this, state);
+    WholeTranslationState *state =
+            new WholeTranslationState(req, NULL, NULL, mode);
+    DataTranslation<ShaderLSQ*> *translation
+            = new DataTranslation<ShaderLSQ*>(this, state);
+
+    tlb->beginTranslateTiming(req, translation, mode);
+}
 
-        mem_access->tlbStartCycle = curCycle();
-        tlb->beginTranslateTiming(req, translation, mode);
+void
+ShaderLSQ::parkAccess(WarpInstBuffer::CoalescedAccess *mem_access)
+{
+    DPRINTF(ShaderLSQ, "[%d: ] Parking access for vaddr: %p until its "
+            "page fault is handled\n", mem_access->getWarpId(),
+            mem_access->req->getVaddr());
+    cudaGPU->getMMU()->replayAfterFault(mem_access->req->getVaddr(),
+            new ReplayAccessCallback(this, mem_access, curCycle()));
+
+    // Once all of its accesses are parked, the warp instruction cannot make
+    // progress until a replay, so its buffer need not hold up others
+    WarpInstBuffer *warp_inst = mem_access->getWarpBuffer();
+    unsigned parked = ++parkedAccessCounts[warp_inst];
+    if (parked == warp_inst->coalescedAccessesSize() &&
+        warp_inst->getTranslatedAccesses()->empty()) {
+        releaseParkedWarpInstBuf(warp_inst);
+    }
+}
+
+void
+ShaderLSQ::replayAccess(WarpInstBuffer::CoalescedAccess *mem_access,
+                        Cycles park_cycle)
+{
+    DPRINTF(ShaderLSQ, "[%d: ] Replaying access for vaddr: %p\n",
+            mem_access->getWarpId(), mem_access->req->getVaddr());
+    replayedAccesses++;
+    faultReplayLatency.sample(curCycle() - park_cycle);
+
+    WarpInstBuffer *warp_inst = mem_access->getWarpBuffer();
+    if (parkedWarpInstBufs.count(warp_inst)) {
+        reclaimParkedWarpInstBuf(warp_inst);
+    }
+    if (--parkedAccessCounts[warp_inst] == 0) {
+        parkedAccessCounts.erase(warp_inst);
+    }
+
+    translateAccess(mem_access);
+}
+
+void
+ShaderLSQ::releaseParkedWarpInstBuf(WarpInstBuffer *warp_inst)
+{
+    DPRINTF(ShaderLSQ, "[%d: ] All accesses parked, releasing warp "
+            "instruction buffer slot\n", warp_inst->getWarpId());
+    parkedWarpInstBufs.insert(warp_inst);
+    parkedWarpInstBufReleases++;
+
+    if (warpInstBufDebt > 0) {
+        // A slot is still owed from an earlier replay
+        warpInstBufDebt--;
+        return;
+    }
+
+    WarpInstBuffer *spare;
+    if (spareWarpInstBufs.empty()) {
+        spare = new WarpInstBuffer(warpSize, atomsPerSubline);
+        extraWarpInstBufs.push_back(spare);
+    } else {
+        spare = spareWarpInstBufs.back();
+        spareWarpInstBufs.pop_back();
+    }
+    availableWarpInstBufs.push(spare);
+    lastWarpInstBufferChange = curTick();
+}
+
+void
+ShaderLSQ::reclaimParkedWarpInstBuf(WarpInstBuffer *warp_inst)
+{
+    DPRINTF(ShaderLSQ, "[%d: ] Replaying parked warp instruction, "
+            "reclaiming its buffer slot\n", warp_inst->getWarpId());
+    parkedWarpInstBufs.erase(warp_inst);
+
+    if (availableWarpInstBufs.empty()) {
+        warpInstBufDebt++;
+    } else {
+        spareWarpInstBufs.push_back(availableWarpInstBufs.front());
+        availableWarpInstBufs.pop();
     }
 }
 
 void
 ShaderLSQ::finishTranslation(WholeTranslationState *state)
 {
+    WarpInstBuffer::CoalescedAccess *mem_access =
+        (WarpInstBuffer::CoalescedAccess*)state->mainReq->getExtraData();
+
     if (state->getFault() != NoFault) {
+        if (dynamic_cast<ReplayableGPUFault*>(state->getFault().get())) {
+            delete state;
+            parkAccess(mem_access);
+            return;
+        }
         // The ShaderLSQ and ShaderTLBs do not currently have a way to signal
         // to a CPU core how a fault should be handled. With current
         // organization, this should not occur unless there are bugs in GPU
@@ -373,14 +600,30 @@ ShaderLSQ::finishTranslation(WholeTranslationState *state)
               state->getFault()->name(), state->mainReq->getVaddr());
     }
 
-    WarpInstBuffer::CoalescedAccess *mem_access =
-        (WarpInstBuffer::CoalescedAccess*)state->mainReq->getExtraData();
-
     DPRINTF(ShaderLSQ,
             "[%d: ] Finished translation for vaddr: %p, paddr: %p\n",
             mem_access->getWarpId(), state->mainReq->getVaddr(),
             state->mainReq->getPaddr());
 
+    if (microTLB && !(microTLBFlushed &&
+                      microTLBFlushCycle >= mem_access->tlbStartCycle)) {
+        Addr offset = state->mainReq->getVaddr() % TheISA::PageBytes;
+        microTLB->insert(state->mainReq->getVaddr() - offset,
+                         state->mainReq->getPaddr() - offset);
+    }
+
+    if (state->delay) {
+        tlbMissLatency.sample(curCycle() - mem_access->tlbStartCycle);
+    }
+
+    delete state;
+
+    completeTranslation(mem_access);
+}
+
+void
+ShaderLSQ::completeTranslation(WarpInstBuffer::CoalescedAccess *mem_access)
+{
     // Initialize the packet using the translated access and in the case that
     // this is a write access, set the data to be sent to cache
     PacketPtr pkt = mem_access;
@@ -392,12 +635,6 @@ ShaderLSQ::finishTranslation(WholeTranslationState *state)
         pkt->allocate();
     }
 
-    if (state->delay) {
-        tlbMissLatency.sample(curCycle() - mem_access->tlbStartCycle);
-    }
-
-    delete state;
-
     WarpInstBuffer *warp_inst = mem_access->getWarpBuffer();
     warp_inst->setTranslated(mem_access);
 
@@ -466,6 +703,8 @@ ShaderLSQ::injectCacheAccesses()
                         mem_access->getWarpBuffer()->getInstTypeString(),
                         mem_access->req->getPaddr());
                 blockedLineAddrs[line_addr] = true;
+                cudaGPU->recordDeviceAccess(mem_access->req->getPaddr(),
+                                            mem_access->getSize());
                 if (mem_access->isWrite()) {
                     // Block issue while the store data is being serialized
                     // through the port to the cache (1 cyc/subline)
@@ -694,7 +933,13 @@ ShaderLSQ::commitWarpInst()
 
     warp_inst->resetState();
     decrementActiveWarpInstBuffers();
-    availableWarpInstBufs.push(warp_inst);
+    if (warpInstBufDebt > 0) {
+        // Retire the buffer to give back a slot lent to a parked buffer
+        warpInstBufDebt--;
+        spareWarpInstBufs.push_back(warp_inst);
+    } else {
+        availableWarpInstBufs.push(warp_inst);
+    }
     if (flushing && numActiveWarpInstBuffers == 0) processFlush();
 }
 
@@ -802,6 +1047,56 @@ ShaderLSQ::regStats()
         .desc("Latency in cycles for TLB miss")
         .init(16)
         ;
+    tlbStalledAccesses
+        .name(name() + ".tlbStalledAccesses")
+        .desc("Number of accesses that waited for a TLB MSHR to translate")
+        ;
+    tlbStallCycles
+        .name(name() + ".tlbStallCycles")
+        .desc("Number of cycles translations stalled waiting for a TLB MSHR "
+              "or lookup port")
+        ;
+    tlbPortStalledAccesses
+        .name(name() + ".tlbPortStalledAccesses")
+        .desc("Number of accesses that waited for a TLB lookup port")
+        ;
+    tlbQueueLatency
+        .name(name() + ".tlbQueueLatency")
+        .desc("Cycles stalled accesses waited before their TLB lookup")
+        .init(16)
+        ;
+    microTLBHits
+        .name(name() + ".microTLBHits")
+        .desc("Number of accesses translated by the micro-TLB")
+        ;
+    microTLBMisses
+        .name(name() + ".microTLBMisses")
+        .desc("Number of accesses that missed in the micro-TLB")
+        ;
+    microTLBHitRate
+        .name(name() + ".microTLBHitRate")
+        .desc("Hit rate of the micro-TLB")
+        ;
+    microTLBHitRate = microTLBHits / (microTLBHits + microTLBMisses);
+    microTLBFlushes
+        .name(name() + ".microTLBFlushes")
+        .desc("Number of times the micro-TLB was flushed by a shootdown")
+        ;
+    replayedAccesses
+        .name(name() + ".replayedAccesses")
+        .desc("Number of accesses replayed after a page fault")
+        ;
+    faultReplayLatency
+        .name(name() + ".faultReplayLatency")
+        .desc("Latency in cycles from parking a faulting access to its "
+              "replay")
+        .init(16)
+        ;
+    parkedWarpInstBufReleases
+        .name(name() + ".parkedWarpInstBufReleases")
+        .desc("Number of warp instruction buffer slots released because "
+              "all of the instruction's accesses were parked")
+        ;
 }
 
 
@@ -32,10 +32,13 @@
 #ifndef __GPU_SHADER_LSQ_HH__
 #define __GPU_SHADER_LSQ_HH__
 
-#include <queue>
 #include <list>
+#include <map>
+#include <queue>
+#include <set>
 #include <vector>
 
+#include "base/callback.hh"
 #include "base/statistics.hh"
 #include "cpu/translation.hh"
 #include "gpu/lsq_warp_inst_buffer.hh"
@@ -44,6 +47,8 @@
 #include "mem/port.hh"
 #include "params/ShaderLSQ.hh"
 
+class CudaGPU;
+
 /**
  * The ShaderLSQ models the load-store queue for GPU shader cores. The LSQ
  * contains a pool of warp instruction buffers, and manages the progress of
@@ -172,6 +177,19 @@ class ShaderLSQ : public MemObject
     // Holds pointers to buffers that are currently unoccupied
     std::queue<WarpInstBuffer*> availableWarpInstBufs;
 
+    // Warp instructions whose accesses are all parked on page faults do not
+    // count against the pool size: each lends its slot to a spare buffer
+    // until one of its accesses is replayed. If no buffer is available to
+    // take back the slot at replay, the next committed buffer is retired
+    // instead of being made available (warpInstBufDebt).
+    std::map<WarpInstBuffer*, unsigned> parkedAccessCounts;
+    std::set<WarpInstBuffer*> parkedWarpInstBufs;
+    std::vector<WarpInstBuffer*> spareWarpInstBufs;
+    std::vector<WarpInstBuffer*> extraWarpInstBufs;
+    unsigned warpInstBufDebt;
+    void releaseParkedWarpInstBuf(WarpInstBuffer *warp_inst);
+    void reclaimParkedWarpInstBuf(WarpInstBuffer *warp_inst);
+
     // The warp instruction buffer pointers for different stages of the LSQ:
     // Currently, GPGPU-Sim only supports dispatching a single warp instruction
     // to the LSQ per cycle. This pointer holds the warp instruction currently
@@ -203,6 +221,24 @@ class ShaderLSQ : public MemObject
 
     // Data TLB to translate coalesced virtual to physical addresses
     ShaderTLB *tlb;
+    // Accesses waiting to translate while the TLB's MSHRs are full or no
+    // lookup port is free
+    std::deque<WarpInstBuffer::CoalescedAccess*> stalledTranslations;
+    Cycles tlbStallStarted;
+    // Small fully associative TLB checked before the data TLB, so accesses
+    // to recently translated pages do not use an L1 TLB lookup port
+    TLBMemory *microTLB;
+    // When the micro-TLB was last flushed. Translations started before a
+    // flush may be stale, so they are not inserted into the micro-TLB
+    bool microTLBFlushed;
+    Cycles microTLBFlushCycle;
+    // Data TLB lookups that can start each cycle. 0 implies unlimited
+    unsigned tlbLookupPorts;
+    Cycles tlbPortCycle;
+    unsigned tlbPortsUsed;
+
+    // The GPU, which tracks accesses to each device directory
+    CudaGPU *cudaGPU;
 
     // Use this cycle specifier to block inject for variable issue latency
     // e.g. Fermi and Maxwell store issue is 1 cycle per cache subline
@@ -268,8 +304,58 @@ class ShaderLSQ : public MemObject
     // accesses and issuing translations for lines accessed
     void dispatchWarpInst();
     void issueWarpInstTranslations(WarpInstBuffer *warp_inst);
+    void translateAccess(WarpInstBuffer::CoalescedAccess *mem_access);
+    bool translateInMicroTLB(WarpInstBuffer::CoalescedAccess *mem_access);
+    bool claimTLBPort();
+    void issueTranslation(WarpInstBuffer::CoalescedAccess *mem_access);
+    void completeTranslation(WarpInstBuffer::CoalescedAccess *mem_access);
+    void issueStalledTranslations();
+
+    class TLBRetryCallback : public Callback
+    {
+        ShaderLSQ *lsq;
+
+      public:
+        TLBRetryCallback(ShaderLSQ *_lsq) : lsq(_lsq) {}
+        void process() { lsq->scheduleRetryTranslations(); }
+    };
+    TLBRetryCallback tlbRetryCallback;
+    void scheduleRetryTranslations();
+
+    // The micro-TLB is flushed whenever the data TLB is shot down
+    class MicroTLBFlushCallback : public Callback
+    {
+        ShaderLSQ *lsq;
+
+      public:
+        MicroTLBFlushCallback(ShaderLSQ *_lsq) : lsq(_lsq) {}
+        void process() { lsq->flushMicroTLB(); }
+    };
+    MicroTLBFlushCallback microTLBFlushCallback;
+    void flushMicroTLB();
     void pushToInjectBuffer(WarpInstBuffer::CoalescedAccess *mem_request);
 
+    // If the data TLB has replayable faults, accesses that page fault are
+    // parked without holding any translation resources, so accesses from
+    // other warps keep translating and issuing. The ShaderMMU calls back to
+    // replay the translation once the fault is handled.
+    class ReplayAccessCallback : public Callback
+    {
+        ShaderLSQ *lsq;
+        WarpInstBuffer::CoalescedAccess *memAccess;
+        Cycles parkCycle;
+
+      public:
+        ReplayAccessCallback(ShaderLSQ *_lsq,
+                             WarpInstBuffer::CoalescedAccess *mem_access,
+                             Cycles park_cycle)
+            : lsq(_lsq), memAccess(mem_access), parkCycle(park_cycle) {}
+        void process() { lsq->replayAccess(memAccess, parkCycle); }
+    };
+    void parkAccess(WarpInstBuffer::CoalescedAccess *mem_access);
+    void replayAccess(WarpInstBuffer::CoalescedAccess *mem_access,
+                      Cycles park_cycle);
+
     // LSQ Pipeline Stage 2:
     // After coalescing and translating addresses for cache accesses, they
     // can be injected into the cache hierarchy
@@ -301,6 +387,8 @@ class ShaderLSQ : public MemObject
     EventWrapper<ShaderLSQ, &ShaderLSQ::injectCacheAccesses> injectAccessesEvent;
     EventWrapper<ShaderLSQ, &ShaderLSQ::ejectAccessResponses> ejectAccessesEvent;
     EventWrapper<ShaderLSQ, &ShaderLSQ::commitWarpInst> commitInstEvent;
+    EventWrapper<ShaderLSQ, &ShaderLSQ::issueStalledTranslations>
+        retryTranslationsEvent;
 
     // Stats
     Stats::Histogram activeWarpInstBuffers;
@@ -316,6 +404,17 @@ class ShaderLSQ : public MemObject
     Stats::Histogram warpLatencyFence;
     Stats::Histogram warpLatencyAtomic;
     Stats::Histogram tlbMissLatency;
+    Stats::Scalar tlbStalledAccesses;
+    Stats::Scalar tlbStallCycles;
+    Stats::Scalar tlbPortStalledAccesses;
+    Stats::Histogram tlbQueueLatency;
+    Stats::Scalar microTLBHits;
+    Stats::Scalar microTLBMisses;
+    Stats::Formula microTLBHitRate;
+    Stats::Scalar microTLBFlushes;
+    Stats::Scalar replayedAccesses;
+    Stats::Histogram faultReplayLatency;
+    Stats::Scalar parkedWarpInstBufReleases;
     void regStats();
 
 };
@@ -28,20 +28,27 @@
  * Authors: Jason Power
  */
 
+#include <algorithm>
 #include <list>
+#include <memory>
 
 #include "arch/isa.hh"
+#include "base/bitfield.hh"
+#include "base/cast.hh"
 #include "cpu/base.hh"
 #include "debug/ShaderMMU.hh"
 #include "gpu/gpgpu-sim/cuda_gpu.hh"
 #include "gpu/shader_mmu.hh"
 #include "params/ShaderMMU.hh"
+#include "mem/page_table.hh"
 #include "sim/full_system.hh"
+#include "sim/process.hh"
 
 #if THE_ISA == ARM_ISA
     // TODO: To enable full-system mode ARM interrupts may require including
     // an ARM instruction with a GPU interrupt handler
 #elif THE_ISA == X86_ISA
+    #include "arch/x86/faults.hh"
     #include "arch/x86/generated/decoder.hh"
 #else
     #error Currently gem5-gpu is only known to support x86 and ARM
@@ -51,31 +58,81 @@ using namespace std;
 using namespace TheISA;
 
 ShaderMMU::ShaderMMU(const Params *p) :
-    ClockedObject(p), pagewalkers(p->pagewalkers),
+    MemObject(p),
 #if THE_ISA == ARM_ISA
-    stage2MMU(p->stage2_mmu),
+    pagewalkers(p->pagewalkers), stage2MMU(p->stage2_mmu),
 #endif
     latency(p->latency), startMissEvent(this), faultTimeoutEvent(this),
-    faultTimeoutCycles(1000000), outstandingFaultStatus(None),
-    outstandingFaultInfo(NULL), curOutstandingWalks(0),
-    prefetchBufferSize(p->prefetch_buffer_size)
+    faultTimeoutCycles(1000000), faultBatchEvent(this),
+    shootdownEvent(this), shootdownCycles(p->shootdown_latency),
+    cpuShootdowns(p->cpu_shootdowns),
+    walkerPort(name() + ".walker_port", this),
+    walkerMasterId(p->sys->getMasterId(name() + ".walker")),
+    walkerBypassL1(p->walker_bypass_l1),
+    pwc(p->pwc_entries), pwcRoot(0),
+    walkBatchLimit(p->walk_batch_limit), walksBypassingOldest(0),
+    lastWalkVaddr(0), outstandingFaultStatus(None), faultBatchRetries(0),
+    faultBatchSize(p->fault_batch_size),
+    faultBatchTimeout(p->fault_batch_timeout), curOutstandingWalks(0),
+    prefetchBufferSize(p->prefetch_buffer_size),
+    prefetchAheadDistance(p->prefetch_distance),
+    prefetchDegree(p->prefetch_degree), maxPrefetchDegree(p->prefetch_degree),
+    strideTableSize(p->prefetch_table_entries),
+    prefetchThrottleWindow(p->prefetch_throttle_window), windowPrefetches(0),
+    windowPrefetchHits(0), windowPrefetchFaults(0)
 {
-    activeWalkers.resize(pagewalkers.size());
+    if (p->walk_slots <= 0) {
+        fatal("ShaderMMU needs at least one walk slot\n");
+    }
+    activeWalkSlots.resize(p->walk_slots, false);
+    if (faultBatchSize == 0) {
+        fatal("ShaderMMU fault batches need at least one fault\n");
+    }
+    if (p->walk_scheduler == "fifo") {
+        walkScheduler = FIFOWalks;
+    } else if (p->walk_scheduler == "batch") {
+        walkScheduler = BatchWalks;
+    } else {
+        fatal("Unknown page walk scheduler: %s\n", p->walk_scheduler);
+    }
+    if (p->prefetcher == "next_page") {
+        prefetcher = NextPagePrefetcher;
+    } else if (p->prefetcher == "stride") {
+        prefetcher = StridePrefetcher;
+    } else {
+        fatal("Unknown TLB prefetcher: %s\n", p->prefetcher);
+    }
+    if (prefetchAheadDistance == 0 || maxPrefetchDegree == 0) {
+        fatal("TLB prefetch distance and degree must be at least 1\n");
+    }
     if (p->l2_tlb_entries > 0) {
-        tlb = new TLBMemory(p->l2_tlb_entries, p->l2_tlb_assoc);
+        tlb = new TLBMemory(p->l2_tlb_entries, p->l2_tlb_assoc,
+                            p->l2_tlb_replacement_policy);
     } else {
         tlb = NULL;
     }
 
-    pagewalkEvents.resize(pagewalkers.size());
-    for (unsigned pw_id = 0; pw_id < pagewalkers.size(); pw_id++) {
-        activeWalkers[pw_id] = false;
-        TheISA::TLB* pw = pagewalkers[pw_id];
-        pagewalkerIndices[pw] = pw_id;
-        pagewalkEvents[pw_id] = new StartPagewalkEvent(this, pw);
 #if THE_ISA == ARM_ISA
-        pw->setMMU(stage2MMU, pw_id);
+    if (pagewalkers.size() != activeWalkSlots.size()) {
+        fatal("ShaderMMU has %d walk slots but %d pagewalkers\n",
+              activeWalkSlots.size(), pagewalkers.size());
+    }
+    for (unsigned pw_id = 0; pw_id < pagewalkers.size(); pw_id++) {
+        pagewalkers[pw_id]->setMMU(stage2MMU, pw_id);
+    }
+    if (pwc.enabled()) {
+        fatal("The GPU page walk cache is only supported for x86\n");
+    }
+#else
+    if (pwc.enabled() && !FullSystem) {
+        warn("The GPU page walk cache is unused in SE mode, since "
+             "translations do not walk the page table\n");
+    }
 #endif
+
+    pagewalkEvents.resize(activeWalkSlots.size());
+    for (int slot = 0; slot < activeWalkSlots.size(); slot++) {
+        pagewalkEvents[slot] = new StartPagewalkEvent(this, slot);
     }
 }
 
@@ -84,9 +141,30 @@ ShaderMMU::~ShaderMMU()
     if (tlb) {
         delete tlb;
     }
-    for (unsigned pw_id = 0; pw_id < pagewalkers.size(); pw_id++) {
-        delete pagewalkEvents[pw_id];
+    for (int slot = 0; slot < pagewalkEvents.size(); slot++) {
+        delete pagewalkEvents[slot];
+    }
+    for (int i = 0; i < translationPool.size(); i++) {
+        delete translationPool[i];
+    }
+}
+
+ShaderMMU::TranslationRequest *
+ShaderMMU::allocateTranslation(ShaderTLB *req_tlb,
+                               BaseTLB::Translation *translation,
+                               RequestPtr req, BaseTLB::Mode mode,
+                               ThreadContext *tc, Tick start_tick,
+                               bool prefetch)
+{
+    TranslationRequest *t;
+    if (translationPool.empty()) {
+        t = new TranslationRequest(this);
+    } else {
+        t = translationPool.back();
+        translationPool.pop_back();
     }
+    t->init(req_tlb, translation, req, mode, tc, start_tick, prefetch);
+    return t;
 }
 
 void
@@ -94,8 +172,8 @@ ShaderMMU::beginTLBMiss(ShaderTLB *req_tlb, BaseTLB::Translation *translation,
                         RequestPtr req, BaseTLB::Mode mode, ThreadContext *tc)
 {
     // Wrap the translation in another class so we can catch the insertion
-    TranslationRequest *wrapped_translation = new TranslationRequest(this,
-              req_tlb, translation, req, mode, tc, clockEdge(Cycles(latency)));
+    TranslationRequest *wrapped_translation = allocateTranslation(req_tlb,
+              translation, req, mode, tc, clockEdge(Cycles(latency)));
 
     startMisses.push(wrapped_translation);
     if (!startMissEvent.scheduled()) {
@@ -123,38 +201,51 @@ ShaderMMU::handleTLBMiss()
     ThreadContext *tc = translation_request->tc;
 
     Addr pp_base;
-    Addr offset = req->getVaddr() % TheISA::PageBytes;
-    Addr vp_base = req->getVaddr() - offset;
+    Addr page_size;
+    Addr vaddr = req->getVaddr();
+    Addr vp_base = translation_request->vpBase;
 
     // Check the L2 TLB
-    if (tlb && tlb->lookup(vp_base, pp_base, req_tlb)) {
+    if (tlb && tlb->lookup(vaddr, pp_base, page_size)) {
         // Found in the L2 TLB
         l2hits++;
-        req->setPaddr(pp_base + offset);
-        req_tlb->insert(vp_base, pp_base);
+        l2hitsBySize[gpuPageSizeIndex(page_size)]++;
+        req->setPaddr(pp_base + vaddr % page_size);
+        req_tlb->insert(vaddr - vaddr % page_size, pp_base, page_size);
         translation->finish(NoFault, req, tc, mode);
-        delete translation_request;
+        releaseTranslation(translation_request);
         return;
     }
 
     // Check for a hit in the prefetch buffers
-    auto it = prefetchBuffer.find(vp_base);
+    auto it = findPrefetch(vaddr);
     if (it != prefetchBuffer.end()) {
         // Hit in the prefetch buffer
         prefetchHits++;
-        pp_base = it->second.ppBase;
+        windowPrefetchHits++;
+        GPUTlbEntry entry = it->second;
         if (tlb) {
-            tlb->insert(vp_base, pp_base);
+            tlb->insert(entry.vpBase, entry.ppBase, entry.size);
+            l2TranslationReach = tlb->getReach();
         }
-        req->setPaddr(pp_base + offset);
-        req_tlb->insert(vp_base, pp_base);
+        req->setPaddr(entry.ppBase + (vaddr - entry.vpBase));
+        req_tlb->insert(entry.vpBase, entry.ppBase, entry.size);
         translation->finish(NoFault, req, tc, mode);
         // Remove from prefetchBuffer
         prefetchBuffer.erase(it);
         // This was a hit in the prefetch buffer, so we must have done the
         // right thing, Let's see if we get lucky again.
-        tryPrefetch(vp_base, tc);
-        delete translation_request;
+        trainPrefetcher(translation_request, entry.vpBase, entry.size);
+        releaseTranslation(translation_request);
+        return;
+    }
+
+    if (isReplayable(translation_request) &&
+        !outstandingWalks[vp_base].empty() &&
+        outstandingWalks[vp_base].front()->replay) {
+        DPRINTF(ShaderMMU, "Fault in flight for vp base %#x. Replaying\n",
+                vp_base);
+        finishReplayable(translation_request);
         return;
     }
 
@@ -165,15 +256,17 @@ ShaderMMU::handleTLBMiss()
 
     if (outstandingWalks[vp_base].size() == 1) {
         DPRINTF(ShaderMMU, "Walking for %#x\n", req->getVaddr());
-        TLB *walker = getFreeWalker();
-        if (walker == NULL) {
-            pendingWalks.push(translation_request);
+        translation_request->beginQueue = curCycle();
+        int slot = getFreeWalkSlot();
+        if (slot < 0) {
+            queueWalk(translation_request);
         } else {
-            schedulePagewalk(walker, translation_request);
-            // Try to prefetch on demand misses (but wait until the demand
-            // walk has started.)
-            tryPrefetch(vp_base, tc);
+            schedulePagewalk(slot, translation_request);
         }
+        // Try to prefetch on demand misses (but wait until the demand walk
+        // has started or queued.) The size of the demand page is not known
+        // until the walk completes, so assume a base page.
+        trainPrefetcher(translation_request, vp_base, TheISA::PageBytes);
     }
 }
 
@@ -181,30 +274,42 @@ void
 ShaderMMU::finishWalk(TranslationRequest *translation, Fault fault)
 {
     pagewalkLatency.sample(curCycle() - translation->beginWalk);
-    setWalkerFree(translation->pageWalker);
-    translation->pageWalker = NULL;
+    walkLatency.sample(curCycle() - translation->beginQueue);
+    setWalkSlotFree(translation->walkSlot);
+    translation->walkSlot = -1;
 
     if (!pendingWalks.empty()) {
-        TLB *walker = getFreeWalker();
-        TranslationRequest *t = pendingWalks.front();
-        schedulePagewalk(walker, t);
-        pendingWalks.pop();
+        int slot = getFreeWalkSlot();
+        schedulePagewalk(slot, nextPendingWalk());
     }
 
     RequestPtr req = translation->req;
 
-    // Handling for after the OS satisfies a page fault
+    // Handling for after the OS satisfies a batch of page faults
     if (outstandingFaultStatus == Retrying &&
-        req->getVaddr() == outstandingFaultInfo->req->getVaddr()) {
+        find(faultBatch.begin(), faultBatch.end(), translation) !=
+            faultBatch.end()) {
         DPRINTF(ShaderMMU, "Walk finished for retry of %#x\n", req->getVaddr());
-        if (fault != NoFault) {
+        if (fault == NoFault) {
+            pagefaultLatency.sample(curCycle() - translation->beginFault);
+            DPRINTF(ShaderMMU, "Retry successful. %d retries left in batch\n",
+                    faultBatchRetries - 1);
+        } else if (translation == faultBatch.front()) {
             panic("GPU encountered another fault for faulted address.\n"
                   "      Likely a GPU-triggered segfault for: %#x, pc: %#x",
                   req->getVaddr(), req->getPC());
         } else {
-            DPRINTF(ShaderMMU, "Retry successful\n");
+            // The handler pass only resolved the first fault in the batch,
+            // so this one is collected into the next batch below
+            DPRINTF(ShaderMMU, "Retry faulted. %d retries left in batch\n",
+                    faultBatchRetries - 1);
+        }
+        assert(faultBatchRetries > 0);
+        faultBatchRetries--;
+        if (faultBatchRetries == 0) {
             outstandingFaultStatus = None;
-            outstandingFaultInfo = NULL;
+            faultBatch.clear();
+            faultBatchLatency.sample(curCycle() - beginFaultBatch);
             ThreadContext *tc = translation->tc;
             GPUFaultReg fault_reg = tc->readMiscRegNoEffect(MISCREG_GPU_FAULT);
             fault_reg.inFault = 0;
@@ -214,12 +319,10 @@ ShaderMMU::finishWalk(TranslationRequest *translation, Fault fault)
             // cause erratic CPU behavior, such as pipeline flushes. Use extreme
             // care/testing when changing these.
             tc->setMiscRegActuallyNoEffect(MISCREG_GPU_FAULT, fault_reg);
-            if (!pendingFaults.empty()) {
-                TranslationRequest *pending = pendingFaults.front();
-                DPRINTF(ShaderMMU, "Invoking pending fault %#x\n",
-                        pending->req->getVaddr());
-                handlePageFault(pending);
-                pendingFaults.pop();
+            if (!collectingFaults.empty()) {
+                DPRINTF(ShaderMMU, "Invoking next batch of %d faults\n",
+                        collectingFaults.size());
+                startFaultBatch();
             } else {
                 DPRINTF(ShaderMMU, "No pending faults\n");
             }
@@ -244,32 +347,54 @@ ShaderMMU::finalizeTranslation(TranslationRequest *translation)
 {
     RequestPtr req = translation->req;
     Addr vp_base = translation->vpBase;
-    Addr pp_base = req->getPaddr() - req->getPaddr() % TheISA::PageBytes;
+    Addr page_size = translation->pageSize;
+    Addr pp_base = req->getPaddr() - req->getPaddr() % page_size;
+    // Outstanding walks are merged by base page, but the TLBs hold the
+    // whole page that was walked
+    Addr entry_vp_base = req->getVaddr() - req->getVaddr() % page_size;
 
-    DPRINTF(ShaderMMU, "Walk complete for VP %#x to PP %#x\n", vp_base, pp_base);
+    DPRINTF(ShaderMMU, "Walk complete for VP %#x to PP %#x (%#x bytes)\n",
+            entry_vp_base, pp_base, page_size);
+    walksBySize[gpuPageSizeIndex(page_size)]++;
 
     list<TranslationRequest*> &walks = outstandingWalks[vp_base];
     assert(walks.front() == translation);
     walks.pop_front();
 
+    // A shootdown during the walk may have invalidated the page it read, so
+    // the requesters get the translation but the TLBs do not cache it
+    bool cache = !translation->isShotDown(entry_vp_base, page_size);
+    if (!cache) {
+        DPRINTF(ShaderMMU, "VP %#x shot down during its walk. Not caching\n",
+                entry_vp_base);
+        shotDownWalks++;
+    }
+
     // First, complete the walked translation
     if (translation->prefetch) {
         // Only insert into pf buffer if no other requests were made to this
         // virtual page before the prefetch completed
-        if (walks.size() == 0) {
-            insertPrefetch(vp_base, pp_base);
+        if (walks.size() == 0 && cache) {
+            insertPrefetch(entry_vp_base, pp_base, page_size);
         }
         delete translation->req;
-    } else {
+    } else if (cache) {
         // Insert the mapping into the TLB. This only needs to happen once
         if (tlb) {
-            tlb->insert(vp_base, pp_base);
+            tlb->insert(entry_vp_base, pp_base, page_size);
+            l2TranslationReach = tlb->getReach();
         }
         // Insert into L1 TLB
-        translation->origTLB->insert(vp_base, pp_base);
-        // Forward the translation on
-        translation->wrappedTranslation->finish(NoFault, translation->req,
-                                           translation->tc, translation->mode);
+        translation->origTLB->insert(entry_vp_base, pp_base, page_size);
+    }
+    if (!translation->prefetch) {
+        if (translation->replay) {
+            delete translation->req;
+        } else {
+            // Forward the translation on
+            translation->wrappedTranslation->finish(NoFault,
+                    translation->req, translation->tc, translation->mode);
+        }
     }
 
     // Next, complete any queued translations for this same page
@@ -282,18 +407,83 @@ ShaderMMU::finalizeTranslation(TranslationRequest *translation)
         assert(t != translation);
 
         // Set the physical address to complete the translation
-        Addr offset = t->req->getVaddr() % TheISA::PageBytes;
+        Addr offset = t->req->getVaddr() % page_size;
         t->req->setPaddr(pp_base + offset);
 
         // Insert into L1 TLB
-        t->origTLB->insert(vp_base, pp_base);
+        if (cache) {
+            t->origTLB->insert(entry_vp_base, pp_base, page_size);
+        }
         // Forward the translation on
         t->wrappedTranslation->finish(NoFault, t->req, t->tc, t->mode);
 
-        delete t;
+        releaseTranslation(t);
     }
-    delete translation;
+    releaseTranslation(translation);
     outstandingWalks.erase(vp_base);
+
+    // Finally, replay the translations that faulted on this page
+    auto replay_it = faultReplays.find(vp_base);
+    if (replay_it != faultReplays.end()) {
+        list<Callback*> replays;
+        replays.swap(replay_it->second);
+        faultReplays.erase(replay_it);
+        DPRINTF(ShaderMMU, "Replaying %d translations for VP %#x\n",
+                replays.size(), vp_base);
+        for (auto it = replays.begin(); it != replays.end(); it++) {
+            (*it)->process();
+            delete *it;
+        }
+    }
+}
+
+ShaderMMU::TranslationRequest *
+ShaderMMU::replayFaultedTranslations(TranslationRequest *translation)
+{
+    // The replay request raises the fault and retries the walk with its own
+    // copy of the faulting request, since the requesters' requests may be
+    // reused or freed before the fault is handled
+    RequestPtr req = translation->req;
+    Request::Flags flags;
+    RequestPtr replay_req = new Request(0, req->getVaddr(), 4, flags,
+                                        req->masterId(), req->getPC(), 0, 0);
+    TranslationRequest *replay = allocateTranslation(translation->origTLB,
+            NULL, replay_req, translation->mode, translation->tc, curTick());
+    replay->replay = true;
+
+    list<TranslationRequest*> waiting;
+    list<TranslationRequest*> &walks = outstandingWalks[translation->vpBase];
+    waiting.swap(walks);
+    walks.push_back(replay);
+    DPRINTF(ShaderMMU, "Sending translations for %#x away to replay\n",
+            req->getVaddr());
+    for (auto it = waiting.begin(); it != waiting.end(); it++) {
+        if (isReplayable(*it)) {
+            finishReplayable(*it);
+        } else {
+            walks.push_back(*it);
+        }
+    }
+    return replay;
+}
+
+void
+ShaderMMU::finishReplayable(TranslationRequest *translation)
+{
+    replayedTranslations++;
+    translation->wrappedTranslation->finish(
+            std::make_shared<ReplayableGPUFault>(), translation->req,
+            translation->tc, translation->mode);
+    releaseTranslation(translation);
+}
+
+void
+ShaderMMU::replayAfterFault(Addr vaddr, Callback *replay)
+{
+    Addr vp_base = vaddr - vaddr % TheISA::PageBytes;
+    assert(outstandingWalks.count(vp_base) &&
+           outstandingWalks[vp_base].front()->replay);
+    faultReplays[vp_base].push_back(replay);
 }
 
 void
@@ -302,14 +492,15 @@ ShaderMMU::raisePageFaultInterrupt(ThreadContext *tc)
     // NOTE: This function must run through to completion. Otherwise, the
     // outstanding fault may never get raised, and thus, the waiting GPU
     // may deadlock.
-    assert(outstandingFaultInfo);
+    assert(!faultBatch.empty());
     assert(outstandingFaultStatus == InKernel);
+    TranslationRequest *fault_info = faultBatch.front();
 
     if (tc != CudaGPU::getCudaGPU(0)->getThreadContext()) {
         warn("Host TC changed! Updating outstanding fault: Old: %p, New: %p\n",
              tc, CudaGPU::getCudaGPU(0)->getThreadContext());
         tc = CudaGPU::getCudaGPU(0)->getThreadContext();
-        outstandingFaultInfo->tc = tc;
+        fault_info->tc = tc;
     }
 
     // Do ISA-specific checks
@@ -328,14 +519,14 @@ ShaderMMU::raisePageFaultInterrupt(ThreadContext *tc)
 #endif
 
     DPRINTF(ShaderMMU, "Raising interrupt for page fault at addr: %#x\n",
-            outstandingFaultInfo->req->getVaddr());
+            fault_info->req->getVaddr());
 
     GPUFaultReg fault_reg = tc->readMiscRegNoEffect(MISCREG_GPU_FAULT);
     assert(fault_reg.inFault == 0);
     fault_reg.inFault = 1;
 
     GPUFaultCode code = 0;
-    code.write = (outstandingFaultInfo->mode == BaseTLB::Write);
+    code.write = (fault_info->mode == BaseTLB::Write);
     code.user = 1;
 
     GPUFaultRSPReg fault_rsp = tc->readMiscRegNoEffect(MISCREG_GPU_FAULT_RSP);
@@ -348,7 +539,7 @@ ShaderMMU::raisePageFaultInterrupt(ThreadContext *tc)
     // changing these.
     tc->setMiscRegActuallyNoEffect(MISCREG_GPU_FAULT, fault_reg);
     tc->setMiscRegActuallyNoEffect(MISCREG_GPU_FAULTADDR,
-                                   outstandingFaultInfo->req->getVaddr());
+                                   fault_info->req->getVaddr());
     tc->setMiscRegActuallyNoEffect(MISCREG_GPU_FAULTCODE, code);
     tc->setMiscRegActuallyNoEffect(MISCREG_GPU_FAULT_RSP, fault_rsp);
 
@@ -393,14 +584,10 @@ ShaderMMU::faultTimeout(ThreadContext *tc)
 void
 ShaderMMU::handlePageFault(TranslationRequest *translation)
 {
-    if (!FullSystem) {
-        panic("Page fault handling (addr: %#x, pc: %#x) not available in SE "
-              "mode: No interrupt handler!\n", translation->vpBase,
-              translation->req->getPC());
-    }
     if (translation->prefetch) {
         DPRINTF(ShaderMMU, "Ignoring since fault on prefetch\n");
         prefetchFaults++;
+        windowPrefetchFaults++;
         TranslationRequest *new_translation = NULL;
         list<TranslationRequest*> &walks = outstandingWalks[translation->vpBase];
         if (walks.size() != 1) {
@@ -409,17 +596,24 @@ ShaderMMU::handlePageFault(TranslationRequest *translation)
             walks.remove(translation);
             new_translation = walks.front();
             delete translation->req;
-            delete translation;
+            releaseTranslation(translation);
         } else {
             outstandingWalks.erase(translation->vpBase);
             delete translation->req;
-            delete translation;
+            releaseTranslation(translation);
             return;
         }
         translation = new_translation;
         assert(translation != NULL);
     }
 
+    // Faults on prefetches are dropped above, even in SE mode
+    if (!FullSystem) {
+        panic("Page fault handling (addr: %#x, pc: %#x) not available in SE "
+              "mode: No interrupt handler!\n", translation->vpBase,
+              translation->req->getPC());
+    }
+
     ThreadContext *tc = translation->tc;
     if (tc != CudaGPU::getCudaGPU(0)->getThreadContext()) {
         warn("Host TC changed! Old: %p, New: %p. Changing translation\n",
@@ -428,22 +622,71 @@ ShaderMMU::handlePageFault(TranslationRequest *translation)
         translation->tc = tc;
     }
 
+    if (isReplayable(translation) && !translation->replay) {
+        translation = replayFaultedTranslations(translation);
+    }
+
+    numPagefaults++;
+    DPRINTF(ShaderMMU, "fault for %#x\n", translation->req->getVaddr());
+    translation->beginFault = curCycle();
+    collectingFaults.push_back(translation);
+
     if (outstandingFaultStatus != None) {
-        pendingFaults.push(translation);
-        DPRINTF(ShaderMMU, "Outstanding fault. %d faults pending \n",
-                pendingFaults.size());
+        DPRINTF(ShaderMMU, "Outstanding fault batch. %d faults pending\n",
+                collectingFaults.size());
         return;
     }
 
-    numPagefaults++;
+    if (collectingFaults.size() >= faultBatchSize || faultBatchTimeout == 0) {
+        startFaultBatch();
+    } else if (!faultBatchEvent.scheduled()) {
+        schedule(faultBatchEvent, clockEdge(faultBatchTimeout));
+    }
+}
 
-    outstandingFaultStatus = InKernel;
-    outstandingFaultInfo = translation;
-    DPRINTF(ShaderMMU, "fault for %#x\n", translation->req->getVaddr());
+void
+ShaderMMU::startFaultBatch()
+{
+    assert(outstandingFaultStatus == None);
+    assert(!collectingFaults.empty());
+    if (faultBatchEvent.scheduled()) {
+        deschedule(faultBatchEvent);
+    }
 
-    outstandingFaultInfo->beginFault = curCycle();
+    while (!collectingFaults.empty() && faultBatch.size() < faultBatchSize) {
+        faultBatch.push_back(collectingFaults.front());
+        collectingFaults.pop_front();
+    }
+    DPRINTF(ShaderMMU, "Raising batch of %d faults\n", faultBatch.size());
+    faultBatchSizes.sample(faultBatch.size());
 
-    raisePageFaultInterrupt(tc);
+    outstandingFaultStatus = InKernel;
+    beginFaultBatch = curCycle();
+    raisePageFaultInterrupt(faultBatch.front()->tc);
+}
+
+void
+ShaderMMU::retryFaultBatch()
+{
+    DPRINTF(ShaderMMU, "Retrying pagetable walks for batch of %d faults\n",
+            faultBatch.size());
+    outstandingFaultStatus = Retrying;
+    faultBatchRetries = faultBatch.size();
+
+    vector<TranslationRequest*>::iterator it = faultBatch.begin();
+    for (; it != faultBatch.end(); ++it) {
+        TranslationRequest *translation = *it;
+        DPRINTF(ShaderMMU, "Walking for %#x\n", translation->req->getVaddr());
+        translation->beginQueue = curCycle();
+        int slot = getFreeWalkSlot();
+        if (slot < 0) {
+            // May want to push this to the front in the future to decrease
+            // latency
+            queueWalk(translation);
+        } else {
+            schedulePagewalk(slot, translation);
+        }
+    }
 }
 
 void
@@ -483,7 +726,7 @@ ShaderMMU::handleFinishPageFault(ThreadContext *tc)
 #elif THE_ISA == X86_ISA
     // Sanity check the CR2 register
     Addr cr2 = tc->readMiscRegNoEffect(MISCREG_CR2);
-    if (cr2 != outstandingFaultInfo->req->getVaddr()) {
+    if (cr2 != faultBatch.front()->req->getVaddr()) {
         warn("Handle finish page fault with wrong CR2\n");
         return;
     }
@@ -507,21 +750,168 @@ ShaderMMU::handleFinishPageFault(ThreadContext *tc)
         return;
     }
 
-    DPRINTF(ShaderMMU, "Retrying pagetable walk for %#x\n",
-                        outstandingFaultInfo->req->getVaddr());
-    outstandingFaultStatus = Retrying;
+    retryFaultBatch();
+}
+
+void
+ShaderMMU::beginMigration(ShaderTLB *req_tlb,
+                          BaseTLB::Translation *translation, RequestPtr req,
+                          BaseTLB::Mode mode)
+{
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(0);
+    Addr unit_base;
+    bool managed = cudaGPU->getManagedUnit(req->getVaddr(), unit_base);
+    assert(managed);
+
+    TranslationRequest *wrapped_translation = allocateTranslation(req_tlb,
+              translation, req, mode, NULL, curTick());
+    wrapped_translation->beginFault = curCycle();
+
+    list<TranslationRequest*> &waiting = pendingMigrations[unit_base];
+    waiting.push_back(wrapped_translation);
+    if (waiting.size() == 1) {
+        DPRINTF(ShaderMMU, "Migration fault for %#x (unit %#x)\n",
+                req->getVaddr(), unit_base);
+        numMigrationFaults++;
+        cudaGPU->migrateManagedMemory(unit_base);
+    } else {
+        DPRINTF(ShaderMMU, "Waiting on migration of unit %#x. %d waiting\n",
+                unit_base, waiting.size());
+    }
+}
+
+void
+ShaderMMU::finishMigration(Addr unit_base)
+{
+    map<Addr, list<TranslationRequest*> >::iterator iter =
+        pendingMigrations.find(unit_base);
+    assert(iter != pendingMigrations.end());
+    list<TranslationRequest*> waiting;
+    waiting.swap(iter->second);
+    pendingMigrations.erase(iter);
+
+    DPRINTF(ShaderMMU, "Migration of unit %#x satisfies %d requests\n",
+            unit_base, waiting.size());
+
+    CudaGPU *cudaGPU = CudaGPU::getCudaGPU(0);
+    list<TranslationRequest*>::iterator it;
+    for (it = waiting.begin(); it != waiting.end(); it++) {
+        TranslationRequest *t = (*it);
+        Addr paddr;
+        if (!cudaGPU->getGPUPageTable()->lookup(t->req->getVaddr(), paddr)) {
+            // Finishing an earlier translation caused the unit to be evicted
+            // again, so it must migrate again
+            list<TranslationRequest*> &retry = pendingMigrations[unit_base];
+            retry.push_back(t);
+            if (retry.size() == 1) {
+                numMigrationFaults++;
+                cudaGPU->migrateManagedMemory(unit_base);
+            }
+            continue;
+        }
+        migrationLatency.sample(curCycle() - t->beginFault);
+        t->req->setPaddr(paddr);
+        t->wrappedTranslation->finish(NoFault, t->req, t->tc, t->mode);
+        releaseTranslation(t);
+    }
+}
+
+void
+ShaderMMU::registerTLB(ShaderTLB *l1_tlb)
+{
+    // In full-system mode the guest OS unmaps and remaps host pages, and
+    // only the CPU TLBs see its invalidations. Without them, TLBs caching
+    // host translations would silently keep stale ones. (Process page
+    // tables in SE mode are never unmapped.)
+    if (FullSystem && l1_tlb->accessesHostPageTable() && !cpuShootdowns) {
+        fatal("%s caches host page table translations, but CPU TLB "
+              "invalidations are not delivered to the GPU. Set "
+              "cpu_shootdowns once the CPU TLBs call "
+              "CudaGPU::demapHostPage and CudaGPU::flushHostTranslations\n",
+              l1_tlb->name());
+    }
+    l1TLBs.push_back(l1_tlb);
+}
+
+void
+ShaderMMU::demapPage(Addr vaddr)
+{
+    DPRINTF(ShaderMMU, "Shootdown of %#x\n", vaddr);
+    pageShootdowns++;
+    queueShootdown(vaddr, false);
+}
 
-    pagefaultLatency.sample(curCycle() - outstandingFaultInfo->beginFault);
+void
+ShaderMMU::flushAll()
+{
+    DPRINTF(ShaderMMU, "Shootdown of all translations\n");
+    flushShootdowns++;
+    queueShootdown(0, true);
+}
 
-    DPRINTF(ShaderMMU, "Walking for %#x\n",
-                        outstandingFaultInfo->req->getVaddr());
+void
+ShaderMMU::queueShootdown(Addr vaddr, bool all)
+{
+    pendingShootdowns.push(Shootdown(vaddr, all, curCycle()));
+    if (!shootdownEvent.scheduled()) {
+        schedule(shootdownEvent, clockEdge(shootdownCycles));
+    }
+}
 
-    TLB *walker = getFreeWalker();
-    if (walker == NULL) {
-        // May want to push this to the front in the future to decrease latency
-        pendingWalks.push(outstandingFaultInfo);
+void
+ShaderMMU::finishShootdown()
+{
+    assert(!pendingShootdowns.empty());
+    const Shootdown &shootdown = pendingShootdowns.front();
+    if (shootdown.all) {
+        DPRINTF(ShaderMMU, "Flushing all GPU TLBs\n");
+        if (tlb) {
+            tlb->flush();
+        }
+        prefetchBuffer.clear();
+        for (unsigned i = 0; i < l1TLBs.size(); i++) {
+            l1TLBs[i]->flushAll();
+        }
     } else {
-        schedulePagewalk(walker, outstandingFaultInfo);
+        DPRINTF(ShaderMMU, "Invalidating %#x in GPU TLBs\n",
+                shootdown.vaddr);
+        if (tlb) {
+            tlb->invalidate(shootdown.vaddr);
+        }
+        auto it = findPrefetch(shootdown.vaddr);
+        if (it != prefetchBuffer.end()) {
+            prefetchBuffer.erase(it);
+        }
+        for (unsigned i = 0; i < l1TLBs.size(); i++) {
+            l1TLBs[i]->demapPage(shootdown.vaddr, 0);
+        }
+    }
+    if (tlb) {
+        l2TranslationReach = tlb->getReach();
+    }
+    // Walks in flight may have read the old page table entries. Their
+    // results still complete the translations, but must not be cached
+    map<Addr, list<TranslationRequest*> >::iterator walk_it;
+    for (walk_it = outstandingWalks.begin();
+         walk_it != outstandingWalks.end(); ++walk_it) {
+        list<TranslationRequest*>::iterator it;
+        for (it = walk_it->second.begin(); it != walk_it->second.end();
+             ++it) {
+            if (shootdown.all) {
+                (*it)->shotDownAll = true;
+            } else {
+                (*it)->shotDownVaddrs.push_back(shootdown.vaddr);
+            }
+        }
+    }
+    // Like x86 INVLPG, invalidating any page also invalidates the cached
+    // upper-level page table entries, since they may have changed as well
+    pwc.flush();
+    shootdownLatency.sample(curCycle() - shootdown.issued);
+    pendingShootdowns.pop();
+
+    if (!pendingShootdowns.empty()) {
+        schedule(shootdownEvent, clockEdge(shootdownCycles));
     }
 }
 
@@ -533,85 +923,442 @@ ShaderMMU::isFaultInFlight(ThreadContext *tc)
 }
 
 void
-ShaderMMU::setWalkerFree(TLB *walker)
+ShaderMMU::raiseCollectedFaults()
 {
-    unsigned pw_id = pagewalkerIndices[walker];
-    assert(pagewalkers[pw_id] == walker);
-    assert(activeWalkers[pw_id] == true);
-    activeWalkers[pw_id] = false;
+    if (outstandingFaultStatus == None && !collectingFaults.empty()) {
+        DPRINTF(ShaderMMU, "Raising %d collected faults early\n",
+                collectingFaults.size());
+        startFaultBatch();
+    }
+}
+
+void
+ShaderMMU::setWalkSlotFree(int slot)
+{
+    assert(activeWalkSlots[slot]);
+    activeWalkSlots[slot] = false;
 
     curOutstandingWalks--;
 }
 
-TLB *
-ShaderMMU::getFreeWalker()
+void
+ShaderMMU::beginNativeWalk(TranslationRequest *translation)
+{
+#if THE_ISA == X86_ISA
+    Addr vaddr = translation->req->getVaddr();
+    if (!FullSystem) {
+        // There is no page table in memory to walk in SE mode, so translate
+        // through the process page table, as the x86 TLB does
+        Process *process = translation->tc->getProcessPtr();
+        Addr paddr;
+        if (process->pTable->translate(vaddr, paddr) ||
+            (process->fixupStackFault(vaddr) &&
+             process->pTable->translate(vaddr, paddr))) {
+            translation->req->setPaddr(paddr);
+            finishWalk(translation, NoFault);
+        } else {
+            finishWalk(translation, std::make_shared<PageFault>(vaddr, false,
+                    translation->mode, true, false));
+        }
+        return;
+    }
+
+    // Walk the page table of the address space the GPU is running, even if
+    // the CPU thread has since switched to another (e.g. into the kernel)
+    Addr pt_base = CudaGPU::getCudaGPU(0)->getRunningPTBase();
+    if (!pt_base) {
+        pt_base = translation->tc->readMiscRegNoEffect(MISCREG_CR3);
+    }
+    Addr root = bits(pt_base, 51, 12) << 12;
+    if (root != pwcRoot) {
+        DPRINTF(ShaderMMU, "Page table root changed to %#x. Flushing PWC\n",
+                root);
+        pwc.flush();
+        // The CPU dropped the translations from the old page table when it
+        // changed the root, so the GPU TLBs must drop them as well
+        if (pwcRoot != 0) {
+            flushAll();
+        }
+        pwcRoot = root;
+    }
+
+    PageWalkCache::Entry entry;
+    int level = pwc.lookup(vaddr, entry);
+    if (level < 0) {
+        pwcMisses++;
+        translation->walkLevel = 0;
+        translation->walkTable = root;
+        translation->walkWritable = true;
+        translation->walkUser = true;
+    } else {
+        DPRINTF(ShaderMMU, "PWC hit at level %d for %#x\n", level, vaddr);
+        pwcHits[level]++;
+        walkStepsSkipped += level + 1;
+        translation->walkLevel = level + 1;
+        translation->walkTable = entry.tableBase;
+        translation->walkWritable = entry.writable;
+        translation->walkUser = entry.user;
+    }
+    sendWalkRead(translation);
+#else
+    panic("Native GPU page walks are only supported for x86\n");
+#endif
+}
+
+void
+ShaderMMU::sendWalkRead(TranslationRequest *translation)
+{
+    // Each level is indexed by 9 bits of the address, starting at bit 39
+    Addr vaddr = translation->req->getVaddr();
+    int shift = 39 - 9 * translation->walkLevel;
+    Addr entry_addr = translation->walkTable +
+                      bits(vaddr, shift + 8, shift) * sizeof(uint64_t);
+
+    Request::Flags flags = Request::PHYSICAL;
+    if (walkerBypassL1) {
+        flags.set(Request::BYPASS_L1);
+    }
+    RequestPtr req = new Request(entry_addr, sizeof(uint64_t), flags,
+                                 walkerMasterId);
+    PacketPtr pkt = new Packet(req, MemCmd::ReadReq);
+    pkt->allocate();
+    pkt->pushSenderState(new WalkSenderState(translation));
+    walkReads++;
+    walkerPort.sendPacket(pkt);
+}
+
+void
+ShaderMMU::recvWalkResponse(PacketPtr pkt)
+{
+#if THE_ISA == X86_ISA
+    if (pkt->isWrite()) {
+        // Accessed and dirty bit updates need no further handling
+        delete pkt->req;
+        delete pkt;
+        return;
+    }
+
+    WalkSenderState *state =
+        safe_cast<WalkSenderState*>(pkt->popSenderState());
+    TranslationRequest *translation = state->translation;
+    delete state;
+    uint64_t pte = pkt->get<uint64_t>();
+    Addr entry_addr = pkt->getAddr();
+    delete pkt->req;
+    delete pkt;
+
+    RequestPtr req = translation->req;
+    Addr vaddr = req->getVaddr();
+    int level = translation->walkLevel;
+    bool write = (translation->mode == BaseTLB::Write);
+    bool present = bits(pte, 0);
+    translation->walkWritable = translation->walkWritable && bits(pte, 1);
+    translation->walkUser = translation->walkUser && bits(pte, 2);
+
+    // GPU accesses are all user mode accesses
+    if (!present || !translation->walkUser ||
+        (write && !translation->walkWritable)) {
+        DPRINTF(ShaderMMU, "Native walk fault for %#x at level %d\n", vaddr,
+                level);
+        finishWalk(translation, std::make_shared<PageFault>(vaddr, present,
+                translation->mode, true, false));
+        return;
+    }
+
+    // Large pages end the walk at the PDP (1GB) or PD (2MB) level
+    bool leaf = (level == PageWalkCache::NumLevels) ||
+                (level > PageWalkCache::PML4 && bits(pte, 7));
+    Addr page_size = ULL(1) << (39 - 9 * level);
+
+    // Set the accessed bit, and the dirty bit for writes to the page
+    uint64_t new_pte = pte | (ULL(1) << 5);
+    if (leaf && write) {
+        new_pte |= ULL(1) << 6;
+    }
+    if (new_pte != pte) {
+        RequestPtr write_req = new Request(entry_addr, sizeof(uint64_t),
+                                           Request::PHYSICAL, walkerMasterId);
+        PacketPtr write_pkt = new Packet(write_req, MemCmd::WriteReq);
+        write_pkt->allocate();
+        write_pkt->set<uint64_t>(new_pte);
+        walkerPort.sendPacket(write_pkt);
+    }
+
+    Addr base = pte & mask(52) & ~mask(12);
+    if (leaf) {
+        base &= ~(page_size - 1);
+        req->setPaddr(base + vaddr % page_size);
+        translation->pageSize = page_size;
+        finishWalk(translation, NoFault);
+    } else {
+        pwc.insert(level, vaddr, PageWalkCache::Entry(base,
+                   translation->walkWritable, translation->walkUser));
+        translation->walkLevel++;
+        translation->walkTable = base;
+        sendWalkRead(translation);
+    }
+#else
+    panic("Native GPU page walks are only supported for x86\n");
+#endif
+}
+
+bool
+ShaderMMU::WalkerPort::recvTimingResp(PacketPtr pkt)
+{
+    mmu->recvWalkResponse(pkt);
+    return true;
+}
+
+void
+ShaderMMU::WalkerPort::sendPacket(PacketPtr pkt)
+{
+    if (!blockedPackets.empty() || !sendTimingReq(pkt)) {
+        blockedPackets.push(pkt);
+    }
+}
+
+void
+ShaderMMU::WalkerPort::recvReqRetry()
+{
+    assert(!blockedPackets.empty());
+    while (!blockedPackets.empty() && sendTimingReq(blockedPackets.front())) {
+        blockedPackets.pop();
+    }
+}
+
+BaseMasterPort&
+ShaderMMU::getMasterPort(const std::string &if_name, PortID idx)
+{
+    if (if_name == "walker_port") {
+        return walkerPort;
+    } else {
+        return MemObject::getMasterPort(if_name, idx);
+    }
+}
+
+void
+ShaderMMU::queueWalk(TranslationRequest *translation)
+{
+    DPRINTF(ShaderMMU, "Queueing walk for %#x. %d pending\n",
+            translation->req->getVaddr(), pendingWalks.size());
+    pendingWalks.push_back(translation);
+}
+
+int
+ShaderMMU::sharedWalkLevels(Addr vaddr_a, Addr vaddr_b)
+{
+    // Walks share the PML4, PDP and PD entries for addresses in the same
+    // 512GB, 1GB and 2MB regions, respectively
+    int shared = 0;
+    int shift = 39;
+    while (shift >= 21 && (vaddr_a >> shift) == (vaddr_b >> shift)) {
+        shared++;
+        shift -= 9;
+    }
+    return shared;
+}
+
+ShaderMMU::TranslationRequest *
+ShaderMMU::nextPendingWalk()
 {
-    TLB * walker = NULL;
-    for (int i=0; i<activeWalkers.size(); i++) {
-        if (walker == NULL && !activeWalkers[i]) {
-            DPRINTF(ShaderMMU, "Using walker %d\n", i);
-            activeWalkers[i] = true;
-            walker = pagewalkers[i];
-            break;
+    assert(!pendingWalks.empty());
+    auto chosen = pendingWalks.begin();
+    if (walkScheduler == BatchWalks &&
+        walksBypassingOldest < walkBatchLimit) {
+        int most_shared = sharedWalkLevels((*chosen)->req->getVaddr(),
+                                           lastWalkVaddr);
+        for (auto it = pendingWalks.begin();
+             it != pendingWalks.end() && most_shared < PageWalkCache::NumLevels;
+             it++) {
+            int shared = sharedWalkLevels((*it)->req->getVaddr(),
+                                          lastWalkVaddr);
+            if (shared > most_shared) {
+                most_shared = shared;
+                chosen = it;
+            }
         }
     }
-    if (walker != NULL) {
-        concurrentWalks.sample(curOutstandingWalks);
-        curOutstandingWalks++;
+
+    if (chosen == pendingWalks.begin()) {
+        walksBypassingOldest = 0;
+    } else {
+        DPRINTF(ShaderMMU, "Batching walk for %#x after walk for %#x\n",
+                (*chosen)->req->getVaddr(), lastWalkVaddr);
+        walksBypassingOldest++;
+        batchedWalks++;
     }
-    return walker;
+    TranslationRequest *translation = *chosen;
+    pendingWalks.erase(chosen);
+    return translation;
+}
+
+int
+ShaderMMU::getFreeWalkSlot()
+{
+    for (int slot = 0; slot < activeWalkSlots.size(); slot++) {
+        if (!activeWalkSlots[slot]) {
+            DPRINTF(ShaderMMU, "Using walk slot %d\n", slot);
+            activeWalkSlots[slot] = true;
+            concurrentWalks.sample(curOutstandingWalks);
+            curOutstandingWalks++;
+            return slot;
+        }
+    }
+    return -1;
 }
 
 void
-ShaderMMU::tryPrefetch(Addr vp_base, ThreadContext *tc)
+ShaderMMU::trainPrefetcher(TranslationRequest *translation, Addr page_base,
+                           Addr page_size)
 {
     // If not using a prefetcher, skip this function.
     if (prefetchBufferSize == 0) {
         return;
     }
 
+    Addr vaddr = translation->req->getVaddr();
+    Addr vp_base = vaddr - vaddr % TheISA::PageBytes;
+    int64_t stride;
+    if (prefetcher == NextPagePrefetcher) {
+        // Prefetch the pages following this one, which may be a large page
+        stride = page_size;
+    } else {
+        StrideKey key(translation->origTLB, translation->req->getPC());
+        auto it = strideTable.find(key);
+        if (it == strideTable.end()) {
+            if (strideTable.size() >= strideTableSize) {
+                // Evict the least recently used history
+                auto lru = strideTable.begin();
+                for (auto e = strideTable.begin(); e != strideTable.end();
+                     e++) {
+                    if (e->second.lastUse < lru->second.lastUse) {
+                        lru = e;
+                    }
+                }
+                strideTable.erase(lru);
+            }
+            StrideEntry &entry = strideTable[key];
+            entry.lastVpBase = vp_base;
+            entry.lastUse = curTick();
+            return;
+        }
+
+        StrideEntry &entry = it->second;
+        entry.lastUse = curTick();
+        int64_t delta = vp_base - entry.lastVpBase;
+        if (delta == 0) {
+            return;
+        }
+        if (delta == entry.stride) {
+            if (entry.confidence < MaxStrideConfidence) {
+                entry.confidence++;
+            }
+        } else {
+            entry.stride = delta;
+            entry.confidence = 0;
+        }
+        entry.lastVpBase = vp_base;
+        if (entry.confidence < StrideConfidenceThreshold) {
+            return;
+        }
+        stride = entry.stride;
+    }
+
+    for (unsigned i = 0; i < prefetchDegree; i++) {
+        Addr target = vp_base + stride * (int64_t)(prefetchAheadDistance + i);
+        if (target - page_base < page_size) {
+            // Already translated by the missing page
+            continue;
+        }
+        issuePrefetch(target - target % TheISA::PageBytes, translation->tc);
+    }
+}
+
+void
+ShaderMMU::issuePrefetch(Addr vp_base, ThreadContext *tc)
+{
     // If this address has already been prefetched, skip
-    auto it = prefetchBuffer.find(vp_base);
-    if (it != prefetchBuffer.end()) {
+    if (findPrefetch(vp_base) != prefetchBuffer.end()) {
         return;
     }
-    if (curOutstandingWalks >= pagewalkers.size()) {
+    if (curOutstandingWalks >= activeWalkSlots.size()) {
         // Not issuing a pagewalk since we already have the max outstanding
         return;
     }
 
-    Addr next_vp_base = vp_base + TheISA::PageBytes;
     Addr pp_base;
-    if (tlb && tlb->lookup(next_vp_base, pp_base, false)) {
+    Addr page_size;
+    if (tlb && tlb->lookup(vp_base, pp_base, page_size, false)) {
         // This vp already in the TLB, no need to prefetch
         return;
     }
 
-    if (outstandingWalks.find(next_vp_base) != outstandingWalks.end()) {
+    if (outstandingWalks.find(vp_base) != outstandingWalks.end()) {
         // Already walking for this vp, no need to prefetch
         return;
     }
 
     numPrefetches++;
 
-    // Prefetch the next PTE into the TLB.
+    // Prefetch the PTE into the prefetch buffer.
     Request::Flags flags;
-    RequestPtr req = new Request(0, next_vp_base, 4, flags, 0, 0, 0, 0);
-    TranslationRequest *translation = new TranslationRequest(this, NULL, NULL,
-                                        req, BaseTLB::Read, tc, true);
-    outstandingWalks[next_vp_base].push_back(translation);
-    TLB *walker = getFreeWalker();
-    assert(walker != NULL); // Should never try to issue a prefetch in this case
+    RequestPtr req = new Request(0, vp_base, 4, flags, 0, 0, 0, 0);
+    TranslationRequest *translation = allocateTranslation(NULL, NULL, req,
+                                        BaseTLB::Read, tc, curTick(), true);
+    outstandingWalks[vp_base].push_back(translation);
+    translation->beginQueue = curCycle();
+    int slot = getFreeWalkSlot();
+    assert(slot >= 0); // Should never try to issue a prefetch in this case
+
+    DPRINTF(ShaderMMU, "Prefetching translation for %#x.\n", vp_base);
+    schedulePagewalk(slot, translation);
+
+    if (prefetchThrottleWindow > 0 &&
+        ++windowPrefetches >= prefetchThrottleWindow) {
+        throttlePrefetches();
+    }
+}
+
+void
+ShaderMMU::throttlePrefetches()
+{
+    // Back off when few prefetches are used or many fault, and prefetch
+    // more aggressively when most are used
+    double accuracy = (double)windowPrefetchHits / windowPrefetches;
+    double fault_rate = (double)windowPrefetchFaults / windowPrefetches;
+    if ((accuracy < 0.25 || fault_rate > 0.25) && prefetchDegree > 1) {
+        prefetchDegree--;
+        prefetchThrottleDowns++;
+    } else if (accuracy > 0.75 && fault_rate < 0.05 &&
+               prefetchDegree < maxPrefetchDegree) {
+        prefetchDegree++;
+        prefetchThrottleUps++;
+    }
+    DPRINTF(ShaderMMU, "Prefetch accuracy %f, fault rate %f. Degree now %d\n",
+            accuracy, fault_rate, prefetchDegree);
+    windowPrefetches = 0;
+    windowPrefetchHits = 0;
+    windowPrefetchFaults = 0;
+}
 
-    DPRINTF(ShaderMMU, "Prefetching translation for %#x.\n", next_vp_base);
-    schedulePagewalk(walker, translation);
+std::map<Addr, GPUTlbEntry>::iterator
+ShaderMMU::findPrefetch(Addr vaddr)
+{
+    for (int i = 0; i < NumGPUPageSizes; i++) {
+        auto it = prefetchBuffer.find(vaddr - vaddr % GPUPageSizes[i]);
+        if (it != prefetchBuffer.end() && it->second.contains(vaddr)) {
+            return it;
+        }
+    }
+    return prefetchBuffer.end();
 }
 
 void
-ShaderMMU::insertPrefetch(Addr vp_base, Addr pp_base)
+ShaderMMU::insertPrefetch(Addr vp_base, Addr pp_base, Addr page_size)
 {
-    DPRINTF(ShaderMMU, "Inserting %#x->%#x into pf buffer\n", vp_base, pp_base);
-    assert(vp_base % TheISA::PageBytes == 0);
+    DPRINTF(ShaderMMU, "Inserting %#x->%#x (%#x bytes) into pf buffer\n",
+            vp_base, pp_base, page_size);
+    assert(vp_base % page_size == 0);
     // Insert into prefetch buffer
     if (prefetchBuffer.size() >= prefetchBufferSize) {
         // evict unused entry from prefetch buffer
@@ -629,6 +1376,8 @@ ShaderMMU::insertPrefetch(Addr vp_base, Addr pp_base)
     GPUTlbEntry &e = prefetchBuffer[vp_base];
     e.vpBase = vp_base;
     e.ppBase = pp_base;
+    e.size = page_size;
+    e.free = false;
     e.setMRU();
     assert(prefetchBuffer.size() <= prefetchBufferSize);
 }
@@ -652,6 +1401,45 @@ ShaderMMU::regStats()
         .name(name()+".l2hits")
         .desc("Hits in the shared L2")
         ;
+    l2hitsBySize
+        .init(NumGPUPageSizes)
+        .name(name()+".l2hitsBySize")
+        .desc("Hits in the shared L2 by page size")
+        ;
+    walksBySize
+        .init(NumGPUPageSizes)
+        .name(name()+".walksBySize")
+        .desc("Successful pagewalks by the page size walked")
+        ;
+    for (int i = 0; i < NumGPUPageSizes; i++) {
+        l2hitsBySize.subname(i, gpuPageSizeName(i));
+        walksBySize.subname(i, gpuPageSizeName(i));
+    }
+    l2TranslationReach
+        .name(name()+".l2TranslationReach")
+        .desc("Average bytes of virtual memory mapped by the shared L2")
+        ;
+
+    pwcHits
+        .init(PageWalkCache::NumLevels)
+        .name(name()+".pwcHits")
+        .desc("Native walks starting from a page walk cache entry by level")
+        ;
+    pwcHits.subname(PageWalkCache::PML4, "pml4");
+    pwcHits.subname(PageWalkCache::PDP, "pdp");
+    pwcHits.subname(PageWalkCache::PD, "pd");
+    pwcMisses
+        .name(name()+".pwcMisses")
+        .desc("Native walks with no page walk cache entry")
+        ;
+    walkReads
+        .name(name()+".walkReads")
+        .desc("Page table entries read by native walks")
+        ;
+    walkStepsSkipped
+        .name(name()+".walkStepsSkipped")
+        .desc("Page table reads skipped using the page walk cache")
+        ;
 
     prefetchHits
         .name(name() + ".prefetchHits")
@@ -665,6 +1453,23 @@ ShaderMMU::regStats()
         .name(name() + ".prefetchFaults")
         .desc("Number of faults caused by prefetches")
         ;
+    replayedTranslations
+        .name(name() + ".replayedTranslations")
+        .desc("Number of translations sent away to replay after a fault")
+        ;
+    prefetchThrottleUps
+        .name(name() + ".prefetchThrottleUps")
+        .desc("Times the prefetch degree was increased")
+        ;
+    prefetchThrottleDowns
+        .name(name() + ".prefetchThrottleDowns")
+        .desc("Times the prefetch degree was decreased")
+        ;
+
+    numMigrationFaults
+        .name(name() + ".numMigrationFaults")
+        .desc("Number of faults on managed memory that is not in GPU memory")
+        ;
 
     pagefaultLatency
         .name(name()+".pagefaultLatency")
@@ -672,29 +1477,121 @@ ShaderMMU::regStats()
         .init(32)
         ;
 
+    faultBatchSizes
+        .name(name()+".faultBatchSizes")
+        .desc("Number of page faults raised to the CPU in each batch")
+        .init(16)
+        ;
+
+    faultBatchLatency
+        .name(name()+".faultBatchLatency")
+        .desc("Cycles from raising a batch of page faults until all of its "
+              "walks are retried")
+        .init(32)
+        ;
+
     pagewalkLatency
         .name(name()+".pagewalkLatency")
         .desc("Latency to complete the pagewalk")
         .init(32)
         ;
 
+    const char *scheduler = walkScheduler == BatchWalks ? "batch" : "fifo";
+    walkQueueLatency
+        .name(name()+".walkQueueLatency")
+        .desc(csprintf("Cycles walks waited for a walk slot (%s scheduling)",
+                       scheduler))
+        .init(32)
+        ;
+
+    walkLatency
+        .name(name()+".walkLatency")
+        .desc(csprintf("Cycles from requesting to completing a walk, "
+                       "including queueing (%s scheduling)", scheduler))
+        .init(32)
+        ;
+
+    batchedWalks
+        .name(name()+".batchedWalks")
+        .desc("Walks the batch scheduler started ahead of older walks")
+        ;
+
     concurrentWalks
         .name(name()+".concurrentWalks")
         .desc("Number of outstanding walks")
         .init(16)
         ;
+
+    migrationLatency
+        .name(name()+".migrationLatency")
+        .desc("Latency to migrate managed memory after a fault")
+        .init(32)
+        ;
+
+    pageShootdowns
+        .name(name()+".pageShootdowns")
+        .desc("Number of page shootdowns from the CPU")
+        ;
+
+    flushShootdowns
+        .name(name()+".flushShootdowns")
+        .desc("Number of shootdowns from the CPU that flushed all TLBs")
+        ;
+
+    shootdownLatency
+        .name(name()+".shootdownLatency")
+        .desc("Latency from a shootdown's arrival until the GPU TLBs are "
+              "invalidated")
+        .init(16)
+        ;
+
+    shotDownWalks
+        .name(name()+".shotDownWalks")
+        .desc("Number of walks whose results were not cached because their "
+              "page was shot down during the walk")
+        ;
 }
 
-ShaderMMU::TranslationRequest::TranslationRequest(ShaderMMU *_mmu,
-    ShaderTLB *_tlb, BaseTLB::Translation *translation,
-    RequestPtr _req, BaseTLB::Mode _mode, ThreadContext *_tc, Tick start_tick,
-    bool prefetch)
-            : mmu(_mmu), origTLB(_tlb), pageWalker(NULL),
-              wrappedTranslation(translation), req(_req), mode(_mode), tc(_tc),
-              beginFault(0), beginWalk(0), startTick(start_tick),
-              prefetch(prefetch)
+void
+ShaderMMU::TranslationRequest::init(ShaderTLB *_tlb,
+    BaseTLB::Translation *translation, RequestPtr _req, BaseTLB::Mode _mode,
+    ThreadContext *_tc, Tick start_tick, bool _prefetch)
 {
+    origTLB = _tlb;
+    walkSlot = -1;
+    wrappedTranslation = translation;
+    req = _req;
+    mode = _mode;
+    tc = _tc;
     vpBase = req->getVaddr() - req->getVaddr() % TheISA::PageBytes;
+    pageSize = TheISA::PageBytes;
+    beginFault = Cycles(0);
+    beginQueue = Cycles(0);
+    beginWalk = Cycles(0);
+    startTick = start_tick;
+    prefetch = _prefetch;
+    replay = false;
+    walkLevel = 0;
+    walkTable = 0;
+    walkWritable = false;
+    walkUser = false;
+    shotDownAll = false;
+    shotDownVaddrs.clear();
+}
+
+bool
+ShaderMMU::TranslationRequest::isShotDown(Addr vp_base, Addr page_size) const
+{
+    if (shotDownAll) {
+        return true;
+    }
+    for (unsigned i = 0; i < shotDownVaddrs.size(); i++) {
+        if (shotDownVaddrs[i] >= vp_base &&
+            shotDownVaddrs[i] < vp_base + page_size) {
+            return true;
+        }
+    }
+    return false;
 }
 
 ShaderMMU *ShaderMMUParams::create() {
@@ -37,45 +37,82 @@
 #include <set>
 
 #include "arch/tlb.hh"
+#include "base/callback.hh"
 #include "base/statistics.hh"
 #include "debug/ShaderMMU.hh"
 #include "params/ShaderMMU.hh"
+#include "gpu/page_walk_cache.hh"
 #include "gpu/shader_tlb.hh"
-#include "sim/clocked_object.hh"
+#include "mem/mem_object.hh"
+#include "mem/packet.hh"
 #include "sim/faults.hh"
 #include "arch/generic/tlb.hh"
 
-class ShaderMMU : public ClockedObject
+/**
+ * With replayable faults, translations to a page with a fault in flight
+ * finish with this fault rather than waiting for the fault to be handled.
+ * The requester is expected to replay the translation once the MMU calls
+ * back that the fault is resolved (see ShaderMMU::replayAfterFault).
+ */
+class ReplayableGPUFault : public FaultBase
+{
+  public:
+    FaultName name() const { return "replayable_gpu_fault"; }
+};
+
+class ShaderMMU : public MemObject
 {
 private:
-    std::vector<TheISA::TLB*> pagewalkers;
-    std::map<TheISA::TLB*, unsigned> pagewalkerIndices;
-    std::vector<bool> activeWalkers;
 #if THE_ISA == ARM_ISA
+    // ARM walks use the walkers of wrapped TLBs, one for each walk slot
+    std::vector<TheISA::TLB*> pagewalkers;
     TheISA::Stage2MMU *stage2MMU;
 #endif
+    // Whether each walk slot has a walk in flight
+    std::vector<bool> activeWalkSlots;
 
     class TranslationRequest : public BaseTLB::Translation
     {
     public:
         ShaderMMU *mmu;
         ShaderTLB *origTLB;
-        TheISA::TLB *pageWalker;
+        // The walk slot of the walk in flight, or -1
+        int walkSlot;
         BaseTLB::Translation *wrappedTranslation;
         RequestPtr req;
         BaseTLB::Mode mode;
         ThreadContext *tc;
         Addr vpBase;
+        // The size of the page returned by the walk
+        Addr pageSize;
         Cycles beginFault;
+        // When the walk was requested, including any time spent queued
+        Cycles beginQueue;
         Cycles beginWalk;
         Tick startTick;
         bool prefetch;
+        // Whether this request stands in for the requesters of a faulting
+        // page that have been sent away to replay. It owns its req and has
+        // no wrapped translation.
+        bool replay;
+        // State of a native walk: the level of the next table to read, its
+        // physical base, and the permissions of the levels read so far
+        int walkLevel;
+        Addr walkTable;
+        bool walkWritable;
+        bool walkUser;
+        // Shootdowns that completed while the translation was outstanding.
+        // Its result is not cached if it covers a shot-down page.
+        bool shotDownAll;
+        std::vector<Addr> shotDownVaddrs;
+        bool isShotDown(Addr vp_base, Addr page_size) const;
 
     public:
-        TranslationRequest(ShaderMMU *_mmu, ShaderTLB *_tlb,
-                           BaseTLB::Translation *translation, RequestPtr _req,
-                           BaseTLB::Mode _mode, ThreadContext *_tc,
-                           Tick start_tick, bool prefetch = false);
+        TranslationRequest(ShaderMMU *_mmu) : mmu(_mmu) {}
+        /// Set up the request for a new translation
+        void init(ShaderTLB *_tlb, BaseTLB::Translation *translation,
+                  RequestPtr _req, BaseTLB::Mode _mode, ThreadContext *_tc,
+                  Tick start_tick, bool _prefetch = false);
         Tick getStartTick() { return startTick; }
         void markDelayed() { wrappedTranslation->markDelayed(); }
         void finish(const Fault &fault, RequestPtr _req, ThreadContext *_tc,
@@ -107,11 +144,11 @@ private:
     class StartPagewalkEvent : public Event
     {
         ShaderMMU *mmu;
-        TheISA::TLB *walker;
+        int slot;
         TranslationRequest *translation;
     public:
-        StartPagewalkEvent(ShaderMMU *_mmu, TheISA::TLB *_walker) :
-            mmu(_mmu), walker(_walker), translation(NULL) {}
+        StartPagewalkEvent(ShaderMMU *_mmu, int _slot) :
+            mmu(_mmu), slot(_slot), translation(NULL) {}
         void setTranslation(TranslationRequest *_translation) {
             assert(!translation);
             translation = _translation;
@@ -120,7 +157,7 @@ private:
             assert(translation);
             TranslationRequest *starting_translation = translation;
             translation = NULL;
-            mmu->walk(walker, starting_translation);
+            mmu->walk(slot, starting_translation);
         }
     };
 
@@ -162,50 +199,279 @@ private:
     FaultTimeoutEvent faultTimeoutEvent;
     Cycles faultTimeoutCycles;
 
+    class FaultBatchEvent : public Event
+    {
+        ShaderMMU *mmu;
+    public:
+        FaultBatchEvent(ShaderMMU *_mmu) : mmu(_mmu) {}
+        void process() {
+            mmu->startFaultBatch();
+        }
+    };
+
+    FaultBatchEvent faultBatchEvent;
+
+    /**
+     * TLB shootdowns. When the CPU invalidates translations, the GPU's L1
+     * TLBs (which register with the MMU), the L2 TLB, the prefetch buffer
+     * and the page walk cache must all drop them. Each shootdown takes
+     * shootdownCycles to deliver and acknowledge, and shootdowns are
+     * handled one at a time in the order they arrive.
+     */
+    class Shootdown
+    {
+    public:
+        Shootdown(Addr _vaddr, bool _all, Cycles _issued) :
+            vaddr(_vaddr), all(_all), issued(_issued) {}
+        Addr vaddr;
+        // Whether to invalidate all translations rather than one page
+        bool all;
+        Cycles issued;
+    };
+
+    class ShootdownEvent : public Event
+    {
+        ShaderMMU *mmu;
+    public:
+        ShootdownEvent(ShaderMMU *_mmu) : mmu(_mmu) {}
+        void process() {
+            mmu->finishShootdown();
+        }
+    };
+
+    ShootdownEvent shootdownEvent;
+    Cycles shootdownCycles;
+    // Whether the CPU TLBs deliver their invalidations to demapPage and
+    // flushAll
+    bool cpuShootdowns;
+    std::queue<Shootdown> pendingShootdowns;
+    std::vector<ShaderTLB*> l1TLBs;
+
+    /// Queue a shootdown of vaddr, or of all translations
+    void queueShootdown(Addr vaddr, bool all);
+    /// Invalidate the translations of the oldest shootdown
+    void finishShootdown();
+
     TLBMemory *tlb;
 
+    /**
+     * x86 page walks are done natively: each walk slot reads page table
+     * entries through the walker port, starting from the deepest entry in
+     * the page walk cache. In SE mode, there is no page table in memory, so
+     * walks translate functionally through the process page table. ARM
+     * walks use the walkers of wrapped ArmTLBs.
+     */
+    class WalkerPort : public MasterPort
+    {
+        ShaderMMU *mmu;
+        std::queue<PacketPtr> blockedPackets;
+    public:
+        WalkerPort(const std::string &_name, ShaderMMU *_mmu) :
+            MasterPort(_name, _mmu), mmu(_mmu) {}
+        void sendPacket(PacketPtr pkt);
+    protected:
+        bool recvTimingResp(PacketPtr pkt);
+        void recvReqRetry();
+    };
+
+    class WalkSenderState : public Packet::SenderState
+    {
+    public:
+        WalkSenderState(TranslationRequest *_translation) :
+            translation(_translation) {}
+        TranslationRequest *translation;
+    };
+
+    WalkerPort walkerPort;
+    MasterID walkerMasterId;
+    bool walkerBypassL1;
+    PageWalkCache pwc;
+    // The page table root that the page walk cache entries are from
+    Addr pwcRoot;
+
+    /// Begin a native walk from the deepest page walk cache entry
+    void beginNativeWalk(TranslationRequest *translation);
+    /// Read the page table entry at the current level of a native walk
+    void sendWalkRead(TranslationRequest *translation);
+    /// Handle a page table entry read by a native walk
+    void recvWalkResponse(PacketPtr pkt);
+
     enum FaultStatus {
         None, // No outstanding faults
         InKernel, // Waiting for the kernel to handle the pf
         Retrying // Retrying the pagetable walk. May not be complete yet.
     };
 
-    std::queue<TranslationRequest*> pendingWalks;
+    /**
+     * Walks wait in pendingWalks while all walk slots are busy. The FIFO
+     * scheduler starts them in arrival order. The batch scheduler starts the
+     * pending walk that shares the most upper-level page table entries with
+     * the last walk started, so walks to neighboring pages run back to back
+     * and reuse the entries in the page walk cache and caches. To avoid
+     * starving older walks, at most walkBatchLimit walks are started ahead
+     * of the oldest one.
+     */
+    enum WalkScheduler {
+        FIFOWalks,
+        BatchWalks
+    };
+    WalkScheduler walkScheduler;
+    std::list<TranslationRequest*> pendingWalks;
+    unsigned walkBatchLimit;
+    unsigned walksBypassingOldest;
+    Addr lastWalkVaddr;
+
+    /// Queue a walk until a walk slot is free
+    void queueWalk(TranslationRequest *translation);
+    /// Remove the next walk to start from pendingWalks
+    TranslationRequest *nextPendingWalk();
+    /// The number of upper-level entries the walks for two addresses share
+    static int sharedWalkLevels(Addr vaddr_a, Addr vaddr_b);
     std::map<Addr, std::list<TranslationRequest*> > outstandingWalks;
-    std::queue<TranslationRequest*> pendingFaults;
 
+    /**
+     * Page faults are raised to the CPU in batches. Faults are collected in
+     * collectingFaults while a batch is outstanding, or until faultBatchSize
+     * pages have faulted or faultBatchTimeout cycles have passed since the
+     * first of them. Each batch raises one interrupt for its first fault, and
+     * after the one handler pass, the walks of the whole batch are retried
+     * together. The handler resolves the address raised to it, so a retry of
+     * any other fault in the batch that still faults is collected into the
+     * next batch, which starts once all of the retries finish.
+     */
     FaultStatus outstandingFaultStatus;
-    TranslationRequest *outstandingFaultInfo;
+    std::vector<TranslationRequest*> faultBatch;
+    // Retry walks of faultBatch that have not yet finished
+    unsigned faultBatchRetries;
+    Cycles beginFaultBatch;
+    std::list<TranslationRequest*> collectingFaults;
+    unsigned faultBatchSize;
+    Cycles faultBatchTimeout;
+
+    /// Raise the next batch of collected faults to the CPU
+    void startFaultBatch();
+    /// Retry the walks for all faults in the batch once they are handled
+    void retryFaultBatch();
 
     unsigned int curOutstandingWalks;
 
+    // Translations waiting for managed memory to migrate to GPU memory,
+    // indexed by the base address of the migrating unit
+    std::map<Addr, std::list<TranslationRequest*> > pendingMigrations;
+
     std::map<Addr, GPUTlbEntry> prefetchBuffer;
     int prefetchBufferSize;
-    int prefetchAheadDistance;
+
+    /**
+     * The TLB prefetcher trains on misses in the L2 TLB (including
+     * prefetch buffer hits). The next_page prefetcher prefetches the pages
+     * following each missing page. The stride prefetcher keeps the stride
+     * between the pages missed by each PC of each L1 TLB, and prefetches
+     * once the same stride repeats. Prefetches start prefetchAheadDistance
+     * strides ahead, and up to prefetchDegree are issued per miss. The
+     * degree is throttled between 1 and maxPrefetchDegree by the accuracy
+     * and fault rate of each window of prefetches.
+     */
+    enum Prefetcher {
+        NextPagePrefetcher,
+        StridePrefetcher
+    };
+    Prefetcher prefetcher;
+    unsigned prefetchAheadDistance;
+    unsigned prefetchDegree;
+    unsigned maxPrefetchDegree;
+
+    class StrideEntry
+    {
+    public:
+        StrideEntry() : lastVpBase(0), stride(0), confidence(0),
+                        lastUse(0) {}
+        Addr lastVpBase;
+        int64_t stride;
+        unsigned confidence;
+        Tick lastUse;
+    };
+    static const unsigned StrideConfidenceThreshold = 2;
+    static const unsigned MaxStrideConfidence = 3;
+    typedef std::pair<ShaderTLB*, Addr> StrideKey;
+    std::map<StrideKey, StrideEntry> strideTable;
+    unsigned strideTableSize;
+
+    unsigned prefetchThrottleWindow;
+    unsigned windowPrefetches;
+    unsigned windowPrefetchHits;
+    unsigned windowPrefetchFaults;
 
     void finalizeTranslation(TranslationRequest *translation);
 
+    /// Find the prefetch buffer entry for a page of any size mapping vaddr
+    std::map<Addr, GPUTlbEntry>::iterator findPrefetch(Addr vaddr);
+
     /// Handle a page fault from a shader TLB
     void handlePageFault(TranslationRequest *translation);
 
-    void setWalkerFree(TheISA::TLB *walker);
-    TheISA::TLB *getFreeWalker();
-    void schedulePagewalk(TheISA::TLB *walker, TranslationRequest *translation)
+    /**
+     * Faults are replayable for shader TLBs that set replayable_faults.
+     * Rather than holding their translations to a faulting page until the
+     * fault is handled, the translations finish with a ReplayableGPUFault,
+     * so the requesters can release the resources held by the accesses. A
+     * single replay request takes their place to raise the fault and retry
+     * the walk, and the replay callbacks registered for the page are called
+     * once the retry succeeds. Translations from other TLBs wait behind the
+     * replay request as usual.
+     */
+    std::map<Addr, std::list<Callback*> > faultReplays;
+
+    /// Whether translation finishes with a replayable fault
+    bool isReplayable(TranslationRequest *translation) {
+        ShaderTLB *orig_tlb = translation->origTLB;
+        return orig_tlb && orig_tlb->faultsReplayable();
+    }
+    /// Send the replayable translations waiting on a faulting page away to
+    /// replay, and return the replay request that takes their place
+    TranslationRequest *replayFaultedTranslations(
+            TranslationRequest *translation);
+    /// Finish a translation with a replayable fault
+    void finishReplayable(TranslationRequest *translation);
+
+    void setWalkSlotFree(int slot);
+    /// Claim a free walk slot, returning -1 if all slots are in use
+    int getFreeWalkSlot();
+    void schedulePagewalk(int slot, TranslationRequest *translation)
     {
         // Start the page walk in the next cycle
-        unsigned pw_id = pagewalkerIndices[walker];
-        assert(activeWalkers[pw_id]);
-        StartPagewalkEvent *spe = pagewalkEvents[pw_id];
+        assert(activeWalkSlots[slot]);
+        walkQueueLatency.sample(curCycle() - translation->beginQueue);
+        lastWalkVaddr = translation->req->getVaddr();
+        StartPagewalkEvent *spe = pagewalkEvents[slot];
         spe->setTranslation(translation);
         schedule(spe, nextCycle());
     }
 
-    // Log the vp base address of the access. If we detect a pattern issue the
-    // prefetch. This is currently just a simple 1-ahead prefetcher
-    void tryPrefetch(Addr vp_base, ThreadContext *tc);
+    // Translation requests are recycled through a pool, rather than being
+    // allocated for every TLB miss
+    std::vector<TranslationRequest*> translationPool;
+    TranslationRequest *allocateTranslation(ShaderTLB *req_tlb,
+            BaseTLB::Translation *translation, RequestPtr req,
+            BaseTLB::Mode mode, ThreadContext *tc, Tick start_tick,
+            bool prefetch = false);
+    void releaseTranslation(TranslationRequest *translation) {
+        translationPool.push_back(translation);
+    }
+
+    /// Train the prefetcher on an L2 TLB miss, and issue any prefetches.
+    /// The page containing the miss is given if it is known.
+    void trainPrefetcher(TranslationRequest *translation, Addr page_base,
+                         Addr page_size);
+
+    /// Walk for the base page at vp_base if it is not already translated
+    void issuePrefetch(Addr vp_base, ThreadContext *tc);
+
+    /// Adjust the prefetch degree after a window of prefetches
+    void throttlePrefetches();
 
     // Insert prefetch into prefetch buffer
-    void insertPrefetch(Addr vp_base, Addr pp_base);
+    void insertPrefetch(Addr vp_base, Addr pp_base, Addr page_size);
 
 public:
     /// Constructor
@@ -222,14 +488,18 @@ public:
                       RequestPtr req, BaseTLB::Mode mode, ThreadContext *tc);
 
     /// Called from a start pagewalk event
-    void walk(TheISA::TLB *walker, TranslationRequest *translation) {
-        assert(translation->pageWalker == NULL);
-        assert(walker != NULL);
+    void walk(int slot, TranslationRequest *translation) {
+        assert(translation->walkSlot == -1);
+        assert(slot >= 0);
         translation->beginWalk = curCycle();
-        translation->pageWalker = walker;
+        translation->walkSlot = slot;
         numPagewalks++;
-        walker->translateTiming(translation->req, translation->tc, translation,
-                                translation->mode);
+#if THE_ISA == ARM_ISA
+        pagewalkers[slot]->translateTiming(translation->req, translation->tc,
+                                           translation, translation->mode);
+#else
+        beginNativeWalk(translation);
+#endif
     }
 
     // Called after the pagetable walk from TranslationRequest
@@ -239,6 +509,10 @@ public:
     // thread handling
     bool isFaultInFlight(ThreadContext *tc);
 
+    /// Raise the collected faults now rather than waiting for the batch to
+    /// fill (e.g. before the CPU thread blocks on the GPU)
+    void raiseCollectedFaults();
+
     // Raise the page fault to the CPU if everything is ready
     void raisePageFaultInterrupt(ThreadContext *tc);
 
@@ -248,19 +522,67 @@ public:
     /// Handle a page fault once it's done (called from CUDA API via CudaGPU)
     void handleFinishPageFault(ThreadContext *tc);
 
+    /// Call replay->process() once the fault on the page holding vaddr is
+    /// resolved, and then delete replay. Requesters call this when their
+    /// translation finishes with a ReplayableGPUFault.
+    void replayAfterFault(Addr vaddr, Callback *replay);
+
+    /// Called when a shader tlb accesses managed memory that is not resident
+    /// in GPU memory. The translation completes after the memory migrates.
+    void beginMigration(ShaderTLB *req_tlb, BaseTLB::Translation *translation,
+                        RequestPtr req, BaseTLB::Mode mode);
+
+    /// Called by the CudaGPU when a unit of managed memory has migrated
+    void finishMigration(Addr unit_base);
+
+    /// Called by each L1 TLB so that it receives shootdowns
+    void registerTLB(ShaderTLB *l1_tlb);
+
+    /// Called when the CPU invalidates the translation of vaddr (e.g. with
+    /// INVLPG), to shoot it down from all GPU TLBs
+    void demapPage(Addr vaddr);
+
+    /// Called when the CPU invalidates all translations (e.g. when the page
+    /// table root changes), to flush all GPU TLBs
+    void flushAll();
+
+    BaseMasterPort& getMasterPort(const std::string &if_name,
+                                  PortID idx = InvalidPortID);
+
     void regStats();
 
     Stats::Scalar numPagefaults;
     Stats::Scalar numPagewalks;
     Stats::Scalar totalRequests;
     Stats::Scalar l2hits;
+    Stats::Vector l2hitsBySize;
+    Stats::Vector walksBySize;
+    Stats::Average l2TranslationReach;
+    Stats::Vector pwcHits;
+    Stats::Scalar pwcMisses;
+    Stats::Scalar walkReads;
+    Stats::Scalar walkStepsSkipped;
     Stats::Scalar prefetchHits;
     Stats::Scalar numPrefetches;
     Stats::Scalar prefetchFaults;
+    Stats::Scalar replayedTranslations;
+    Stats::Scalar prefetchThrottleUps;
+    Stats::Scalar prefetchThrottleDowns;
+    Stats::Scalar numMigrationFaults;
 
     Stats::Histogram pagefaultLatency;
+    Stats::Histogram faultBatchSizes;
+    Stats::Histogram faultBatchLatency;
     Stats::Histogram concurrentWalks;
     Stats::Histogram pagewalkLatency;
+    Stats::Histogram walkQueueLatency;
+    Stats::Histogram walkLatency;
+    Stats::Scalar batchedWalks;
+    Stats::Histogram migrationLatency;
+    Stats::Scalar pageShootdowns;
+    Stats::Scalar flushShootdowns;
+    Stats::Histogram shootdownLatency;
+    Stats::Scalar shotDownWalks;
 };
 
 #endif // SHADER_MMU_HH_
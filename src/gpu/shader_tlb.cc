@@ -47,14 +47,26 @@ using namespace TheISA;
 
 ShaderTLB::ShaderTLB(const Params *p) :
     BaseTLB(p), numEntries(p->entries), hitLatency(p->hit_latency),
-    cudaGPU(p->gpu), accessHostPageTable(p->access_host_pagetable)
+    cudaGPU(p->gpu), accessHostPageTable(p->access_host_pagetable),
+    replayableFaults(p->replayable_faults),
+    numMSHRs(p->mshrs), activeMSHRs(0), numBanks(p->banks),
+    lookupPorts(p->lookup_ports), bankQueues(p->banks),
+    bankCycles(p->banks, Cycles(0)), bankLookups(p->banks, 0),
+    bankQueueEvent(this), trackSharing(p->shared),
+    lastExtentValid(false), lastExtentVersion(0), lastExtentVaddr(0),
+    lastExtentSize(0), lastExtentPaddr(0)
 {
     if (numEntries > 0) {
-        tlbMemory = new TLBMemory(p->entries, p->associativity);
+        tlbMemory = new TLBMemory(p->entries, p->associativity,
+                                  p->replacement_policy);
     } else {
         tlbMemory = new InfiniteTLBMemory();
     }
     mmu = cudaGPU->getMMU();
+    mmu->registerTLB(this);
+    if (numBanks == 0) {
+        fatal("ShaderTLB needs at least one bank\n");
+    }
 }
 
 void
@@ -70,7 +82,30 @@ ShaderTLB::beginTranslateTiming(RequestPtr req,
                                 BaseTLB::Translation *translation,
                                 BaseTLB::Mode mode)
 {
+    // Device memory covered by the GPU's segment translates without a TLB
+    // or page table lookup
+    Addr segment_paddr;
+    if (cudaGPU->translateDeviceSegment(req->getVaddr(), segment_paddr)) {
+        DPRINTF(ShaderTLB, "Segment translation for vaddr %x = paddr %x\n",
+                req->getVaddr(), segment_paddr);
+        segmentTranslations++;
+        req->setPaddr(segment_paddr);
+        translation->finish(NoFault, req, NULL, mode);
+        return;
+    }
+
     if (accessHostPageTable) {
+        unsigned bank = (req->getVaddr() / PageBytes) % numBanks;
+        if (!bankQueues[bank].empty() || !claimLookupPort(bank)) {
+            DPRINTF(ShaderTLB, "Bank %d busy. Delaying lookup of %#x\n",
+                    bank, req->getVaddr());
+            bankConflicts++;
+            bankQueues[bank].push_back(PendingLookup(req, translation, mode));
+            if (!bankQueueEvent.scheduled()) {
+                schedule(bankQueueEvent, cudaGPU->clockEdge(Cycles(1)));
+            }
+            return;
+        }
         translateTiming(req, cudaGPU->getThreadContext(), translation, mode);
     } else {
         // The below code implements a perfect TLB with instant access to the
@@ -78,14 +113,51 @@ ShaderTLB::beginTranslateTiming(RequestPtr req,
         // TODO: We can shift this around, maybe to memory, maybe hierarchical TLBs
         assert(numEntries == 0);
         Addr vaddr = req->getVaddr();
-        Addr page_vaddr = cudaGPU->getGPUPageTable()->addrToPage(vaddr);
-        Addr offset = vaddr - page_vaddr;
-        Addr page_paddr;
-        if (cudaGPU->getGPUPageTable()->lookup(page_vaddr, page_paddr)) {
+        auto page_table = cudaGPU->getGPUPageTable();
+
+        // Check the last translated extent first, unless mappings have been
+        // removed from the page table since it was cached
+        if (lastExtentValid && lastExtentVersion == page_table->getVersion() &&
+            vaddr - lastExtentVaddr < lastExtentSize) {
+            Addr paddr = lastExtentPaddr + (vaddr - lastExtentVaddr);
+            DPRINTF(ShaderTLB, "Last translation hit for vaddr %x = paddr %x\n",
+                                vaddr, paddr);
+            lastTranslationHits++;
+            req->setPaddr(paddr);
+            translation->finish(NoFault, req, NULL, mode);
+            return;
+        }
+
+        Addr paddr;
+        Addr extent_vaddr, extent_size;
+        bool mapped = page_table->lookup(vaddr, paddr, extent_vaddr,
+                                         extent_size);
+        if (!mapped) {
+            // Device pages with first-touch placement are placed on the
+            // first access, near the accessing core
+            int core_id = req->hasContextId() ? req->contextId() : -1;
+            if (cudaGPU->touchDevicePage(vaddr, core_id)) {
+                mapped = page_table->lookup(vaddr, paddr, extent_vaddr,
+                                            extent_size);
+                assert(mapped);
+            }
+        }
+        if (mapped) {
             DPRINTF(ShaderTLB, "Translation found for vaddr %x = paddr %x\n",
-                                vaddr, page_paddr + offset);
-            req->setPaddr(page_paddr + offset);
+                                vaddr, paddr);
+            lastExtentValid = true;
+            lastExtentVersion = page_table->getVersion();
+            lastExtentVaddr = extent_vaddr;
+            lastExtentSize = extent_size;
+            lastExtentPaddr = paddr - (vaddr - extent_vaddr);
+            req->setPaddr(paddr);
             translation->finish(NoFault, req, NULL, mode);
+        } else if (cudaGPU->isManagedAddress(vaddr)) {
+            // Managed memory that is not resident in GPU memory. The MMU
+            // has it migrated and then finishes the translation.
+            DPRINTF(ShaderTLB, "Managed memory fault for vaddr %x\n", vaddr);
+            translation->markDelayed();
+            mmu->beginMigration(this, translation, req, mode);
         } else {
             panic("ShaderTLB missing translation for vaddr: %p! @pc: %p",
                     vaddr, req->getPC());
@@ -93,6 +165,43 @@ ShaderTLB::beginTranslateTiming(RequestPtr req,
     }
 }
 
+bool
+ShaderTLB::claimLookupPort(unsigned bank)
+{
+    if (lookupPorts == 0) {
+        return true;
+    }
+    Cycles cur_cycle = cudaGPU->curCycle();
+    if (bankCycles[bank] != cur_cycle) {
+        bankCycles[bank] = cur_cycle;
+        bankLookups[bank] = 0;
+    }
+    if (bankLookups[bank] >= lookupPorts) {
+        return false;
+    }
+    bankLookups[bank]++;
+    return true;
+}
+
+void
+ShaderTLB::processBankQueues()
+{
+    bool pending = false;
+    for (unsigned bank = 0; bank < numBanks; bank++) {
+        deque<PendingLookup> &queue = bankQueues[bank];
+        while (!queue.empty() && claimLookupPort(bank)) {
+            PendingLookup lookup = queue.front();
+            queue.pop_front();
+            translateTiming(lookup.req, cudaGPU->getThreadContext(),
+                            lookup.translation, lookup.mode);
+        }
+        pending = pending || !queue.empty();
+    }
+    if (pending) {
+        schedule(bankQueueEvent, cudaGPU->clockEdge(Cycles(1)));
+    }
+}
+
 void
 ShaderTLB::translateTiming(RequestPtr req, ThreadContext *tc,
                            Translation *translation, Mode mode)
@@ -132,13 +241,20 @@ ShaderTLB::translateTiming(RequestPtr req, ThreadContext *tc,
 
     Addr vaddr = req->getVaddr();
     DPRINTF(ShaderTLB, "Translating vaddr %#x.\n", vaddr);
-    Addr offset = vaddr % TheISA::PageBytes;
-    Addr vp_base = vaddr - offset;
     Addr pp_base;
+    Addr page_size;
 
-    if (tlbMemory->lookup(vp_base, pp_base)) {
+    if (tlbMemory->lookup(vaddr, pp_base, page_size)) {
+        Addr offset = vaddr % page_size;
         DPRINTF(ShaderTLB, "TLB hit. Phys addr %#x.\n", pp_base + offset);
         hits++;
+        hitsBySize[gpuPageSizeIndex(page_size)]++;
+        if (trackSharing) {
+            auto it = pageFillers.find(vaddr - vaddr % PageBytes);
+            if (it != pageFillers.end() && it->second != req->masterId()) {
+                sharedHits++;
+            }
+        }
         req->setPaddr(pp_base + offset);
         translation->finish(NoFault, req, tc, mode);
     } else {
@@ -147,41 +263,215 @@ ShaderTLB::translateTiming(RequestPtr req, ThreadContext *tc,
         misses++;
         translation->markDelayed();
 
-        mmu->beginTLBMiss(this, translation, req, mode, tc);
+        Addr vp_base = vaddr - vaddr % PageBytes;
+        auto it = outstandingMisses.find(vp_base);
+        if (it != outstandingMisses.end()) {
+            DPRINTF(ShaderTLB, "Merging miss into MSHR for %#x\n", vp_base);
+            mshrHits++;
+            if (trackSharing && req->masterId() !=
+                    it->second->targets.front().req->masterId()) {
+                sharedMSHRHits++;
+            }
+            it->second->targets.push_back(
+                MissTarget(req, translation, mode, tc));
+            return;
+        }
+
+        MSHR *mshr = new MSHR(this, vp_base);
+        mshr->targets.push_back(MissTarget(req, translation, mode, tc));
+        outstandingMisses[vp_base] = mshr;
+        if (isStalled()) {
+            DPRINTF(ShaderTLB, "MSHRs full. Queuing miss for %#x\n", vp_base);
+            mshrQueued++;
+            queuedMisses.push(mshr);
+        } else {
+            issueMiss(mshr);
+        }
+    }
+}
+
+void
+ShaderTLB::issueMiss(MSHR *mshr)
+{
+    activeMSHRs++;
+    MissTarget &primary = mshr->targets.front();
+    mmu->beginTLBMiss(this, mshr, primary.req, primary.mode, primary.tc);
+}
+
+void
+ShaderTLB::finishMiss(MSHR *mshr, const Fault &fault)
+{
+    DPRINTF(ShaderTLB, "Miss for %#x finished with %d targets\n",
+            mshr->vpBase, mshr->targets.size());
+    outstandingMisses.erase(mshr->vpBase);
+    bool was_stalled = isStalled();
+    assert(activeMSHRs > 0);
+    activeMSHRs--;
+
+    // All targets are on the same base page, so they share its frame
+    RequestPtr primary_req = mshr->targets.front().req;
+    Addr frame = 0;
+    if (fault == NoFault) {
+        frame = primary_req->getPaddr() - primary_req->getVaddr() % PageBytes;
+        if (mshr->stale) {
+            // The MMU fills the TLB before finishing the miss
+            DPRINTF(ShaderTLB, "Dropping stale fill for %#x\n",
+                    mshr->vpBase);
+            if (tlbMemory->invalidate(mshr->vpBase)) {
+                translationReach = tlbMemory->getReach();
+            }
+        } else if (trackSharing) {
+            pageFillers[mshr->vpBase] = primary_req->masterId();
+        }
+    }
+    list<MissTarget>::iterator it = mshr->targets.begin();
+    for (; it != mshr->targets.end(); it++) {
+        if (fault == NoFault && it->req != primary_req) {
+            it->req->setPaddr(frame + it->req->getVaddr() % PageBytes);
+        }
+        it->translation->finish(fault, it->req, it->tc, it->mode);
+    }
+    delete mshr;
+
+    if (!queuedMisses.empty()) {
+        MSHR *next = queuedMisses.front();
+        queuedMisses.pop();
+        issueMiss(next);
+    }
+    if (was_stalled && !isStalled()) {
+        for (unsigned i = 0; i < mshrRetries.size(); i++) {
+            mshrRetries[i]->process();
+        }
     }
 }
 
 void
-ShaderTLB::insert(Addr vp_base, Addr pp_base)
+ShaderTLB::insert(Addr vp_base, Addr pp_base, Addr page_size)
 {
-    tlbMemory->insert(vp_base, pp_base);
+    // Misses are attributed to a page size once the walk returns it
+    missesBySize[gpuPageSizeIndex(page_size)]++;
+    tlbMemory->insert(vp_base, pp_base, page_size);
+    translationReach = tlbMemory->getReach();
 }
 
 void
 ShaderTLB::demapPage(Addr addr, uint64_t asn)
 {
     DPRINTF(ShaderTLB, "Demapping %#x.\n", addr);
-    panic("Demap addr unimplemented");
+    demaps++;
+    if (tlbMemory->invalidate(addr)) {
+        demapInvalidations++;
+        translationReach = tlbMemory->getReach();
+    }
+    pageFillers.erase(addr - addr % PageBytes);
+    auto it = outstandingMisses.find(addr - addr % PageBytes);
+    if (it != outstandingMisses.end()) {
+        it->second->stale = true;
+    }
+    lastExtentValid = false;
+    notifyInvalidated();
 }
 
 void
 ShaderTLB::flushAll()
 {
-    panic("Flush all unimplemented");
+    DPRINTF(ShaderTLB, "Flushing all entries.\n");
+    flushes++;
+    tlbMemory->flush();
+    translationReach = tlbMemory->getReach();
+    pageFillers.clear();
+    map<Addr, MSHR*>::iterator it = outstandingMisses.begin();
+    for (; it != outstandingMisses.end(); ++it) {
+        it->second->stale = true;
+    }
+    lastExtentValid = false;
+    notifyInvalidated();
+}
+
+void
+ShaderTLB::notifyInvalidated()
+{
+    for (unsigned i = 0; i < invalidateCallbacks.size(); i++) {
+        invalidateCallbacks[i]->process();
+    }
+}
+
+TLBMemory::TLBMemory(int _numEntries, int associativity,
+                     const string &replacement_policy) :
+    numEntries(_numEntries), assoc(associativity), reach(0)
+{
+    if (assoc == 0) {
+        assoc = numEntries;
+    }
+    if (numEntries % assoc != 0) {
+        fatal("TLB entries (%d) must be a multiple of the associativity "
+              "(%d)\n", numEntries, assoc);
+    }
+    numSets = numEntries / assoc;
+    entries = new GPUTlbEntry*[numSets];
+    for (int i=0; i < numSets; i++) {
+        entries[i] = new GPUTlbEntry[assoc];
+    }
+    replacementPolicy = createTLBReplacementPolicy(replacement_policy,
+                                                   numSets, assoc);
+    hashedLookup = assoc >= HashedLookupAssoc;
+    if (hashedLookup) {
+        wayIndex.reserve(numEntries);
+    }
+    for (int i=0; i < NumGPUPageSizes; i++) {
+        sizeEntries[i] = 0;
+    }
+}
+
+TLBMemory::~TLBMemory()
+{
+    for (int i=0; i < numSets; i++) {
+        delete[] entries[i];
+    }
+    delete[] entries;
+    delete replacementPolicy;
+}
+
+int
+TLBMemory::findWay(int set, Addr vp_base, int size_index)
+{
+    if (hashedLookup) {
+        auto it = wayIndex.find(indexKey(vp_base, size_index));
+        return it == wayIndex.end() ? -1 : it->second;
+    }
+    Addr size = GPUPageSizes[size_index];
+    for (int way=0; way < assoc; way++) {
+        GPUTlbEntry &entry = entries[set][way];
+        if (entry.vpBase == vp_base && entry.size == size && !entry.free) {
+            return way;
+        }
+    }
+    return -1;
 }
 
 bool
-TLBMemory::lookup(Addr vp_base, Addr& pp_base, bool set_mru)
+TLBMemory::lookup(Addr vaddr, Addr& pp_base, Addr& page_size, bool set_mru)
 {
-    int way = (vp_base / TheISA::PageBytes) % ways;
-    for (int i=0; i < sets; i++) {
-        if (entries[way][i].vpBase == vp_base && !entries[way][i].free) {
-            pp_base = entries[way][i].ppBase;
-            assert(entries[way][i].mruTick > 0);
+    // Entries are indexed by their page number, so probe the set that an
+    // entry of each present page size would occupy
+    for (int s = 0; s < NumGPUPageSizes; s++) {
+        if (sizeEntries[s] == 0) {
+            continue;
+        }
+        Addr size = GPUPageSizes[s];
+        Addr vp_base = vaddr - vaddr % size;
+        int set = getSet(vp_base, size);
+        int way = findWay(set, vp_base, s);
+        if (way >= 0) {
+            GPUTlbEntry &entry = entries[set][way];
+            pp_base = entry.ppBase;
+            page_size = size;
+            assert(entry.mruTick > 0);
             if (set_mru) {
-                entries[way][i].setMRU();
+                entry.setMRU();
+                replacementPolicy->touch(set, way);
             }
-            entries[way][i].hits++;
+            entry.hits++;
             return true;
         }
     }
@@ -190,33 +480,96 @@ TLBMemory::lookup(Addr vp_base, Addr& pp_base, bool set_mru)
 }
 
 void
-TLBMemory::insert(Addr vp_base, Addr pp_base)
+TLBMemory::insert(Addr vp_base, Addr pp_base, Addr page_size)
 {
-    Addr a;
-    if (lookup(vp_base, a)) {
+    assert(vp_base % page_size == 0);
+    int size_index = gpuPageSizeIndex(page_size);
+    int set = getSet(vp_base, page_size);
+    if (findWay(set, vp_base, size_index) >= 0) {
         return;
     }
-    int way = (vp_base / TheISA::PageBytes) % ways;
-    GPUTlbEntry* entry = NULL;
-    Tick minTick = curTick();
-    for (int i=0; i < sets; i++) {
-        if (entries[way][i].free) {
-            entry = &entries[way][i];
+
+    int way = -1;
+    for (int i=0; i < assoc; i++) {
+        if (entries[set][i].free) {
+            way = i;
             break;
-        } else if (entries[way][i].mruTick <= minTick) {
-            minTick = entries[way][i].mruTick;
-            entry = &entries[way][i];
         }
     }
-    assert(entry);
+    if (way < 0) {
+        way = replacementPolicy->getVictim(set);
+    }
+    GPUTlbEntry* entry = &entries[set][way];
     if (!entry->free) {
-        DPRINTF(ShaderTLB, "Evicting entry for vp %#x\n", entry->vpBase);
+        DPRINTF(ShaderTLB, "Evicting entry for vp %#x (%#x bytes)\n",
+                entry->vpBase, entry->size);
+        int evicted_index = gpuPageSizeIndex(entry->size);
+        sizeEntries[evicted_index]--;
+        reach -= entry->size;
+        if (hashedLookup) {
+            wayIndex.erase(indexKey(entry->vpBase, evicted_index));
+        }
     }
 
     entry->vpBase = vp_base;
     entry->ppBase = pp_base;
+    entry->size = page_size;
     entry->free = false;
+    entry->hits = 0;
     entry->setMRU();
+    replacementPolicy->insert(set, way);
+    sizeEntries[size_index]++;
+    reach += page_size;
+    if (hashedLookup) {
+        wayIndex[indexKey(vp_base, size_index)] = way;
+    }
+}
+
+bool
+TLBMemory::invalidate(Addr vaddr)
+{
+    bool found = false;
+    for (int s = 0; s < NumGPUPageSizes; s++) {
+        if (sizeEntries[s] == 0) {
+            continue;
+        }
+        Addr size = GPUPageSizes[s];
+        Addr vp_base = vaddr - vaddr % size;
+        int set = getSet(vp_base, size);
+        int way = findWay(set, vp_base, s);
+        if (way < 0) {
+            continue;
+        }
+        DPRINTF(ShaderTLB, "Invalidating entry for vp %#x (%#x bytes)\n",
+                vp_base, size);
+        entries[set][way].free = true;
+        replacementPolicy->invalidate(set, way);
+        sizeEntries[s]--;
+        reach -= size;
+        if (hashedLookup) {
+            wayIndex.erase(indexKey(vp_base, s));
+        }
+        found = true;
+    }
+    return found;
+}
+
+void
+TLBMemory::flush()
+{
+    for (int set = 0; set < numSets; set++) {
+        for (int way = 0; way < assoc; way++) {
+            if (!entries[set][way].free) {
+                entries[set][way].free = true;
+                replacementPolicy->invalidate(set, way);
+            }
+        }
+    }
+    wayIndex.clear();
+    for (int i = 0; i < NumGPUPageSizes; i++) {
+        sizeEntries[i] = 0;
+    }
+    reach = 0;
 }
 
 void
@@ -235,7 +588,78 @@ ShaderTLB::regStats()
         .desc("Hit rate for this TLB")
         ;
 
+    lastTranslationHits
+        .name(name()+".lastTranslationHits")
+        .desc("Device page table lookups avoided by the last translation")
+        ;
+
+    segmentTranslations
+        .name(name()+".segmentTranslations")
+        .desc("Translations of device memory by the GPU's segment")
+        ;
+
+    demaps
+        .name(name()+".demaps")
+        .desc("Number of page invalidations received")
+        ;
+
+    demapInvalidations
+        .name(name()+".demapInvalidations")
+        .desc("Number of page invalidations that removed a valid entry")
+        ;
+
+    flushes
+        .name(name()+".flushes")
+        .desc("Number of times all entries were invalidated")
+        ;
+
+    mshrHits
+        .name(name()+".mshrHits")
+        .desc("Number of misses merged into an outstanding miss")
+        ;
+    mshrQueued
+        .name(name()+".mshrQueued")
+        .desc("Number of misses queued while all MSHRs were in use")
+        ;
+    bankConflicts
+        .name(name()+".bankConflicts")
+        .desc("Number of lookups delayed for a free port in their bank")
+        ;
+    sharedHits
+        .name(name()+".sharedHits")
+        .desc("Number of hits on pages filled by another requester")
+        ;
+    sharedMSHRHits
+        .name(name()+".sharedMSHRHits")
+        .desc("Number of misses merged into another requester's miss")
+        ;
+    sharedHitRate
+        .name(name()+".sharedHitRate")
+        .desc("Hit rate from hits on pages filled by another requester")
+        ;
+
+    hitsBySize
+        .init(NumGPUPageSizes)
+        .name(name()+".hitsBySize")
+        .desc("Number of hits in this TLB by page size")
+        ;
+    missesBySize
+        .init(NumGPUPageSizes)
+        .name(name()+".missesBySize")
+        .desc("Number of misses in this TLB by the page size walked")
+        ;
+    for (int i = 0; i < NumGPUPageSizes; i++) {
+        hitsBySize.subname(i, gpuPageSizeName(i));
+        missesBySize.subname(i, gpuPageSizeName(i));
+    }
+
+    translationReach
+        .name(name()+".translationReach")
+        .desc("Average bytes of virtual memory mapped by this TLB")
+        ;
+
     hitRate = hits / (hits + misses);
+    sharedHitRate = sharedHits / (hits + misses);
 }
 
 ShaderTLB *
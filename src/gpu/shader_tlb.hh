@@ -29,89 +29,191 @@
 #ifndef SHADER_TLB_HH_
 #define SHADER_TLB_HH_
 
+#include <deque>
+#include <list>
 #include <map>
+#include <queue>
 #include <set>
+#include <string>
+#include <unordered_map>
+#include <vector>
 
+#include "arch/isa_traits.hh"
+#include "base/callback.hh"
+#include "base/cprintf.hh"
+#include "base/misc.hh"
 #include "base/statistics.hh"
+#include "gpu/tlb_replacement_policy.hh"
 #include "params/ShaderTLB.hh"
 #include "arch/generic/tlb.hh"
 
 class ShaderMMU;
 class CudaGPU;
 
+/// Page sizes that GPU TLB entries can map: the base page size and 2MB and
+/// 1GB large pages
+const int NumGPUPageSizes = 3;
+const Addr GPUPageSizes[NumGPUPageSizes] = {
+    TheISA::PageBytes, ULL(0x200000), ULL(0x40000000)
+};
+
+/// Get the index into GPUPageSizes of a page size
+inline int
+gpuPageSizeIndex(Addr page_size)
+{
+    for (int i = 0; i < NumGPUPageSizes; i++) {
+        if (GPUPageSizes[i] == page_size) {
+            return i;
+        }
+    }
+    panic("Unsupported GPU TLB page size: %#x\n", page_size);
+}
+
+/// Get a name for a page size for use in statistics (e.g. "2MB")
+inline std::string
+gpuPageSizeName(int index)
+{
+    Addr size = GPUPageSizes[index];
+    if (size >= ULL(0x40000000)) {
+        return csprintf("%dGB", size >> 30);
+    } else if (size >= ULL(0x100000)) {
+        return csprintf("%dMB", size >> 20);
+    }
+    return csprintf("%dKB", size >> 10);
+}
+
 class GPUTlbEntry {
 public:
     Addr vpBase;
     Addr ppBase;
+    Addr size;
     bool free;
     Tick mruTick;
     uint32_t hits;
-    GPUTlbEntry() : vpBase(0), ppBase(0), free(true), mruTick(0), hits(0) {}
+    GPUTlbEntry() : vpBase(0), ppBase(0), size(TheISA::PageBytes), free(true),
+                    mruTick(0), hits(0) {}
     void setMRU() { mruTick = curTick(); }
+    bool contains(Addr vaddr) const {
+        return !free && vaddr - vpBase < size;
+    }
 };
 
 class BaseTLBMemory {
 public:
-    virtual bool lookup(Addr vp_base, Addr& pp_base, bool set_mru=true) = 0;
-    virtual void insert(Addr vp_base, Addr pp_base) = 0;
+    /// Look up the entry mapping vaddr, which may be for a page of any
+    /// supported size. Returns the physical base and size of the page.
+    virtual bool lookup(Addr vaddr, Addr& pp_base, Addr& page_size,
+                        bool set_mru=true) = 0;
+    virtual void insert(Addr vp_base, Addr pp_base,
+                        Addr page_size=TheISA::PageBytes) = 0;
+    /// The number of bytes of virtual memory mapped by valid entries
+    virtual Addr getReach() = 0;
+    /// Remove the entries mapping vaddr. Returns whether any were valid.
+    virtual bool invalidate(Addr vaddr) = 0;
+    /// Remove all entries
+    virtual void flush() = 0;
 };
 
 class TLBMemory : public BaseTLBMemory {
     int numEntries;
-    int sets;
-    int ways;
+    int numSets;
+    int assoc;
 
+    // Entries indexed by [set][way]
     GPUTlbEntry **entries;
+    TLBReplacementPolicy *replacementPolicy;
+
+    // Highly associative TLBs index their valid entries by page so lookups
+    // do not scan the whole set. Since pages are at least 4KB aligned, the
+    // page size index fits in the low bits of the key.
+    static const int HashedLookupAssoc = 16;
+    bool hashedLookup;
+    std::unordered_map<Addr, int> wayIndex;
+    static Addr indexKey(Addr vp_base, int size_index) {
+        return vp_base | size_index;
+    }
+
+    // Entries of each page size, so lookups only probe the sets for page
+    // sizes that are present
+    int sizeEntries[NumGPUPageSizes];
+    Addr reach;
+
+    int getSet(Addr vp_base, Addr page_size) {
+        return (vp_base / page_size) % numSets;
+    }
+    /// Find the way in set holding the page, or -1 if it is not present
+    int findWay(int set, Addr vp_base, int size_index);
 
 protected:
     TLBMemory() {}
 
 public:
-    TLBMemory(int _numEntries, int associativity) :
-        numEntries(_numEntries), sets(associativity)
-    {
-        if (sets == 0) {
-            sets = numEntries;
-        }
-        assert(numEntries % sets == 0);
-        ways = numEntries/sets;
-        entries = new GPUTlbEntry*[ways];
-        for (int i=0; i < ways; i++) {
-            entries[i] = new GPUTlbEntry[sets];
-        }
-    }
-    virtual ~TLBMemory()
-    {
-        for (int i=0; i < sets; i++) {
-            delete[] entries[i];
-        }
-        delete[] entries;
-    }
+    /// associativity of 0 makes the TLB fully associative
+    TLBMemory(int _numEntries, int associativity,
+              const std::string &replacement_policy = "lru");
+    virtual ~TLBMemory();
 
-    virtual bool lookup(Addr vp_base, Addr& pp_base, bool set_mru=true);
-    virtual void insert(Addr vp_base, Addr pp_base);
+    virtual bool lookup(Addr vaddr, Addr& pp_base, Addr& page_size,
+                        bool set_mru=true);
+    virtual void insert(Addr vp_base, Addr pp_base,
+                        Addr page_size=TheISA::PageBytes);
+    virtual Addr getReach() { return reach; }
+    virtual bool invalidate(Addr vaddr);
+    virtual void flush();
 };
 
 class InfiniteTLBMemory : public BaseTLBMemory {
-    std::map<Addr, Addr> entries;
+    // Entries for each page size, indexed by virtual page base
+    std::map<Addr, Addr> entries[NumGPUPageSizes];
+    Addr reach;
 public:
-    InfiniteTLBMemory() {}
+    InfiniteTLBMemory() : reach(0) {}
     ~InfiniteTLBMemory() {}
 
-    bool lookup(Addr vp_base, Addr& pp_base, bool set_mru=true)
+    bool lookup(Addr vaddr, Addr& pp_base, Addr& page_size,
+                bool set_mru=true)
+    {
+        for (int i = 0; i < NumGPUPageSizes; i++) {
+            if (entries[i].empty()) {
+                continue;
+            }
+            auto it = entries[i].find(vaddr - vaddr % GPUPageSizes[i]);
+            if (it != entries[i].end()) {
+                pp_base = it->second;
+                page_size = GPUPageSizes[i];
+                return true;
+            }
+        }
+        pp_base = Addr(0);
+        return false;
+    }
+    void insert(Addr vp_base, Addr pp_base, Addr page_size=TheISA::PageBytes)
+    {
+        std::map<Addr, Addr> &size_entries =
+            entries[gpuPageSizeIndex(page_size)];
+        if (size_entries.find(vp_base) == size_entries.end()) {
+            reach += page_size;
+        }
+        size_entries[vp_base] = pp_base;
+    }
+    Addr getReach() { return reach; }
+    bool invalidate(Addr vaddr)
     {
-        auto it = entries.find(vp_base);
-        if (it != entries.end()) {
-            pp_base = it->second;
-            return true;
-        } else {
-            pp_base = Addr(0);
-            return false;
+        bool found = false;
+        for (int i = 0; i < NumGPUPageSizes; i++) {
+            if (entries[i].erase(vaddr - vaddr % GPUPageSizes[i])) {
+                reach -= GPUPageSizes[i];
+                found = true;
+            }
         }
+        return found;
     }
-    void insert(Addr vp_base, Addr pp_base)
+    void flush()
     {
-        entries[vp_base] = pp_base;
+        for (int i = 0; i < NumGPUPageSizes; i++) {
+            entries[i].clear();
+        }
+        reach = 0;
     }
 };
 
@@ -125,14 +227,118 @@ private:
     // Pointer to the SPA to access the page table
     CudaGPU* cudaGPU;
     bool accessHostPageTable;
+    // Whether the requester replays translations that page fault
+    bool replayableFaults;
 
     BaseTLBMemory *tlbMemory;
 
+    // The last extent translated from the device page table, which is valid
+    // until mappings are removed from the page table
+    bool lastExtentValid;
+    uint64_t lastExtentVersion;
+    Addr lastExtentVaddr;
+    Addr lastExtentSize;
+    Addr lastExtentPaddr;
+
     void translateTiming(RequestPtr req, ThreadContext *tc,
                          Translation *translation, Mode mode);
 
     ShaderMMU *mmu;
 
+    /**
+     * Misses are tracked in miss status holding registers (MSHRs), one for
+     * each base page with a miss outstanding. Secondary misses to the page
+     * are merged into its MSHR rather than being sent to the MMU, and finish
+     * when the primary miss does. With a bounded number of MSHRs, misses
+     * wait in queuedMisses while all MSHRs are in use. Requesters that can
+     * stall should not translate while isStalled(), and can register a
+     * callback for when an MSHR frees up.
+     */
+    class MissTarget
+    {
+      public:
+        MissTarget(RequestPtr _req, Translation *_translation, Mode _mode,
+                   ThreadContext *_tc) :
+            req(_req), translation(_translation), mode(_mode), tc(_tc) {}
+        RequestPtr req;
+        Translation *translation;
+        Mode mode;
+        ThreadContext *tc;
+    };
+
+    class MSHR : public Translation
+    {
+      public:
+        MSHR(ShaderTLB *_tlb, Addr vp_base) :
+            tlb(_tlb), vpBase(vp_base), stale(false) {}
+        ShaderTLB *tlb;
+        Addr vpBase;
+        // The page was demapped while the miss was outstanding, so the
+        // translation the MMU fills must not stay in the TLB
+        bool stale;
+        // The request of the first target is sent to the MMU
+        std::list<MissTarget> targets;
+        void markDelayed() {}
+        void finish(const Fault &fault, RequestPtr req, ThreadContext *tc,
+                    Mode mode)
+        {
+            tlb->finishMiss(this, fault);
+        }
+    };
+
+    // The number of MSHRs (0 => unlimited)
+    unsigned numMSHRs;
+    unsigned activeMSHRs;
+    // Outstanding misses, including queued ones, indexed by base page
+    std::map<Addr, MSHR*> outstandingMisses;
+    std::queue<MSHR*> queuedMisses;
+    std::vector<Callback*> mshrRetries;
+
+    /// Send the primary miss of an MSHR to the MMU
+    void issueMiss(MSHR *mshr);
+    /// Finish the targets of an MSHR once the MMU translates its page
+    void finishMiss(MSHR *mshr, const Fault &fault);
+
+    /**
+     * Lookups are spread over banks by base page number. Each bank can
+     * start lookupPorts lookups per cycle (0 => unlimited), and lookups
+     * beyond that wait in the bank's queue for a later cycle. This models
+     * port contention in a TLB shared by the cores of a cluster.
+     */
+    class PendingLookup
+    {
+      public:
+        PendingLookup(RequestPtr _req, Translation *_translation,
+                      Mode _mode) :
+            req(_req), translation(_translation), mode(_mode) {}
+        RequestPtr req;
+        Translation *translation;
+        Mode mode;
+    };
+
+    unsigned numBanks;
+    unsigned lookupPorts;
+    std::vector<std::deque<PendingLookup> > bankQueues;
+    // The lookups each bank has started in its last active cycle
+    std::vector<Cycles> bankCycles;
+    std::vector<unsigned> bankLookups;
+
+    /// Take a lookup port of bank this cycle, if one is left
+    bool claimLookupPort(unsigned bank);
+    /// Start the queued lookups that fit in this cycle's ports
+    void processBankQueues();
+    EventWrapper<ShaderTLB, &ShaderTLB::processBankQueues> bankQueueEvent;
+
+    // For a TLB shared between requesters, the requester whose miss filled
+    // each page, to count the hits that sharing the TLB provides
+    bool trackSharing;
+    std::unordered_map<Addr, MasterID> pageFillers;
+
+    // Called whenever entries are invalidated, so requesters can drop
+    // translations they cache in front of this TLB
+    std::vector<Callback*> invalidateCallbacks;
+    void notifyInvalidated();
+
 public:
     typedef ShaderTLBParams Params;
     ShaderTLB(const Params *p);
@@ -151,13 +357,39 @@ public:
 
     void takeOverFrom(BaseTLB *_tlb) {}
 
-    void insert(Addr vp_base, Addr pp_base);
+    bool faultsReplayable() { return replayableFaults; }
+    bool accessesHostPageTable() { return accessHostPageTable; }
+
+    /// Whether all MSHRs are in use
+    bool isStalled() { return numMSHRs > 0 && activeMSHRs >= numMSHRs; }
+    /// Add a callback for when an MSHR frees up after the TLB stalled
+    void addMSHRRetry(Callback *retry) { mshrRetries.push_back(retry); }
+    /// Add a callback for when entries are invalidated by a shootdown
+    void addInvalidateCallback(Callback *callback) {
+        invalidateCallbacks.push_back(callback);
+    }
+
+    void insert(Addr vp_base, Addr pp_base, Addr page_size=TheISA::PageBytes);
 
     void regStats();
 
     Stats::Scalar hits;
     Stats::Scalar misses;
     Stats::Formula hitRate;
+    Stats::Scalar lastTranslationHits;
+    Stats::Scalar segmentTranslations;
+    Stats::Scalar mshrHits;
+    Stats::Scalar mshrQueued;
+    Stats::Scalar bankConflicts;
+    Stats::Scalar sharedHits;
+    Stats::Scalar sharedMSHRHits;
+    Stats::Formula sharedHitRate;
+    Stats::Scalar demaps;
+    Stats::Scalar demapInvalidations;
+    Stats::Scalar flushes;
+    Stats::Vector hitsBySize;
+    Stats::Vector missesBySize;
+    Stats::Average translationReach;
 };
 
 #endif /* SHADER_TLB_HH_ */
@@ -0,0 +1,140 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include "base/intmath.hh"
+#include "base/misc.hh"
+#include "base/random.hh"
+#include "gpu/tlb_replacement_policy.hh"
+
+using namespace std;
+
+LRUTLBPolicy::LRUTLBPolicy(int num_sets, int _assoc) :
+    TLBReplacementPolicy(num_sets, _assoc), accessCount(0),
+    lastAccess(num_sets, vector<uint64_t>(_assoc, 0))
+{
+}
+
+int
+LRUTLBPolicy::getVictim(int set)
+{
+    int victim = 0;
+    for (int way = 1; way < assoc; way++) {
+        if (lastAccess[set][way] < lastAccess[set][victim]) {
+            victim = way;
+        }
+    }
+    return victim;
+}
+
+TreePLRUTLBPolicy::TreePLRUTLBPolicy(int num_sets, int _assoc) :
+    TLBReplacementPolicy(num_sets, _assoc),
+    trees(num_sets, vector<bool>(_assoc, false))
+{
+    if (!isPowerOf2(assoc)) {
+        fatal("Tree-PLRU TLB replacement requires a power of 2 "
+              "associativity (%d)\n", assoc);
+    }
+}
+
+void
+TreePLRUTLBPolicy::touch(int set, int way)
+{
+    // Walk from the root to the leaf for this way, pointing each node away
+    // from the half that was just used. Nodes are stored heap-style from
+    // index 1, so node n has children 2n and 2n+1.
+    vector<bool> &tree = trees[set];
+    int node = 1;
+    for (int half = assoc / 2; half > 0; half /= 2) {
+        bool upper = way & half;
+        tree[node] = !upper;
+        node = 2 * node + upper;
+    }
+}
+
+int
+TreePLRUTLBPolicy::getVictim(int set)
+{
+    // Follow the pointers from the root to the pseudo-LRU way
+    vector<bool> &tree = trees[set];
+    int node = 1;
+    int way = 0;
+    for (int half = assoc / 2; half > 0; half /= 2) {
+        if (tree[node]) {
+            way += half;
+        }
+        node = 2 * node + tree[node];
+    }
+    return way;
+}
+
+int
+RandomTLBPolicy::getVictim(int set)
+{
+    return random_mt.random<int>(0, assoc - 1);
+}
+
+const uint8_t SRRIPTLBPolicy::MaxRRPV;
+
+SRRIPTLBPolicy::SRRIPTLBPolicy(int num_sets, int _assoc) :
+    TLBReplacementPolicy(num_sets, _assoc),
+    rrpv(num_sets, vector<uint8_t>(_assoc, MaxRRPV))
+{
+}
+
+int
+SRRIPTLBPolicy::getVictim(int set)
+{
+    vector<uint8_t> &values = rrpv[set];
+    // Age the whole set until some entry is predicted to be re-referenced
+    // in the distant future
+    while (true) {
+        for (int way = 0; way < assoc; way++) {
+            if (values[way] == MaxRRPV) {
+                return way;
+            }
+        }
+        for (int way = 0; way < assoc; way++) {
+            values[way]++;
+        }
+    }
+}
+
+TLBReplacementPolicy *
+createTLBReplacementPolicy(const string &name, int num_sets, int assoc)
+{
+    if (name == "lru") {
+        return new LRUTLBPolicy(num_sets, assoc);
+    } else if (name == "tree_plru") {
+        return new TreePLRUTLBPolicy(num_sets, assoc);
+    } else if (name == "random") {
+        return new RandomTLBPolicy(num_sets, assoc);
+    } else if (name == "srrip") {
+        return new SRRIPTLBPolicy(num_sets, assoc);
+    }
+    fatal("Unknown TLB replacement policy: %s\n", name);
+}
@@ -0,0 +1,126 @@
+/*
+ * Copyright (c) 2013 Mark D. Hill and David A. Wood
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __GPU_TLB_REPLACEMENT_POLICY_HH__
+#define __GPU_TLB_REPLACEMENT_POLICY_HH__
+
+#include <string>
+#include <vector>
+
+#include "base/types.hh"
+
+/**
+ * Chooses victims within the sets of a set-associative TLB. The TLB tells
+ * the policy about fills, hits and invalidations, and only asks for a
+ * victim when every way in the set is valid.
+ */
+class TLBReplacementPolicy
+{
+  protected:
+    int numSets;
+    int assoc;
+
+  public:
+    TLBReplacementPolicy(int num_sets, int _assoc) :
+        numSets(num_sets), assoc(_assoc) {}
+    virtual ~TLBReplacementPolicy() {}
+
+    /// Called when an entry is filled
+    virtual void insert(int set, int way) = 0;
+    /// Called when an entry hits
+    virtual void touch(int set, int way) = 0;
+    /// Called when an entry is invalidated
+    virtual void invalidate(int set, int way) {}
+    /// Choose the way to evict from a full set
+    virtual int getVictim(int set) = 0;
+};
+
+/// True LRU, using a per-entry access stamp
+class LRUTLBPolicy : public TLBReplacementPolicy
+{
+  private:
+    uint64_t accessCount;
+    std::vector<std::vector<uint64_t> > lastAccess;
+
+  public:
+    LRUTLBPolicy(int num_sets, int _assoc);
+    void insert(int set, int way) { touch(set, way); }
+    void touch(int set, int way) { lastAccess[set][way] = ++accessCount; }
+    void invalidate(int set, int way) { lastAccess[set][way] = 0; }
+    int getVictim(int set);
+};
+
+/// Tree pseudo-LRU. Each set keeps a binary tree of assoc - 1 bits, each
+/// pointing toward the less recently used half below it.
+class TreePLRUTLBPolicy : public TLBReplacementPolicy
+{
+  private:
+    std::vector<std::vector<bool> > trees;
+
+  public:
+    TreePLRUTLBPolicy(int num_sets, int _assoc);
+    void insert(int set, int way) { touch(set, way); }
+    void touch(int set, int way);
+    int getVictim(int set);
+};
+
+/// Random replacement
+class RandomTLBPolicy : public TLBReplacementPolicy
+{
+  public:
+    RandomTLBPolicy(int num_sets, int _assoc) :
+        TLBReplacementPolicy(num_sets, _assoc) {}
+    void insert(int set, int way) {}
+    void touch(int set, int way) {}
+    int getVictim(int set);
+};
+
+/// Static re-reference interval prediction (SRRIP-HP) with 2-bit
+/// re-reference prediction values. Fills are predicted to be re-referenced
+/// in the long interval and hits promote entries to the near interval, so
+/// entries that are only touched once (e.g. streaming pages) are evicted
+/// before entries with reuse.
+class SRRIPTLBPolicy : public TLBReplacementPolicy
+{
+  private:
+    static const uint8_t MaxRRPV = 3;
+    std::vector<std::vector<uint8_t> > rrpv;
+
+  public:
+    SRRIPTLBPolicy(int num_sets, int _assoc);
+    void insert(int set, int way) { rrpv[set][way] = MaxRRPV - 1; }
+    void touch(int set, int way) { rrpv[set][way] = 0; }
+    void invalidate(int set, int way) { rrpv[set][way] = MaxRRPV; }
+    int getVictim(int set);
+};
+
+/// Create a replacement policy by name: lru, tree_plru, random or srrip
+TLBReplacementPolicy *createTLBReplacementPolicy(const std::string &name,
+                                                 int num_sets, int assoc);
+
+#endif // __GPU_TLB_REPLACEMENT_POLICY_HH__